@@ -1,3 +1,10 @@
+import os
+
+if os.environ.get('SOCKETIO_MESSAGE_QUEUE'):
+    # The Redis client behind the message queue needs green sockets
+    import eventlet
+    eventlet.monkey_patch()
+
 from app import create_app, socketio
 
 app = create_app()
@@ -19,7 +19,8 @@ def create_app(config_class=Config):
     db.init_app(app)
     migrate.init_app(app, db)
     jwt.init_app(app)
-    socketio.init_app(app, cors_allowed_origins="*")
+    from app.cluster import socketio_options
+    socketio.init_app(app, cors_allowed_origins="*", **socketio_options(app))
     CORS(app)
 
     # Import models to ensure they are registered with SQLAlchemy
@@ -49,12 +50,26 @@ def create_app(config_class=Config):
     # Import socket events
     from app import events
 
+    from app import activity, chat, authz, blobs, thumbnails
+    activity.init_app(app)
+    chat.init_app(app)
+    authz.init_app(app)
+    thumbnails.init_app(app)
+
+    # CLI commands
+    from app import commands
+    commands.init_app(app)
+
     # Serve uploads
-    from flask import send_from_directory
-    import os
+    from flask import abort
+    from app.downloads import send_stored
     
     @app.route('/uploads/<path:filename>')
     def uploaded_file(filename):
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+        # Team files (blobs, thumbnails, partial uploads) only go out
+        # through /api/files after a membership or signature check
+        if filename.split('/', 1)[0] in ('blobs', 'thumbs', '.partial'):
+            abort(404)
+        return send_stored(filename)
 
     return app
@@ -0,0 +1,99 @@
+import atexit
+import threading
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.models import TaskActivity
+from app import db, socketio
+
+# Task activity recorder.
+#
+# By default activity rows are added to the caller's session and commit
+# with the change they describe. With ACTIVITY_BUFFER_ENABLED they are
+# instead collected per transaction, handed to an in-process buffer once
+# that transaction commits (and dropped if it rolls back), and written as
+# one bulk INSERT by a background worker every ACTIVITY_FLUSH_INTERVAL_MS,
+# or straight away once ACTIVITY_FLUSH_ROWS rows are waiting. Rows still
+# buffered at exit are flushed by an atexit hook; a hard crash can lose
+# at most one interval's worth.
+
+class ActivityBuffer:
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.rows = []
+        self.lock = threading.Lock()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('ACTIVITY_BUFFER_ENABLED', False)
+        if not self.enabled:
+            return
+        self.app = app
+        self.interval = app.config.get('ACTIVITY_FLUSH_INTERVAL_MS', 200) / 1000
+        self.max_rows = app.config.get('ACTIVITY_FLUSH_ROWS', 500)
+        socketio.start_background_task(self._run)
+        atexit.register(self.flush)
+
+    def add(self, rows):
+        with self.lock:
+            self.rows.extend(rows)
+            full = len(self.rows) >= self.max_rows
+        if full:
+            # Size-triggered flushes run in the committing request; the
+            # worker only handles the time-based ones.
+            self.flush()
+
+    def _run(self):
+        # socketio.sleep yields to the eventlet hub instead of blocking it
+        while True:
+            socketio.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            rows, self.rows = self.rows, []
+        if not rows:
+            return 0
+        with self.app.app_context():
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(TaskActivity.__table__.insert(), rows)
+            except Exception:
+                # One bad row (e.g. its task was deleted meanwhile) must not
+                # take the whole batch with it.
+                self.app.logger.exception('Bulk activity flush failed, retrying row by row')
+                for row in rows:
+                    try:
+                        with db.engine.begin() as conn:
+                            conn.execute(TaskActivity.__table__.insert(), row)
+                    except Exception:
+                        self.app.logger.warning('Dropped activity row %r', row)
+        return len(rows)
+
+buffer = ActivityBuffer()
+
+def record(task_id, user_id, action, detail=None):
+    """Record an activity as part of the current transaction."""
+    if not buffer.enabled:
+        db.session.add(TaskActivity(task_id=task_id, user_id=user_id, action=action, detail=detail))
+        return
+    db.session.info.setdefault('pending_activities', []).append({
+        'task_id': task_id,
+        'user_id': user_id,
+        'action': action,
+        'detail': detail,
+        'created_at': datetime.utcnow()
+    })
+
+@event.listens_for(Session, 'after_commit')
+def _release_activities(session):
+    rows = session.info.pop('pending_activities', None)
+    if rows:
+        buffer.add(rows)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_activities(session):
+    session.info.pop('pending_activities', None)
+
+def init_app(app):
+    buffer.init_app(app)
@@ -0,0 +1,127 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import g, abort, has_app_context
+from sqlalchemy import and_
+from app.models import Task, Project, TeamMember
+from app import db
+
+# Team membership checks for HTTP routes.
+#
+# A lookup is memoised for the rest of the request in flask.g, and
+# confirmed memberships are also kept in a small per-process LRU for
+# MEMBERSHIP_CACHE_TTL seconds, so most requests need no membership query
+# at all. Only positive answers are shared between requests: someone who
+# just joined on another worker must not be refused until an entry
+# expires. Ending a membership goes through forget(), which
+# socket_sessions.drop_membership calls on every worker; that relay needs
+# SOCKETIO_MESSAGE_QUEUE, so without one other workers may keep admitting
+# a former member for up to MEMBERSHIP_CACHE_TTL seconds. Task and project
+# routes resolve the row and its team's membership in one joined query;
+# tasks carry their team_id, so that join is a single index lookup.
+
+class MembershipCache:
+    def __init__(self, ttl=30, size=10000):
+        self.ttl = ttl
+        self.size = size
+        self.entries = OrderedDict()   # (team_id, user_id) -> expiry
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            expires = self.entries.get(key)
+            if expires is None:
+                return False
+            if expires < time.monotonic():
+                del self.entries[key]
+                return False
+            self.entries.move_to_end(key)
+            return True
+
+    def add(self, key):
+        if self.ttl <= 0:
+            return
+        with self.lock:
+            self.entries[key] = time.monotonic() + self.ttl
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def forget(self, team_id, user_id=None):
+        with self.lock:
+            if user_id is not None:
+                self.entries.pop((team_id, user_id), None)
+                return
+            for key in [key for key in self.entries if key[0] == team_id]:
+                del self.entries[key]
+
+cache = MembershipCache()
+
+def _memo():
+    if 'memberships' not in g:
+        g.memberships = {}
+    return g.memberships
+
+def _remember(team_id, user_id, member):
+    key = (team_id, user_id)
+    _memo()[key] = member
+    if member:
+        cache.add(key)
+
+def is_member(team_id, user_id):
+    """Whether `user_id` belongs to `team_id`."""
+    try:
+        key = (int(team_id), int(user_id))
+    except (TypeError, ValueError):
+        return False
+    memo = _memo()
+    if key in memo:
+        return memo[key]
+    if cache.get(key):
+        memo[key] = True
+        return True
+    member = db.session.query(TeamMember.id).filter_by(team_id=key[0], user_id=key[1]).first() is not None
+    _remember(*key, member)
+    return member
+
+def _membership(team_column, user_id):
+    return and_(TeamMember.team_id == team_column, TeamMember.user_id == int(user_id))
+
+def load_task(task_id, user_id):
+    """(task, allowed) in one query; aborts with 404 if the task is missing."""
+    row = db.session.query(Task, TeamMember.id)\
+        .outerjoin(TeamMember, _membership(Task.team_id, user_id))\
+        .filter(Task.id == task_id)\
+        .first()
+    if row is None:
+        abort(404)
+    task, member_id = row
+    _remember(task.team_id, int(user_id), member_id is not None)
+    return task, member_id is not None
+
+def task_team_id(task_id):
+    return db.session.query(Task.team_id).filter(Task.id == task_id).scalar()
+
+def load_project(project_id, user_id):
+    """(project, allowed) in one query; aborts with 404 if the project is missing."""
+    row = db.session.query(Project, TeamMember.id)\
+        .outerjoin(TeamMember, _membership(Project.team_id, user_id))\
+        .filter(Project.id == project_id)\
+        .first()
+    if row is None:
+        abort(404)
+    project, member_id = row
+    _remember(project.team_id, int(user_id), member_id is not None)
+    return project, member_id is not None
+
+def forget(team_id, user_id=None):
+    """Drop cached membership of `user_id` (or everyone) in `team_id`."""
+    cache.forget(team_id, user_id)
+    if has_app_context():
+        memo = _memo()
+        for key in [key for key in memo if key[0] == team_id and (user_id is None or key[1] == user_id)]:
+            del memo[key]
+
+def init_app(app):
+    cache.ttl = app.config.get('MEMBERSHIP_CACHE_TTL', 30)
+    cache.size = app.config.get('MEMBERSHIP_CACHE_SIZE', 10000)
@@ -0,0 +1,145 @@
+import os
+import threading
+from contextlib import contextmanager
+from flask import current_app
+from sqlalchemy import event, select, update, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session
+from app.models import File, FileBlob
+from app import db
+
+try:
+    import fcntl
+except ImportError: # Windows: placing and unlinking are only serialised within a process
+    fcntl = None
+
+# Content-addressed file storage.
+#
+# Uploaded bytes live once per sha256 under UPLOAD_FOLDER/blobs/ab/<sha256>
+# and every File row holding that content points at the same FileBlob,
+# which counts its references. Storing content that already exists only
+# bumps the count and drops the freshly written temp file. Deleting a
+# File (directly or through a cascade) releases its reference; the blob
+# row goes with the last one.
+#
+# The disk only follows the database once a transaction has committed:
+# new bytes are moved into place then (a rollback leaves no orphan blob
+# file), and released ones are unlinked then. Both happen under one lock,
+# and an unlink first checks again that no committed row uses the path,
+# so it never removes bytes that a concurrent store has just put back.
+# These after_commit hooks are registered before app.thumbnails', so the
+# bytes are in place before any thumbnail job is sent.
+
+_lock = threading.Lock()
+
+def blob_path(sha256):
+    return f'blobs/{sha256[:2]}/{sha256}'
+
+def full_path(path):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], path)
+
+@contextmanager
+def _disk_lock():
+    folder = full_path('blobs')
+    os.makedirs(folder, exist_ok=True)
+    with _lock, open(os.path.join(folder, '.lock'), 'a') as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+def _place(temp_path, path, keep_on_rollback):
+    # Moved into place once the transaction commits
+    db.session.info.setdefault('placed_blobs', []).append((temp_path, path, keep_on_rollback))
+
+def acquire(sha256):
+    """Add a reference to the blob holding `sha256`, if there is one."""
+    bumped = db.session.execute(
+        update(FileBlob).where(FileBlob.sha256 == sha256).values(ref_count=FileBlob.ref_count + 1)
+    ).rowcount
+    return FileBlob.query.filter_by(sha256=sha256).first() if bumped else None
+
+def store(temp_path, sha256, size, keep_on_rollback=False):
+    """Take over `temp_path` and return its blob with one more reference.
+
+    The temp file is moved into place (or dropped, if the bytes are
+    already there) when the transaction commits. On rollback it is
+    removed, unless `keep_on_rollback` says the caller still owns it.
+    """
+    blob = acquire(sha256)
+    if blob:
+        _place(temp_path, blob.path, keep_on_rollback)
+        return blob
+
+    path = blob_path(sha256)
+    _place(temp_path, path, keep_on_rollback)
+    try:
+        with db.session.begin_nested():
+            blob = FileBlob(sha256=sha256, size=size, path=path, ref_count=1)
+            db.session.add(blob)
+    except IntegrityError:
+        # Stored concurrently by another request; the bytes are identical
+        return acquire(sha256)
+    return blob
+
+def reuse(sha256, size, team_id):
+    """Reference existing content without receiving it again.
+
+    Only content the team already holds qualifies, so knowing a hash is
+    not enough to obtain another team's file.
+    """
+    held = db.session.query(File.id).join(FileBlob, File.blob_id == FileBlob.id)\
+        .filter(FileBlob.sha256 == sha256.lower(), FileBlob.size == size, File.team_id == team_id)\
+        .first()
+    return acquire(sha256.lower()) if held else None
+
+@event.listens_for(File, 'after_delete')
+def _release(mapper, connection, target):
+    if target.blob_id is None:
+        return
+    blobs = FileBlob.__table__
+    connection.execute(update(blobs).where(blobs.c.id == target.blob_id).values(ref_count=blobs.c.ref_count - 1))
+    gone = connection.execute(delete(blobs).where(blobs.c.id == target.blob_id, blobs.c.ref_count <= 0)).rowcount
+    if gone:
+        session = object_session(target) or db.session
+        session.info.setdefault('released_blobs', []).append(target.filepath)
+
+def _in_use(conn, path):
+    return conn.execute(select(FileBlob.id).where(FileBlob.path == path)).first() is not None
+
+@event.listens_for(Session, 'after_commit')
+def _sync_disk(session):
+    if session.in_nested_transaction():
+        return # a savepoint was released; the outer transaction goes on
+    placed = session.info.pop('placed_blobs', None)
+    released = session.info.pop('released_blobs', None)
+    if not placed and not released:
+        return
+    with _disk_lock():
+        for temp_path, path, _ in placed or []:
+            if os.path.exists(full_path(path)):
+                _remove(temp_path)
+            else:
+                # New content, or bytes that went missing from disk
+                os.makedirs(os.path.dirname(full_path(path)), exist_ok=True)
+                os.replace(temp_path, full_path(path))
+        if released:
+            with db.engine.connect() as conn:
+                for path in released:
+                    # The same content may have been stored again meanwhile
+                    if not _in_use(conn, path):
+                        _remove(full_path(path))
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_disk_changes(session, previous_transaction):
+    if previous_transaction.parent is not None:
+        return # a savepoint (store's own, say); the outer transaction goes on
+    for temp_path, _, keep in session.info.pop('placed_blobs', []):
+        if not keep:
+            _remove(temp_path)
+    session.info.pop('released_blobs', None)
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,264 @@
+from datetime import datetime
+from sqlalchemy import or_
+from app.models import Task, TaskLink, TaskParticipant, TaskComment, TaskMessage, TaskActivity, File, Notification, GanttTombstone
+from app.hierarchy import is_descendant, move_subtree, fits_under, MAX_PATH_LENGTH, PathTooLongError
+from app.revisions import bump_revision
+from app.rollup import rebuild_rollups
+from app.services import adjust_unread
+from app import db
+
+# Bulk task operations for plan imports and multi-row Gantt edits. A batch
+# is validated up front, then written with executemany statements in the
+# caller's transaction: one revision bump, one activity insert and one
+# notification insert for the whole batch. Roll-up totals are recomputed
+# for the project in a single pass at the end.
+
+MAX_OPERATIONS = 5000
+OPERATIONS = ('create', 'update', 'reorder', 'delete')
+# Operations are applied a kind at a time in this order, so a batch must
+# list them the same way
+STAGES = {'create': 0, 'update': 1, 'reorder': 1, 'delete': 2}
+UPDATABLE = ('title', 'description', 'status', 'priority', 'progress')
+
+class BulkError(Exception):
+    def __init__(self, index, message):
+        super().__init__(message)
+        self.index = index
+        self.message = message
+
+def _date(value, index):
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise BulkError(index, 'Invalid date')
+
+def _fields(op, index):
+    values = {key: op[key] for key in UPDATABLE if key in op}
+    for key in ('start_date', 'end_date'):
+        if key in op:
+            values[key] = _date(op[key], index)
+    if 'sort_order' in op:
+        values['sort_order'] = op['sort_order']
+    return values
+
+def _is_key(value, *types):
+    # None (absent), an int or one of `types`; bool is an int to Python
+    return value is None or (isinstance(value, (int, *types)) and not isinstance(value, bool))
+
+def _validate(project, operations):
+    if not isinstance(operations, list) or not operations:
+        raise BulkError(None, 'Operations required')
+    if len(operations) > MAX_OPERATIONS:
+        raise BulkError(None, f'At most {MAX_OPERATIONS} operations per request')
+
+    refs = set()
+    referenced = set()
+    stage = 0
+    for index, op in enumerate(operations):
+        if not isinstance(op, dict) or op.get('op') not in OPERATIONS:
+            raise BulkError(index, 'Unknown operation')
+        if STAGES[op['op']] < stage:
+            raise BulkError(index, 'Operations must be ordered: creates, then updates and reorders, then deletes')
+        stage = STAGES[op['op']]
+        for key in ('ref', 'parent_ref'):
+            if not _is_key(op.get(key), str):
+                raise BulkError(index, f'{key} must be a string or integer')
+        for key in ('id', 'parent_id'):
+            if not _is_key(op.get(key)):
+                raise BulkError(index, f'{key} must be an integer')
+        if op['op'] == 'create':
+            if not op.get('title'):
+                raise BulkError(index, 'Title required')
+            if op.get('parent_ref') is not None and op['parent_ref'] not in refs:
+                raise BulkError(index, 'parent_ref must name an earlier create')
+            if op.get('ref') is not None:
+                refs.add(op['ref'])
+            if op.get('parent_id'):
+                referenced.add(op['parent_id'])
+        else:
+            if not op.get('id'):
+                raise BulkError(index, 'Task ID required')
+            referenced.add(op['id'])
+            if op['op'] == 'reorder' and op.get('parent_id'):
+                referenced.add(op['parent_id'])
+
+    # Every existing task the batch touches, in one query
+    tasks = {}
+    if referenced:
+        for task in Task.query.filter(Task.id.in_(referenced), Task.project_id == project.id).all():
+            tasks[task.id] = task
+    for index, op in enumerate(operations):
+        for key in ('id', 'parent_id'):
+            if op.get(key) and op[key] not in tasks:
+                raise BulkError(index, 'Task not found in project')
+    return tasks
+
+def _create(project, user_id, operations, tasks, revision):
+    creates = [(i, op) for i, op in enumerate(operations) if op['op'] == 'create']
+    if not creates:
+        return {}, []
+
+    # Insert in waves by depth so every row knows its parent's id; a
+    # plain import without parent_ref is a single executemany.
+    depth = {}
+    waves = []
+    for index, op in creates:
+        d = depth[op['parent_ref']] + 1 if op.get('parent_ref') is not None else 0
+        if op.get('ref') is not None:
+            depth[op['ref']] = d
+        while len(waves) <= d:
+            waves.append([])
+        waves[d].append((index, op))
+
+    created = {}
+    by_ref = {}
+    ids = []
+    for wave in waves:
+        mappings = []
+        parents = []
+        for index, op in wave:
+            parent = by_ref[op['parent_ref']] if op.get('parent_ref') is not None else tasks.get(op.get('parent_id'))
+            parents.append(parent)
+            mapping = {
+                'project_id': project.id,
+                'team_id': project.team_id,
+                'parent_id': parent['id'] if isinstance(parent, dict) else (parent.id if parent else None),
+                'title': op['title'],
+                'description': op.get('description'),
+                'priority': op.get('priority', 'medium'),
+                'status': op.get('status', 'pending'),
+                'progress': op.get('progress', 0),
+                'start_date': _date(op.get('start_date'), index),
+                'end_date': _date(op.get('end_date'), index),
+                'sort_order': op.get('sort_order', 0),
+                'created_by': user_id,
+                'revision': revision
+            }
+            mappings.append(mapping)
+        db.session.bulk_insert_mappings(Task, mappings)
+
+        # Fresh rows are the only ones at this revision without a path yet;
+        # ids grow in insert order, which lines them up with the wave.
+        new_ids = [row[0] for row in db.session.query(Task.id)
+                   .filter(Task.project_id == project.id, Task.revision == revision, Task.path.is_(None))
+                   .order_by(Task.id).all()]
+        for (index, op), mapping, parent, task_id in zip(wave, mappings, parents, new_ids):
+            mapping['id'] = task_id
+            parent_path = parent['path'] if isinstance(parent, dict) else (parent.path if parent else None)
+            parent_level = parent['level'] if isinstance(parent, dict) else (parent.level if parent else -1)
+            mapping['path'] = f"{parent_path or '/'}{mapping['id']}/"
+            if len(mapping['path']) > MAX_PATH_LENGTH:
+                raise BulkError(index, str(PathTooLongError()))
+            mapping['level'] = parent_level + 1
+            ids.append(mapping['id'])
+            if op.get('ref') is not None:
+                by_ref[op['ref']] = mapping
+                created[op['ref']] = mapping['id']
+
+        db.session.bulk_update_mappings(Task, [{'id': m['id'], 'path': m['path'], 'level': m['level']} for m in mappings])
+
+    db.session.bulk_insert_mappings(TaskParticipant, [{'task_id': i, 'user_id': user_id} for i in ids])
+    return created, ids
+
+def _update(operations, tasks, revision):
+    mappings = []
+    moves = []
+    for index, op in enumerate(operations):
+        if op['op'] not in ('update', 'reorder'):
+            continue
+        values = _fields(op, index) if op['op'] == 'update' else {}
+        if 'sort_order' in op:
+            values['sort_order'] = op['sort_order']
+        if values:
+            values.update(id=op['id'], revision=revision)
+            mappings.append(values)
+        if op['op'] == 'reorder' and 'parent_id' in op and op['parent_id'] != tasks[op['id']].parent_id:
+            moves.append((index, tasks[op['id']], tasks.get(op['parent_id'])))
+
+    if mappings:
+        db.session.bulk_update_mappings(Task, mappings)
+    for index, task, new_parent in moves:
+        if new_parent is not None and is_descendant(task, new_parent):
+            raise BulkError(index, 'Cannot move a task under itself')
+        if not fits_under(task, new_parent):
+            raise BulkError(index, str(PathTooLongError()))
+        move_subtree(task, new_parent)
+        task.revision = revision
+    return [m['id'] for m in mappings] + [t.id for _, t, _ in moves]
+
+def _delete(project, operations, tasks, revision):
+    roots = [tasks[op['id']] for op in operations if op['op'] == 'delete']
+    if not roots:
+        return []
+
+    prefixes = [Task.path.like(f'{t.path}%') for t in roots if t.path]
+    criteria = or_(Task.id.in_([t.id for t in roots]), *prefixes)
+    ids = [row[0] for row in db.session.query(Task.id).filter(Task.project_id == project.id, criteria).all()]
+
+    link_ids = [row[0] for row in db.session.query(TaskLink.id)
+                .filter(or_(TaskLink.source.in_(ids), TaskLink.target.in_(ids))).all()]
+    tombstones = [{'project_id': project.id, 'kind': 'task', 'object_id': i, 'revision': revision} for i in ids]
+    tombstones += [{'project_id': project.id, 'kind': 'link', 'object_id': i, 'revision': revision} for i in link_ids]
+    db.session.execute(GanttTombstone.__table__.insert(), tombstones)
+
+    if link_ids:
+        TaskLink.query.filter(TaskLink.id.in_(link_ids)).delete(synchronize_session=False)
+    for model in (TaskParticipant, TaskComment, TaskMessage, TaskActivity):
+        model.query.filter(model.task_id.in_(ids)).delete(synchronize_session=False)
+    # Attachments go through the ORM so their blob references and
+    # thumbnails are released (see app.blobs and app.thumbnails)
+    for f in File.query.filter(File.task_id.in_(ids)).all():
+        db.session.delete(f)
+    db.session.flush()
+    # Detach parents first so the delete never trips the self-referencing FK
+    Task.query.filter(Task.id.in_(ids)).update({Task.parent_id: None}, synchronize_session=False)
+    Task.query.filter(Task.id.in_(ids)).delete(synchronize_session=False)
+    return ids
+
+def apply_bulk(project, user_id, operations):
+    """Validate and apply a batch of task operations; the caller commits.
+
+    Operations run grouped by kind, not one by one: all creates, then
+    updates and reorders, then deletes. A batch that lists them in any
+    other order is rejected.
+    """
+    tasks = _validate(project, operations)
+    revision = bump_revision(project.id)
+
+    created, created_ids = _create(project, user_id, operations, tasks, revision)
+    updated_ids = _update(operations, tasks, revision)
+    deleted_ids = _delete(project, operations, tasks, revision)
+    db.session.flush()
+    db.session.expire_all()
+    rebuild_rollups(project.id, revision)
+
+    # One activity insert and one notification insert for the whole batch
+    deleted = set(deleted_ids)
+    activities = [{'task_id': i, 'user_id': user_id, 'action': 'created_task'} for i in created_ids]
+    activities += [{'task_id': i, 'user_id': user_id, 'action': 'updated_task'}
+                   for i in dict.fromkeys(updated_ids) if i not in deleted]
+    if activities:
+        db.session.execute(TaskActivity.__table__.insert(), activities)
+
+    touched = [i for i in dict.fromkeys(updated_ids) if i not in deleted]
+    if touched:
+        recipients = {row[0] for row in db.session.query(TaskParticipant.user_id)
+                      .filter(TaskParticipant.task_id.in_(touched)).distinct().all()}
+        recipients.discard(int(user_id))
+        content = f'项目 "{project.name}" 中有 {len(touched)} 个任务已更新'
+        # About the project, not one task, so it never merges with task_update rows
+        notifications = [{'user_id': uid, 'type': 'project_update', 'content': content, 'related_id': project.id}
+                         for uid in recipients]
+        if notifications:
+            db.session.execute(Notification.__table__.insert(), notifications)
+            db.session.execute(adjust_unread(list(recipients), 1))
+
+    return {
+        'created': created,
+        'created_ids': created_ids,
+        'updated': len(touched),
+        'deleted': len(deleted_ids),
+        'revision': revision
+    }
@@ -0,0 +1,189 @@
+import atexit
+import threading
+from datetime import datetime
+from sqlalchemy import select, update, insert, func, and_, or_, not_
+from sqlalchemy.exc import IntegrityError
+from app.models import TeamMessage, TeamMember, IdSequence
+from app import db, socketio
+
+# Team chat ingest.
+#
+# Message ids come from blocks reserved in id_sequences (one UPDATE per
+# CHAT_ID_BLOCK messages), so a message has its final id and timestamp
+# before it is written and can be broadcast straight away. Ids only grow
+# within a process, so (created_at, id) orders each team's history in
+# the order messages were accepted.
+#
+# With CHAT_PIPELINE_ENABLED the INSERTs are queued and group-committed
+# by a background worker every CHAT_FLUSH_INTERVAL_MS. The queue holds at
+# most CHAT_QUEUE_SIZE messages: when it is full the sender flushes it
+# inline, and if that fails too the message is rejected instead of being
+# broadcast. A failed batch goes back to the front of the queue. Anything
+# still queued at exit is written by an atexit hook.
+
+class IdAllocator:
+    def __init__(self, name, model):
+        self.name = name
+        self.model = model
+        self.block = 1000
+        self.next = self.end = 0
+        self.lock = threading.Lock()
+
+    def next_id(self):
+        with self.lock:
+            if self.next >= self.end:
+                self._reserve()
+            id = self.next
+            self.next += 1
+            return id
+
+    def _reserve(self):
+        # Own transaction, so a block is never handed out twice even if the
+        # caller's transaction rolls back.
+        table = IdSequence.__table__
+        with db.engine.begin() as conn:
+            bumped = conn.execute(
+                update(table).where(table.c.name == self.name)
+                .values(next_value=table.c.next_value + self.block)
+            ).rowcount
+            if not bumped:
+                start = conn.execute(select(func.coalesce(func.max(self.model.id), 0) + 1)).scalar()
+                try:
+                    with conn.begin_nested():
+                        conn.execute(insert(table).values(name=self.name, next_value=start + self.block))
+                except IntegrityError:
+                    # Another process created the row first
+                    conn.execute(update(table).where(table.c.name == self.name)
+                                 .values(next_value=table.c.next_value + self.block))
+            end = conn.execute(select(table.c.next_value).where(table.c.name == self.name)).scalar()
+        self.next, self.end = end - self.block, end
+
+class ChatPipeline:
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self.rows = []
+        self.lock = threading.Lock()
+        self.ids = IdAllocator('team_messages', TeamMessage)
+
+    def init_app(self, app):
+        self.ids.block = app.config.get('CHAT_ID_BLOCK', 1000)
+        self.enabled = app.config.get('CHAT_PIPELINE_ENABLED', False)
+        if not self.enabled:
+            return
+        self.app = app
+        self.interval = app.config.get('CHAT_FLUSH_INTERVAL_MS', 5) / 1000
+        self.max_rows = app.config.get('CHAT_QUEUE_SIZE', 10000)
+        socketio.start_background_task(self._run)
+        atexit.register(self.flush)
+
+    def submit(self, team_id, user_id, content):
+        """Accept a message and return its row, or None if it was rejected."""
+        with self.lock:
+            row = {
+                'id': self.ids.next_id(),
+                'team_id': team_id,
+                'user_id': user_id,
+                'content': content,
+                'created_at': datetime.utcnow()
+            }
+            if not self.enabled:
+                db.session.execute(insert(TeamMessage.__table__), row)
+                db.session.commit()
+                return row
+            full = len(self.rows) >= self.max_rows
+            if not full:
+                self.rows.append(row)
+                return row
+        if self.flush() is None:
+            return None
+        with self.lock:
+            self.rows.append(row)
+        return row
+
+    def _run(self):
+        # socketio.sleep yields to the eventlet hub instead of blocking it
+        while True:
+            socketio.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        """Write everything queued in one transaction; None if it failed."""
+        with self.lock:
+            rows, self.rows = self.rows, []
+        if not rows:
+            return 0
+        try:
+            with self.app.app_context():
+                with db.engine.begin() as conn:
+                    conn.execute(insert(TeamMessage.__table__), rows)
+        except Exception:
+            self.app.logger.exception('Chat flush of %d messages failed, will retry', len(rows))
+            with self.lock:
+                self.rows[:0] = rows
+            return None
+        return len(rows)
+
+pipeline = ChatPipeline()
+
+def init_app(app):
+    pipeline.init_app(app)
+
+# Read pointers. Each membership remembers the last message read as
+# (last_read_at, last_read_message_id); messages after that position, by
+# other members, are unread. Pointers only move forward, with a single
+# conditional UPDATE, so HTTP and Socket.IO can both report reads in any
+# order.
+
+EPOCH = datetime(1970, 1, 1)
+
+def _message_position(team_id, message_id=None):
+    query = db.session.query(TeamMessage.id, TeamMessage.created_at).filter(TeamMessage.team_id == team_id)
+    if message_id is None:
+        return query.order_by(TeamMessage.created_at.desc(), TeamMessage.id.desc()).first()
+    return query.filter(TeamMessage.id == message_id).first()
+
+def latest_message(team_id):
+    return _message_position(team_id)
+
+def mark_read(team_id, user_id, message_id=None):
+    """Advance the member's read pointer to `message_id` (default: the
+    latest message). Returns the message's (id, created_at), or None if it
+    doesn't exist in this team."""
+    target = _message_position(team_id, message_id)
+    if target is None and message_id is not None and pipeline.enabled:
+        # It may have been broadcast but not written yet
+        pipeline.flush()
+        target = _message_position(team_id, message_id)
+    if target is None:
+        return None
+
+    TeamMember.query.filter(
+        TeamMember.team_id == team_id,
+        TeamMember.user_id == user_id,
+        or_(TeamMember.last_read_at.is_(None),
+            TeamMember.last_read_at < target.created_at,
+            and_(TeamMember.last_read_at == target.created_at, TeamMember.last_read_message_id < target.id))
+    ).update({'last_read_message_id': target.id, 'last_read_at': target.created_at}, synchronize_session=False)
+    return target
+
+def unread_counts(user_id):
+    """Unread message counts for every team of `user_id`, in one query.
+
+    Each team is a range scan of ix_team_messages_team_created starting at
+    the member's read position.
+    """
+    read_at = func.coalesce(TeamMember.last_read_at, EPOCH)
+    read_id = func.coalesce(TeamMember.last_read_message_id, 0)
+    rows = db.session.query(TeamMember.team_id, TeamMember.last_read_message_id, func.count(TeamMessage.id))\
+        .outerjoin(TeamMessage, and_(
+            TeamMessage.team_id == TeamMember.team_id,
+            TeamMessage.created_at >= read_at,
+            not_(and_(TeamMessage.created_at == read_at, TeamMessage.id <= read_id)),
+            TeamMessage.user_id != TeamMember.user_id
+        ))\
+        .filter(TeamMember.user_id == user_id)\
+        .group_by(TeamMember.team_id, TeamMember.last_read_message_id)\
+        .all()
+    return [{'team_id': team_id, 'last_read_message_id': last_read, 'unread_count': count}
+            for team_id, last_read, count in rows]
@@ -0,0 +1,31 @@
+import socketio as socketio_lib
+
+# Cross-process Socket.IO.
+#
+# With SOCKETIO_MESSAGE_QUEUE set to a redis:// URL (a real Redis or the
+# stand-in from `flask pubsub-server`), emits and room changes made by any
+# worker, including from HTTP routes, are relayed to every other worker.
+# Each worker also keeps its own membership cache (app.socket_sessions);
+# revoking a membership closes a well-known room, and every worker drops
+# its cached entries when it sees that room being closed.
+
+class ClusterRedisManager(socketio_lib.RedisManager):
+    def _handle_close_room(self, message):
+        super()._handle_close_room(message)
+        from app.socket_sessions import room_closed
+        room_closed(message['room'])
+
+def socketio_options(app):
+    url = app.config.get('SOCKETIO_MESSAGE_QUEUE')
+    if not url:
+        return {}
+    channel = app.config.get('SOCKETIO_CHANNEL', 'collabu')
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        # Publishes share one connection. With a pool, a burst of emits opens
+        # a connection per waiting greenlet until redis-py refuses more, and
+        # the manager's reconnect then drops the subscriber for a second.
+        manager = ClusterRedisManager(url, channel=channel, redis_options={'single_connection_client': True})
+        return {'client_manager': manager}
+    # Other queues Flask-SocketIO supports (kafka://, zmq, kombu URLs) work
+    # for emits and rooms, but don't relay membership revocation.
+    return {'message_queue': url, 'channel': channel}
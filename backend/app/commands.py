@@ -0,0 +1,70 @@
+import click
+from app import db
+
+def init_app(app):
+    @app.cli.command('repair-rollups')
+    @click.option('--project-id', type=int, default=None, help='Only rebuild one project.')
+    def repair_rollups(project_id):
+        """Recompute task/project progress roll-ups from scratch."""
+        from app.rollup import rebuild_rollups
+        count = rebuild_rollups(project_id)
+        db.session.commit()
+        click.echo(f'Rebuilt roll-ups for {count} tasks')
+
+    @app.cli.command('repair-unread-counts')
+    def repair_unread_counts():
+        """Recount every user's unread notifications."""
+        from app.services import rebuild_unread_counts
+        count = rebuild_unread_counts()
+        db.session.commit()
+        click.echo(f'Recounted unread notifications for {count} users')
+
+    @app.cli.command('backfill-task-teams')
+    @click.option('--batch-size', type=int, default=1000, help='Rows per transaction.')
+    def backfill_task_teams(batch_size):
+        """Copy each task's team_id from its project where it is still missing."""
+        from app.services import backfill_task_teams
+        count = backfill_task_teams(batch_size)
+        click.echo(f'Filled team_id for {count} tasks')
+
+    @app.cli.command('compact-notifications')
+    @click.option('--days', type=int, default=None, help='Keep read notifications this many days (default NOTIFICATION_RETENTION_DAYS).')
+    @click.option('--batch-size', type=int, default=None, help='Rows per transaction (default NOTIFICATION_PURGE_BATCH).')
+    @click.option('--archive', is_flag=True, help='Copy purged rows to notifications_archive instead of dropping them.')
+    def compact_notifications(days, batch_size, archive):
+        """Coalesce repeated task notifications and purge old read ones."""
+        from app.models import Notification
+        from app.retention import coalesce, purge_read
+        days = days if days is not None else app.config['NOTIFICATION_RETENTION_DAYS']
+        batch_size = batch_size or app.config['NOTIFICATION_PURGE_BATCH']
+        before = Notification.query.count()
+        merged = coalesce(batch_size)
+        purged = purge_read(days, batch_size, archive)
+        after = Notification.query.count()
+        click.echo(f'Coalesced {merged} and {"archived" if archive else "deleted"} {purged} notifications '
+                   f'({before} -> {after} rows)')
+
+    @app.cli.command('purge-uploads')
+    @click.option('--hours', type=int, default=None, help='Idle time before an upload is dropped (default UPLOAD_SESSION_HOURS).')
+    def purge_uploads(hours):
+        """Delete chunked uploads that were never completed."""
+        from app.uploads import purge_stale
+        count = purge_stale(hours if hours is not None else app.config['UPLOAD_SESSION_HOURS'])
+        click.echo(f'Dropped {count} stale uploads')
+
+    @app.cli.command('prune-tombstones')
+    @click.option('--days', type=int, default=None, help='Keep gantt tombstones this many days (default GANTT_TOMBSTONE_DAYS).')
+    def prune_tombstones(days):
+        """Drop old gantt deletion records; older ?since= syncs get the full payload."""
+        from app.revisions import prune_tombstones
+        count = prune_tombstones(days if days is not None else app.config['GANTT_TOMBSTONE_DAYS'])
+        click.echo(f'Dropped {count} gantt tombstones')
+
+    @app.cli.command('pubsub-server')
+    @click.option('--host', default='127.0.0.1')
+    @click.option('--port', type=int, default=6379)
+    def pubsub_server(host, port):
+        """Run a minimal Redis-protocol pub/sub server for local multi-worker setups."""
+        from app.pubsub_server import serve
+        click.echo(f'Pub/sub stand-in listening on {host}:{port}')
+        serve(host, port)
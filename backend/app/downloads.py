@@ -0,0 +1,146 @@
+import hashlib
+import hmac
+import os
+import time
+import uuid
+from urllib.parse import quote
+from flask import current_app, request, send_from_directory, url_for
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.utils import send_from_directory as send_with_header
+
+# Serving stored files.
+#
+# Stored content never changes: a File keeps its bytes for the life of its
+# uid and blob paths are named after their sha256. Responses therefore
+# carry a strong ETag from the content hash and may be cached for good, a
+# repeat view with If-None-Match gets an empty 304, and Range requests are
+# answered from disk. Werkzeug handles single ranges; requests for several
+# at once (PDF viewers send these) are answered here as
+# multipart/byteranges instead of failing with 416.
+#
+# Authenticated downloads redirect to a signed URL: an HMAC over the
+# file's uid, name and expiry. The URL names the uid, never the storage
+# path, so it grants nothing once it expires; blobs and thumbnails are not
+# served anywhere without a check. Being team content, responses may only
+# be cached privately. When a front proxy is configured the worker only
+# answers with X-Accel-Redirect / X-Sendfile and the proxy streams the
+# bytes (and handles Range itself).
+
+IMMUTABLE = 365 * 24 * 3600
+MAX_RANGES = 16
+BLOCK = 64 * 1024
+SIGNED_PARAMS = ('name', 'v', 'inline', 'expires')
+
+def _signature(uid, params):
+    message = '\n'.join([uid] + [f'{key}={params[key]}' for key in SIGNED_PARAMS if key in params])
+    key = current_app.config['DOWNLOAD_SIGNING_KEY'].encode()
+    return hmac.new(key, message.encode(), hashlib.sha256).hexdigest()
+
+def signed_url(file, inline=False):
+    """Returns (url, expires) for downloading `file` without credentials."""
+    ttl = current_app.config['DOWNLOAD_URL_TTL']
+    # Rounded up to the next window, so repeat views within one window get
+    # the same URL and the browser cache keeps working
+    expires = (int(time.time()) // ttl + 2) * ttl
+    params = {'name': file.filename, 'v': file.checksum or file.uid, 'expires': expires}
+    if inline:
+        params['inline'] = 1
+    params['sig'] = _signature(file.uid, params)
+    return url_for('files.download_signed', uid=file.uid, **params), expires
+
+def check_signature(uid, args):
+    """True if `args` carry an unexpired signature for `uid`."""
+    params = {key: args[key] for key in SIGNED_PARAMS if key in args}
+    try:
+        if int(params.get('expires', '')) < time.time():
+            return False
+    except ValueError:
+        return False
+    return hmac.compare_digest(_signature(uid, params), args.get('sig', ''))
+
+def send_stored(path, etag=None, **kwargs):
+    """send_from_directory for stored content; `etag` marks it immutable."""
+    folder = current_app.config['UPLOAD_FOLDER']
+    accel = current_app.config.get('X_ACCEL_REDIRECT_PREFIX')
+    offload = bool(accel) or current_app.config['USE_X_SENDFILE']
+    ranges = request.range
+    multi = not offload and ranges is not None and len(ranges.ranges) > 1
+    if etag and request.if_none_match.contains_weak(etag):
+        # Revalidating a copy of immutable content: no need to touch the disk
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+    elif accel:
+        response = send_with_header(folder, path, request.environ, use_x_sendfile=True, etag=etag or True,
+                                    conditional=False, response_class=current_app.response_class, **kwargs)
+        del response.headers['X-Sendfile']
+        del response.headers['Content-Length']
+        response.headers['X-Accel-Redirect'] = f"{accel.rstrip('/')}/{quote(path)}"
+    else:
+        # USE_X_SENDFILE is applied by Flask; the proxy then answers conditionals
+        response = send_from_directory(folder, path, etag=etag or True,
+                                       conditional=not offload and not multi, **kwargs)
+    if etag:
+        response.cache_control.no_cache = None
+        response.cache_control.max_age = IMMUTABLE
+        response.cache_control.immutable = True
+        # Team files: only the user's own browser may keep them
+        response.cache_control.private = True
+    if multi and response.status_code != 304:
+        # Let werkzeug settle If-None-Match / If-Match as for a plain GET
+        environ = {k: v for k, v in request.environ.items() if k != 'HTTP_RANGE'}
+        response.make_conditional(environ, accept_ranges=True, complete_length=response.content_length)
+        if response.status_code == 200 and _if_range_holds(response):
+            response = _multipart(response, path, ranges)
+    return response
+
+def _if_range_holds(response):
+    if_range = request.if_range
+    if if_range.etag:
+        return if_range.etag == response.get_etag()[0] and not response.get_etag()[1]
+    if if_range.date:
+        return bool(response.last_modified and response.last_modified <= if_range.date)
+    return True
+
+def _multipart(response, path, ranges):
+    full = os.path.join(current_app.config['UPLOAD_FOLDER'], path)
+    size = os.path.getsize(full)
+    parts = []
+    for start, stop in ranges.ranges[:MAX_RANGES]:
+        if start < 0:
+            start, stop = max(size + start, 0), size
+        stop = size if stop is None else min(stop, size)
+        if start < stop:
+            parts.append((start, stop))
+    if not parts:
+        response.close()
+        raise RequestedRangeNotSatisfiable(length=size)
+
+    # Keep every other header of the full response; only the body changes
+    response.close()
+    mimetype = response.mimetype or 'application/octet-stream'
+    boundary = uuid.uuid4().hex
+    heads = [f'--{boundary}\r\nContent-Type: {mimetype}\r\nContent-Range: bytes {start}-{stop - 1}/{size}\r\n\r\n'.encode()
+             for start, stop in parts]
+    tail = f'--{boundary}--\r\n'.encode()
+
+    def generate():
+        with open(full, 'rb') as f:
+            for head, (start, stop) in zip(heads, parts):
+                yield head
+                f.seek(start)
+                remaining = stop - start
+                while remaining:
+                    block = f.read(min(BLOCK, remaining))
+                    if not block:
+                        return
+                    remaining -= len(block)
+                    yield block
+                yield b'\r\n'
+            yield tail
+
+    response.response = generate()
+    response.status_code = 206
+    response.content_type = f'multipart/byteranges; boundary={boundary}'
+    response.content_length = sum(len(h) + (stop - start) + 2 for h, (start, stop) in zip(heads, parts)) + len(tail)
+    response.direct_passthrough = False
+    return response
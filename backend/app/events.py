@@ -1,30 +1,48 @@
+from flask import request
 from flask_socketio import emit, join_room, leave_room, disconnect
-from flask_jwt_extended import decode_token
-from app import socketio, db
-from app.models import TeamMessage, User, TeamMember
-from datetime import datetime
+from app import socketio
+from app import db
+from app.chat import pipeline, mark_read
+from app.socket_sessions import authenticate, current_user, is_member, forget_team, end_session
 
-# Helper to verify token from handshake
-def get_user_from_token(token):
+def _token_from_handshake(auth):
+    if isinstance(auth, dict) and auth.get('token'):
+        return auth['token']
+    if request.args.get('token'):
+        return request.args['token']
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        return header[7:]
+    return None
+
+def _team_id(data):
     try:
-        decoded = decode_token(token)
-        user_id = decoded['sub']
-        return User.query.get(user_id)
-    except Exception as e:
+        return int(data.get('team_id'))
+    except (TypeError, ValueError):
         return None
 
+@socketio.on('connect')
+def on_connect(auth=None):
+    # Clients that still send the token with every event are authenticated
+    # on their first event instead, so an anonymous connect is allowed.
+    token = _token_from_handshake(auth)
+    if token:
+        authenticate(request.sid, token)
+
+@socketio.on('disconnect')
+def on_disconnect(*args):
+    end_session(request.sid)
+
 @socketio.on('team:join')
 def on_join(data):
-    token = data.get('token')
-    team_id = data.get('team_id')
+    team_id = _team_id(data)
     
-    user = get_user_from_token(token)
+    user = current_user(request.sid, data.get('token'))
     if not user:
         return emit('error', {'message': 'Authentication failed'})
         
     # Check access
-    member = TeamMember.query.filter_by(team_id=team_id, user_id=user.id).first()
-    if not member:
+    if not is_member(request.sid, team_id):
         return emit('error', {'message': 'Access denied'})
     
     room = f'team_{team_id}'
@@ -33,48 +51,60 @@ def on_join(data):
 
 @socketio.on('team:leave')
 def on_leave(data):
-    token = data.get('token')
-    team_id = data.get('team_id')
+    team_id = _team_id(data)
     
-    user = get_user_from_token(token)
+    user = current_user(request.sid, data.get('token'))
     if not user:
         return
         
+    forget_team(request.sid, team_id)
     room = f'team_{team_id}'
     leave_room(room)
     # emit('team:update', {'type': 'leave', 'user': user.username, 'content': f'{user.username} left the chat'}, room=room)
 
 @socketio.on('team:message')
 def on_message(data):
-    token = data.get('token')
-    team_id = data.get('team_id')
+    team_id = _team_id(data)
     content = data.get('content')
     
-    user = get_user_from_token(token)
+    user = current_user(request.sid, data.get('token'))
     if not user:
         return emit('error', {'message': 'Authentication failed'})
         
     if not content:
         return
         
-    # Check access
-    member = TeamMember.query.filter_by(team_id=team_id, user_id=user.id).first()
-    if not member:
+    # Check access (cached after the first check for this socket)
+    if not is_member(request.sid, team_id):
         return emit('error', {'message': 'Access denied'})
 
-    # Save message
-    message = TeamMessage(team_id=team_id, user_id=user.id, content=content)
-    db.session.add(message)
-    db.session.commit()
+    # Ids and timestamps are assigned up front, so the message is broadcast
+    # without waiting for it to be written (see app.chat)
+    message = pipeline.submit(team_id, user['id'], content)
+    if not message:
+        return emit('error', {'message': 'Message could not be saved, please retry'})
+    payload = {
+        'id': message['id'],
+        'user_id': user['id'],
+        'username': user['username'],
+        'nickname': user['nickname'],
+        'avatar': user['avatar'],
+        'content': content,
+        'created_at': message['created_at'].isoformat()
+    }
     
     # Broadcast
     room = f'team_{team_id}'
-    emit('team:message', {
-        'id': message.id,
-        'user_id': user.id,
-        'username': user.username,
-        'nickname': user.nickname,
-        'avatar': user.avatar,
-        'content': message.content,
-        'created_at': message.created_at.isoformat()
-    }, room=room)
+    emit('team:message', payload, room=room)
+
+@socketio.on('team:read')
+def on_read(data):
+    team_id = _team_id(data)
+    
+    user = current_user(request.sid, data.get('token'))
+    if not user or not is_member(request.sid, team_id):
+        return {'ok': False}
+        
+    target = mark_read(team_id, user['id'], data.get('message_id'))
+    db.session.commit()
+    return {'ok': bool(target), 'last_read_message_id': target.id if target else None}
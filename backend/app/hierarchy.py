@@ -0,0 +1,78 @@
+from sqlalchemy import func, literal, String
+from app.models import Task
+from app import db
+
+# Task hierarchy helpers built on the materialized `Task.path` column.
+# Every path is the list of ancestor ids plus the task's own id, wrapped
+# in slashes ('/1/5/12/'), so a subtree is a single prefix match and the
+# ancestors of a task can be read straight off its path. The column is
+# MAX_PATH_LENGTH characters wide (about 40 levels with 6-digit ids), and
+# nothing is created or moved that would not fit it.
+
+MAX_PATH_LENGTH = Task.__table__.c.path.type.length
+
+class PathTooLongError(Exception):
+    def __init__(self):
+        super().__init__('Task tree is too deep')
+
+def build_path(task, parent=None):
+    prefix = parent.path if parent is not None and parent.path else '/'
+    return f'{prefix}{task.id}/'
+
+def assign_path(task, parent=None):
+    # task.id must be known, so callers flush before calling this
+    path = build_path(task, parent)
+    if len(path) > MAX_PATH_LENGTH:
+        raise PathTooLongError()
+    task.path = path
+    task.level = parent.level + 1 if parent is not None else 0
+
+def ancestor_ids(task):
+    if not task.path:
+        return []
+    return [int(i) for i in task.path.strip('/').split('/')[:-1]]
+
+def subtree_criteria(task):
+    return [Task.project_id == task.project_id, Task.path.like(f'{task.path}%')]
+
+def get_subtree(task):
+    return Task.query.filter(*subtree_criteria(task)).order_by(Task.level, Task.sort_order).all()
+
+def get_ancestors(task):
+    ids = ancestor_ids(task)
+    if not ids:
+        return []
+    ancestors = {t.id: t for t in Task.query.filter(Task.id.in_(ids)).all()}
+    return [ancestors[i] for i in ids if i in ancestors]
+
+def is_descendant(task, other):
+    """True if `other` is `task` itself or lies anywhere below it."""
+    return bool(task.path and other.path and other.path.startswith(task.path))
+
+def fits_under(task, new_parent=None):
+    """Whether every path in `task`'s subtree still fits once it is moved."""
+    if not task.path:
+        return len(build_path(task, new_parent)) <= MAX_PATH_LENGTH
+    deepest = db.session.query(func.max(func.length(Task.path))).filter(*subtree_criteria(task)).scalar()
+    return (deepest or len(task.path)) - len(task.path) + len(build_path(task, new_parent)) <= MAX_PATH_LENGTH
+
+def move_subtree(task, new_parent=None):
+    """Re-parent `task` and rewrite path/level of its whole subtree.
+
+    Runs as one UPDATE over the subtree; the caller commits, and checks
+    fits_under first.
+    """
+    old_prefix = task.path
+    new_prefix = build_path(task, new_parent)
+    level_delta = (new_parent.level + 1 if new_parent is not None else 0) - (task.level or 0)
+
+    task.parent_id = new_parent.id if new_parent is not None else None
+    db.session.flush()
+
+    if old_prefix == new_prefix and level_delta == 0:
+        return
+
+    Task.query.filter(*subtree_criteria(task)).update({
+        Task.path: literal(new_prefix, String) + func.substr(Task.path, len(old_prefix) + 1),
+        Task.level: Task.level + level_delta
+    }, synchronize_session='fetch')
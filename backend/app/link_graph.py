@@ -0,0 +1,131 @@
+from app.models import Task, TaskLink
+from app import db
+
+# Per-project dependency graph with an incrementally maintained topological
+# order (Pearce-Kelly dynamic topological sort). Inserting a link that
+# already agrees with the order is O(1); otherwise only the nodes between
+# the two endpoints in the order are visited.
+#
+# Graphs are cached per process and tagged with the project revision they
+# reflect. Any task or link write bumps the revision, so a stale graph is
+# simply rebuilt on next use; link writes made through this module keep
+# the cached graph current instead.
+
+_graphs = {}
+
+class LinkGraph:
+    def __init__(self, revision, task_ids, edges):
+        self.revision = revision
+        self.succ = {task_id: {} for task_id in task_ids}
+        self.pred = {task_id: {} for task_id in task_ids}
+        for source, target in edges:
+            if source in self.succ and target in self.succ:
+                self._link(source, target)
+        self.ord = self._initial_order()
+
+    def _link(self, source, target):
+        self.succ[source][target] = self.succ[source].get(target, 0) + 1
+        self.pred[target][source] = self.pred[target].get(source, 0) + 1
+
+    def _initial_order(self):
+        indegree = {node: len(preds) for node, preds in self.pred.items()}
+        stack = [node for node, d in indegree.items() if d == 0]
+        order = {}
+        while stack:
+            node = stack.pop()
+            order[node] = len(order)
+            for target in self.succ[node]:
+                indegree[target] -= 1
+                if indegree[target] == 0:
+                    stack.append(target)
+        # Links stored before cycle checks existed may already form cycles;
+        # order those nodes last and fall back to unbounded searches.
+        self.cyclic = len(order) != len(self.succ)
+        for node in self.succ:
+            if node not in order:
+                order[node] = len(order)
+        return order
+
+    def has_edge(self, source, target):
+        return target in self.succ.get(source, {})
+
+    def add_edge(self, source, target):
+        """Insert source -> target, or return False if it closes a cycle."""
+        if source == target:
+            return False
+        lower, upper = self.ord[target], self.ord[source]
+        if lower > upper and not self.cyclic:
+            self._link(source, target)
+            return True
+
+        if self.cyclic:
+            if source in self._search(target, self.succ, lambda n: True):
+                return False
+            self._link(source, target)
+            return True
+
+        forward = self._search(target, self.succ, lambda n: self.ord[n] <= upper)
+        if source in forward:
+            return False
+        backward = self._search(source, self.pred, lambda n: self.ord[n] >= lower)
+
+        # Give the backward set the lowest of the affected slots, keeping
+        # each set's relative order, so every edge points forward again.
+        nodes = sorted(backward, key=self.ord.get) + sorted(forward, key=self.ord.get)
+        slots = sorted(self.ord[n] for n in nodes)
+        for node, slot in zip(nodes, slots):
+            self.ord[node] = slot
+
+        self._link(source, target)
+        return True
+
+    def remove_edge(self, source, target):
+        # Dropping an edge never invalidates a topological order
+        count = self.succ.get(source, {}).get(target)
+        if not count:
+            return
+        if count == 1:
+            del self.succ[source][target]
+            del self.pred[target][source]
+        else:
+            self.succ[source][target] = count - 1
+            self.pred[target][source] = count - 1
+
+    def _search(self, start, adjacency, within):
+        seen = {start}
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            for neighbour in adjacency[node]:
+                if neighbour not in seen and within(neighbour):
+                    seen.add(neighbour)
+                    stack.append(neighbour)
+        return seen
+
+def load_link_graph(project_id, revision):
+    task_ids = [row[0] for row in db.session.query(Task.id).filter(Task.project_id == project_id).all()]
+    edges = db.session.query(TaskLink.source, TaskLink.target)\
+        .join(Task, TaskLink.source == Task.id)\
+        .filter(Task.project_id == project_id).all()
+    return LinkGraph(revision, task_ids, edges)
+
+def get_link_graph(project_id, revision):
+    """Cached graph for `project_id`, rebuilt unless it is at `revision`."""
+    graph = _graphs.get(project_id)
+    if graph is None or graph.revision != revision:
+        graph = load_link_graph(project_id, revision)
+        _graphs[project_id] = graph
+    return graph
+
+def forget_edge(project_id, source, target, revision):
+    # Keep the cached graph in step with a link deletion made at `revision`
+    graph = _graphs.get(project_id)
+    if graph is not None and graph.revision == revision - 1:
+        graph.remove_edge(source, target)
+        graph.revision = revision
+
+def invalidate(project_id=None):
+    if project_id is None:
+        _graphs.clear()
+    else:
+        _graphs.pop(project_id, None)
@@ -13,6 +13,7 @@ class User(db.Model):
     real_name = db.Column(db.String(50))
     nickname = db.Column(db.String(50))
     avatar = db.Column(db.String(255))
+    unread_notifications = db.Column(db.Integer, default=0, server_default='0', nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -35,30 +36,49 @@ class Team(db.Model):
 
 class TeamMember(db.Model):
     __tablename__ = 'team_members'
+    __table_args__ = (db.Index('uq_team_members_team_user', 'team_id', 'user_id', unique=True),)
     id = db.Column(db.Integer, primary_key=True)
     team_id = db.Column(db.Integer, db.ForeignKey('teams.id'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     role = db.Column(db.String(20), default='member') # creator/member
     joined_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Chat read pointer: the last message this member has seen, with its
+    # timestamp, since message ids are only ordered within one worker
+    last_read_message_id = db.Column(db.Integer)
+    last_read_at = db.Column(db.DateTime)
 
 class Project(db.Model):
     __tablename__ = 'projects'
     id = db.Column(db.Integer, primary_key=True)
-    team_id = db.Column(db.Integer, db.ForeignKey('teams.id'), nullable=False)
+    team_id = db.Column(db.Integer, db.ForeignKey('teams.id'), nullable=False, index=True)
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
     status = db.Column(db.String(20), default='active')
     start_date = db.Column(db.Date)
     end_date = db.Column(db.Date)
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0') # bumped by every task/link write
+    tombstone_revision = db.Column(db.Integer, nullable=False, default=0, server_default='0') # deletions up to here are pruned
+    # Roll-up totals over all tasks of the project, maintained by app.rollup
+    task_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    completed_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    leaf_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    leaf_progress = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class Task(db.Model):
     __tablename__ = 'tasks'
+    __table_args__ = (
+        db.Index('ix_tasks_project_revision', 'project_id', 'revision'),
+        db.Index('ix_tasks_project_parent_sort', 'project_id', 'parent_id', 'sort_order'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    parent_id = db.Column(db.Integer, db.ForeignKey('tasks.id'))
+    parent_id = db.Column(db.Integer, db.ForeignKey('tasks.id'), index=True)
     project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
+    # Copy of the project's team_id so membership checks and team-wide
+    # queries need no join; projects never change team
+    team_id = db.Column(db.Integer, index=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
     status = db.Column(db.String(20), default='pending') # pending/in_progress/completed
@@ -67,7 +87,14 @@ class Task(db.Model):
     start_date = db.Column(db.Date)
     end_date = db.Column(db.Date)
     level = db.Column(db.Integer, default=0)
+    path = db.Column(db.String(255), index=True) # materialized path of ancestor ids, e.g. '/1/5/12/'
     sort_order = db.Column(db.Integer, default=0)
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0') # project revision of last write
+    # Roll-up totals over descendants, maintained by app.rollup
+    descendant_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    completed_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    leaf_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    leaf_progress = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -82,19 +109,32 @@ class Task(db.Model):
 class TaskLink(db.Model):
     __tablename__ = 'task_links'
     id = db.Column(db.Integer, primary_key=True)
-    source = db.Column(db.Integer, db.ForeignKey('tasks.id'), nullable=False)
-    target = db.Column(db.Integer, db.ForeignKey('tasks.id'), nullable=False)
+    source = db.Column(db.Integer, db.ForeignKey('tasks.id'), nullable=False, index=True)
+    target = db.Column(db.Integer, db.ForeignKey('tasks.id'), nullable=False, index=True)
     type = db.Column(db.String(1), default='0') # '0': finish-to-start, '1': start-to-start, '2': finish-to-finish, '3': start-to-finish
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+class GanttTombstone(db.Model):
+    __tablename__ = 'gantt_tombstones'
+    __table_args__ = (db.Index('ix_gantt_tombstones_project_revision', 'project_id', 'revision'),)
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
+    kind = db.Column(db.String(10), nullable=False) # task/link
+    object_id = db.Column(db.Integer, nullable=False)
+    revision = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class TaskParticipant(db.Model):
     __tablename__ = 'task_participants'
+    __table_args__ = (db.Index('uq_task_participants_task_user', 'task_id', 'user_id', unique=True),)
     id = db.Column(db.Integer, primary_key=True)
     task_id = db.Column(db.Integer, db.ForeignKey('tasks.id'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     joined_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class TaskComment(db.Model):
     __tablename__ = 'task_comments'
+    __table_args__ = (db.Index('ix_task_comments_task_created', 'task_id', 'created_at', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
     task_id = db.Column(db.Integer, db.ForeignKey('tasks.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -104,14 +144,21 @@ class TaskComment(db.Model):
 
 class TaskMessage(db.Model):
     __tablename__ = 'task_messages'
+    __table_args__ = (db.Index('ix_task_messages_task_created', 'task_id', 'created_at', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
     task_id = db.Column(db.Integer, db.ForeignKey('tasks.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     content = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class IdSequence(db.Model):
+    __tablename__ = 'id_sequences'
+    name = db.Column(db.String(50), primary_key=True)
+    next_value = db.Column(db.BigInteger, nullable=False)
+
 class TeamMessage(db.Model):
     __tablename__ = 'team_messages'
+    __table_args__ = (db.Index('ix_team_messages_team_created', 'team_id', 'created_at', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
     team_id = db.Column(db.Integer, db.ForeignKey('teams.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -123,6 +170,7 @@ class TeamMessage(db.Model):
 
 class TaskActivity(db.Model):
     __tablename__ = 'task_activities'
+    __table_args__ = (db.Index('ix_task_activities_task_created', 'task_id', 'created_at', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
     task_id = db.Column(db.Integer, db.ForeignKey('tasks.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -130,24 +178,57 @@ class TaskActivity(db.Model):
     detail = db.Column(db.JSON)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class FileBlob(db.Model):
+    # Content-addressed storage shared by File rows, see app.blobs
+    __tablename__ = 'file_blobs'
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), unique=True, nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    path = db.Column(db.String(500), nullable=False) # relative to UPLOAD_FOLDER
+    ref_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class File(db.Model):
     __tablename__ = 'files'
     id = db.Column(db.Integer, primary_key=True)
     uid = db.Column(db.String(36), unique=True, nullable=False, default=lambda: uuid.uuid4().hex)
     team_id = db.Column(db.Integer, db.ForeignKey('teams.id'), nullable=False)
+    task_id = db.Column(db.Integer, db.ForeignKey('tasks.id'), index=True)
+    resource_id = db.Column(db.Integer, db.ForeignKey('team_resources.id'), index=True)
+    message_id = db.Column(db.Integer, db.ForeignKey('team_messages.id'), index=True)
+    timeline_event_id = db.Column(db.Integer, db.ForeignKey('timeline_events.id'), index=True)
+    filename = db.Column(db.String(255), nullable=False)
+    filepath = db.Column(db.String(500), nullable=False)
+    filesize = db.Column(db.Integer)
+    mimetype = db.Column(db.String(100))
+    checksum = db.Column(db.String(64)) # sha256 hex of the content
+    blob_id = db.Column(db.Integer, db.ForeignKey('file_blobs.id'), index=True) # filepath is then the blob's path
+    uploader_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    blob = db.relationship('FileBlob')
+
+class UploadSession(db.Model):
+    # A chunked upload in progress, see app.uploads
+    __tablename__ = 'upload_sessions'
+    id = db.Column(db.String(32), primary_key=True, default=lambda: uuid.uuid4().hex)
+    uploader_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    team_id = db.Column(db.Integer, db.ForeignKey('teams.id'), nullable=False)
     task_id = db.Column(db.Integer, db.ForeignKey('tasks.id'))
     resource_id = db.Column(db.Integer, db.ForeignKey('team_resources.id'))
     message_id = db.Column(db.Integer, db.ForeignKey('team_messages.id'))
     timeline_event_id = db.Column(db.Integer, db.ForeignKey('timeline_events.id'))
     filename = db.Column(db.String(255), nullable=False)
-    filepath = db.Column(db.String(500), nullable=False)
-    filesize = db.Column(db.Integer)
     mimetype = db.Column(db.String(100))
-    uploader_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    received = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    checksum = db.Column(db.String(64)) # expected sha256, if the client sent one
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
 class TeamResource(db.Model):
     __tablename__ = 'team_resources'
+    __table_args__ = (db.Index('ix_team_resources_team_created', 'team_id', 'created_at'),)
     id = db.Column(db.Integer, primary_key=True)
     team_id = db.Column(db.Integer, db.ForeignKey('teams.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -160,16 +241,34 @@ class TeamResource(db.Model):
 
 class Notification(db.Model):
     __tablename__ = 'notifications'
+    __table_args__ = (
+        db.Index('ix_notifications_user_read_created', 'user_id', 'is_read', 'created_at'),
+        db.Index('ix_notifications_user_created', 'user_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     type = db.Column(db.String(50), nullable=False)
     content = db.Column(db.Text)
     related_id = db.Column(db.Integer)
     is_read = db.Column(db.Boolean, default=False)
+    count = db.Column(db.Integer, default=1, server_default='1', nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class NotificationArchive(db.Model):
+    __tablename__ = 'notifications_archive'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    type = db.Column(db.String(50), nullable=False)
+    content = db.Column(db.Text)
+    related_id = db.Column(db.Integer)
+    is_read = db.Column(db.Boolean, default=False)
+    count = db.Column(db.Integer, default=1, nullable=False)
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class TimelineEvent(db.Model):
     __tablename__ = 'timeline_events'
+    __table_args__ = (db.Index('ix_timeline_events_team_date', 'team_id', 'event_date'),)
     id = db.Column(db.Integer, primary_key=True)
     team_id = db.Column(db.Integer, db.ForeignKey('teams.id'), nullable=False)
     project_id = db.Column(db.Integer, db.ForeignKey('projects.id'))
@@ -184,6 +283,7 @@ class TimelineEvent(db.Model):
 
 class LearningProgress(db.Model):
     __tablename__ = 'learning_progress'
+    __table_args__ = (db.Index('ix_learning_progress_team_created', 'team_id', 'created_at'),)
     id = db.Column(db.Integer, primary_key=True)
     team_id = db.Column(db.Integer, db.ForeignKey('teams.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
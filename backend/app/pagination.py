@@ -0,0 +1,54 @@
+import base64
+from datetime import datetime
+from flask import request
+from sqlalchemy import and_, or_
+
+# Keyset (cursor) pagination on (created_at, id). Pages are read newest
+# first with `WHERE (created_at, id) < cursor`, so every page is an index
+# range scan and latency does not grow with history the way OFFSET does.
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+class CursorError(ValueError):
+    pass
+
+def encode_cursor(created_at, id):
+    raw = f'{created_at.isoformat()}|{id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(id)
+    except (ValueError, UnicodeDecodeError):
+        raise CursorError('Invalid cursor')
+
+def wants_page():
+    """Paginate only when asked, so clients expecting a full list keep working."""
+    return 'limit' in request.args or 'before' in request.args
+
+def page_args(default_limit=DEFAULT_LIMIT, max_limit=MAX_LIMIT):
+    limit = request.args.get('limit', default_limit, type=int)
+    limit = max(1, min(limit, max_limit))
+    before = request.args.get('before')
+    return limit, decode_cursor(before) if before else None
+
+def keyset_page(query, created_col, id_col, limit, before=None):
+    """Return (rows, next_cursor) for one page, newest first.
+
+    `query` may select extra entities, in which case the first entity of
+    each row must be the model owning `created_col` and `id_col`.
+    """
+    if before is not None:
+        created_at, id = before
+        query = query.filter(or_(created_col < created_at, and_(created_col == created_at, id_col < id)))
+    rows = query.order_by(created_col.desc(), id_col.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1][0] if hasattr(rows[-1], '_mapping') else rows[-1]
+        next_cursor = encode_cursor(getattr(last, created_col.key), getattr(last, id_col.key))
+    return rows, next_cursor
@@ -0,0 +1,116 @@
+import socketserver
+import threading
+
+# A minimal Redis-protocol pub/sub server (HELLO, PING, PUBLISH, SUBSCRIBE,
+# UNSUBSCRIBE over RESP2 or RESP3) for running several Socket.IO workers on one machine
+# without Redis, e.g. in development and tests:
+#
+#     flask pubsub-server --port 6390
+#     SOCKETIO_MESSAGE_QUEUE=redis://127.0.0.1:6390/0 python app.py
+#
+# It keeps nothing in memory besides live subscriptions. Use a real Redis
+# in production.
+
+def _bulk(value):
+    if isinstance(value, str):
+        value = value.encode()
+    return b'$%d\r\n%s\r\n' % (len(value), value)
+
+def _items(items):
+    return b''.join(b':%d\r\n' % item if isinstance(item, int) else _bulk(item) for item in items)
+
+def _array(*items, kind=b'*'):
+    return kind + b'%d\r\n' % len(items) + _items(items)
+
+class PubSubServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, _Handler)
+        self.channels = {}
+        self.lock = threading.Lock()
+
+    def publish(self, channel, data):
+        with self.lock:
+            subscribers = list(self.channels.get(channel, ()))
+        for handler in subscribers:
+            handler.push(b'message', channel, data)
+        return len(subscribers)
+
+class _Handler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.subscriptions = set()
+        self.write_lock = threading.Lock()
+        self.protocol = 2
+
+    def push(self, *items):
+        # RESP3 clients expect out-of-band messages as push frames
+        self.send(_array(*items, kind=b'>' if self.protocol == 3 else b'*'))
+
+    def send(self, data):
+        try:
+            with self.write_lock:
+                self.wfile.write(data)
+                self.wfile.flush()
+        except OSError:
+            pass
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+    def handle(self):
+        try:
+            while True:
+                args = self.read_command()
+                if args is None:
+                    break
+                if args:
+                    self.dispatch(args[0].upper(), args[1:])
+        finally:
+            with self.server.lock:
+                for channel in self.subscriptions:
+                    self.server.channels.get(channel, set()).discard(self)
+
+    def dispatch(self, command, args):
+        if command == b'HELLO':
+            self.protocol = 3 if args and args[0] == b'3' else 2
+            fields = [b'server', b'collabu-pubsub', b'proto', self.protocol]
+            if self.protocol == 3:
+                self.send(b'%%%d\r\n' % (len(fields) // 2) + _items(fields))
+            else:
+                self.send(_array(*fields))
+        elif command == b'PING':
+            self.send(b'+PONG\r\n')
+        elif command == b'PUBLISH' and len(args) == 2:
+            self.send(b':%d\r\n' % self.server.publish(args[0], args[1]))
+        elif command == b'SUBSCRIBE':
+            for channel in args:
+                with self.server.lock:
+                    self.server.channels.setdefault(channel, set()).add(self)
+                self.subscriptions.add(channel)
+                self.push(b'subscribe', channel, len(self.subscriptions))
+        elif command == b'UNSUBSCRIBE':
+            for channel in args or list(self.subscriptions):
+                with self.server.lock:
+                    self.server.channels.get(channel, set()).discard(self)
+                self.subscriptions.discard(channel)
+                self.push(b'unsubscribe', channel, len(self.subscriptions))
+        elif command in (b'CLIENT', b'SELECT'):
+            self.send(b'+OK\r\n')
+        else:
+            self.send(b'-ERR unsupported command\r\n')
+
+def serve(host='127.0.0.1', port=6379):
+    with PubSubServer((host, port)) as server:
+        server.serve_forever()
@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, delete, update, bindparam, literal
+from app.models import Notification, NotificationArchive
+from app.services import adjust_unread
+from app import db
+
+# Notification retention.
+#
+# Read notifications older than NOTIFICATION_RETENTION_DAYS are deleted,
+# or copied to notifications_archive first, and runs of task_update
+# notifications about the same task are folded into their newest row with
+# a count. Both passes work in batches of at most `batch_size` rows, each
+# committed on its own, so no single transaction holds the table for long
+# and the job can be stopped and re-run at any point.
+
+COALESCE_TYPES = ('task_update',)
+
+def purge_read(days, batch_size=1000, archive=False):
+    """Delete (or archive) read notifications older than `days`."""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    total = 0
+    while True:
+        ids = db.session.execute(
+            select(Notification.id)
+            .where(Notification.is_read.is_(True), Notification.created_at < cutoff)
+            .order_by(Notification.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        if archive:
+            columns = ['id', 'user_id', 'type', 'content', 'related_id', 'is_read', 'count', 'created_at']
+            rows = select(*[getattr(Notification, c) for c in columns], literal(datetime.utcnow(), db.DateTime))\
+                .where(Notification.id.in_(ids))
+            db.session.execute(insert(NotificationArchive).from_select(columns + ['archived_at'], rows))
+        db.session.execute(delete(Notification).where(Notification.id.in_(ids)))
+        db.session.commit()
+        total += len(ids)
+    return total
+
+def coalesce(batch_size=1000):
+    """Fold repeated notifications about one task into the newest row.
+
+    Only rows with the same user, type, related_id and read state are
+    merged, so an unread update never disappears into a read one. Users
+    are walked one at a time through the user_id index, and the rows to
+    drop are deleted by id, `batch_size` at a time, even within one user.
+    """
+    user_ids = db.session.execute(
+        select(Notification.user_id).distinct()
+        .where(Notification.type.in_(COALESCE_TYPES))
+        .order_by(Notification.user_id)
+    ).scalars().all()
+
+    total = 0
+    pending = _Pending()
+    for user_id in user_ids:
+        rows = db.session.execute(
+            select(Notification.id, Notification.type, Notification.related_id,
+                   Notification.is_read, Notification.count)
+            .where(Notification.user_id == user_id, Notification.type.in_(COALESCE_TYPES),
+                   Notification.related_id.isnot(None))
+            .order_by(Notification.id)
+        ).all()
+        newest = {}
+        for id, type, related_id, is_read, count in rows:
+            newest[(type, related_id, bool(is_read))] = id
+        for id, type, related_id, is_read, count in rows:
+            keep_id = newest[(type, related_id, bool(is_read))]
+            if id == keep_id:
+                continue
+            pending.drop(user_id, id, bool(is_read), count, keep_id)
+            if len(pending) >= batch_size:
+                total += pending.flush()
+    return total + pending.flush()
+
+class _Pending:
+    def __init__(self):
+        self.rows = []
+
+    def __len__(self):
+        return len(self.rows)
+
+    def drop(self, user_id, id, is_read, count, keep_id):
+        self.rows.append((user_id, id, is_read, count, keep_id))
+
+    def flush(self):
+        """Delete the pending rows and add their counts to the kept rows."""
+        removed = 0
+        added = {}
+        unread = {}
+        for is_read in (True, False):
+            candidates = {id: (user_id, count, keep_id)
+                          for user_id, id, read, count, keep_id in self.rows if read == is_read}
+            if not candidates:
+                continue
+            # Rows whose read state changed (or that are gone) since they
+            # were loaded are left alone; the rest stay locked until commit,
+            # so only what is really deleted is folded into the kept rows
+            # and taken off the unread counters.
+            ids = db.session.execute(
+                select(Notification.id)
+                .where(Notification.id.in_(candidates), Notification.is_read.is_(is_read))
+                .with_for_update()
+            ).scalars().all()
+            if not ids:
+                continue
+            db.session.execute(delete(Notification).where(Notification.id.in_(ids)))
+            for id in ids:
+                user_id, count, keep_id = candidates[id]
+                added[keep_id] = added.get(keep_id, 0) + count
+                if not is_read:
+                    unread[user_id] = unread.get(user_id, 0) + 1
+            removed += len(ids)
+        if added:
+            table = Notification.__table__
+            db.session.execute(
+                update(table)
+                .where(table.c.id == bindparam('keep_id'))
+                .values(count=table.c.count + bindparam('added')),
+                [{'keep_id': id, 'added': n} for id, n in added.items()]
+            )
+        for user_id, gone in unread.items():
+            db.session.execute(adjust_unread([user_id], -gone))
+        db.session.commit()
+        self.rows = []
+        return removed
@@ -0,0 +1,70 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from app.models import Project, Task, TaskLink, GanttTombstone
+from app import db
+
+# Per-project revision counter used for incremental Gantt sync. Every task
+# or link write bumps Project.revision inside the caller's transaction and
+# stamps the written rows with the new value; deletions leave a tombstone
+# so clients can ask for everything that changed since a known revision.
+# Tombstones are kept for GANTT_TOMBSTONE_DAYS; pruning them raises
+# Project.tombstone_revision, and a client syncing from before that gets
+# the full payload again.
+
+def bump_revision(project_id):
+    # The UPDATE takes the row lock, so concurrent writers serialize here
+    # and revisions stay strictly increasing per project.
+    Project.query.filter_by(id=project_id).update(
+        {Project.revision: Project.revision + 1}, synchronize_session=False)
+    return db.session.query(Project.revision).filter_by(id=project_id).scalar()
+
+def touch(project_id, *objects):
+    revision = bump_revision(project_id)
+    for obj in objects:
+        obj.revision = revision
+    return revision
+
+def record_deletions(project_id, task_ids=(), link_ids=()):
+    revision = bump_revision(project_id)
+    rows = [{'project_id': project_id, 'kind': 'task', 'object_id': i, 'revision': revision} for i in task_ids]
+    rows += [{'project_id': project_id, 'kind': 'link', 'object_id': i, 'revision': revision} for i in link_ids]
+    if rows:
+        db.session.execute(GanttTombstone.__table__.insert(), rows)
+    return revision
+
+def current_revision(project_id):
+    return db.session.query(Project.revision).filter_by(id=project_id).scalar() or 0
+
+def can_sync_from(project, since):
+    """Whether every deletion after `since` still has its tombstone."""
+    return since >= project.tombstone_revision
+
+def prune_tombstones(days):
+    """Drop tombstones older than `days`; returns how many were removed."""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    # Revisions only grow, so everything up to the newest expired revision
+    # of a project is at least that old
+    expired = db.session.query(GanttTombstone.project_id, func.max(GanttTombstone.revision))\
+        .filter(GanttTombstone.deleted_at < cutoff).group_by(GanttTombstone.project_id).all()
+    removed = 0
+    for project_id, revision in expired:
+        removed += GanttTombstone.query.filter(GanttTombstone.project_id == project_id,
+                                               GanttTombstone.revision <= revision).delete(synchronize_session=False)
+        Project.query.filter(Project.id == project_id, Project.tombstone_revision < revision).update(
+            {Project.tombstone_revision: revision, Project.updated_at: Project.updated_at}, synchronize_session=False)
+        db.session.commit()
+    return removed
+
+def load_changes(project_id, since):
+    """Tasks and links written after `since`, plus ids deleted since then."""
+    tasks = Task.query.filter(Task.project_id == project_id, Task.revision > since)\
+        .order_by(Task.sort_order).all()
+    links = TaskLink.query.join(Task, TaskLink.source == Task.id)\
+        .filter(Task.project_id == project_id, TaskLink.revision > since).all()
+    tombstones = db.session.query(GanttTombstone.kind, GanttTombstone.object_id)\
+        .filter(GanttTombstone.project_id == project_id, GanttTombstone.revision > since).all()
+
+    deleted = {'tasks': [], 'links': []}
+    for kind, object_id in tombstones:
+        deleted['tasks' if kind == 'task' else 'links'].append(object_id)
+    return tasks, links, deleted
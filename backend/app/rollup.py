@@ -0,0 +1,175 @@
+from app.models import Project, Task
+from app.hierarchy import ancestor_ids
+from app import db
+
+# Progress roll-up for task trees.
+#
+# Every task and project keeps running totals over its descendants:
+# descendant/completed counts and the number and summed progress of leaf
+# tasks. A parent's progress is the mean progress of the leaves below it.
+# Writes only adjust the totals along the ancestor path (read with one
+# query via Task.path), in the caller's transaction, so reads never have
+# to walk the tree.
+
+def _progress(leaf_progress, leaf_count):
+    return int(round(leaf_progress / leaf_count)) if leaf_count else 0
+
+def project_progress(project):
+    return _progress(project.leaf_progress, project.leaf_count)
+
+def _leaf_progress(task):
+    """Progress of a former parent that has just lost its last child."""
+    if task.status == 'completed':
+        return 100
+    if task.status == 'in_progress':
+        return min(task.progress or 0, 99)
+    return 0
+
+def _contribution(task):
+    """What the subtree rooted at `task` adds to everything above it."""
+    done = 1 if task.status == 'completed' else 0
+    if task.leaf_count:
+        return 1 + task.descendant_count, done + task.completed_count, task.leaf_count, task.leaf_progress
+    return 1 + task.descendant_count, done + task.completed_count, 1, task.progress or 0
+
+def _apply(rows, tasks=0, completed=0, leaves=0, leaf_progress=0, revision=None):
+    for row in rows:
+        if isinstance(row, Task):
+            row.descendant_count += tasks
+        else:
+            row.task_count += tasks
+        row.completed_count += completed
+        row.leaf_count += leaves
+        row.leaf_progress += leaf_progress
+        if isinstance(row, Task):
+            progress = _progress(row.leaf_progress, row.leaf_count)
+            if row.leaf_count and row.progress != progress:
+                row.progress = progress
+                if revision is not None:
+                    row.revision = revision
+
+def _chain(task):
+    # Nearest ancestor first, ending with the project itself. Locking reads
+    # so concurrent writers on the same tree never work from stale totals.
+    ids = ancestor_ids(task)
+    rows = {}
+    if ids:
+        for row in Task.query.filter(Task.id.in_(ids)).with_for_update().populate_existing().all():
+            rows[row.id] = row
+    project = Project.query.filter_by(id=task.project_id).with_for_update().populate_existing().one()
+    return [rows[i] for i in reversed(ids) if i in rows] + [project]
+
+def attach(task, revision=None):
+    """Add `task`'s subtree to the totals of its (new) ancestors."""
+    tasks, completed, leaves, leaf_progress = _contribution(task)
+    chain = _chain(task)
+    parent = chain[0] if isinstance(chain[0], Task) else None
+    if parent is not None and parent.leaf_count == 0:
+        # The parent stops being a leaf, so above it its own progress is
+        # replaced by that of the new subtree.
+        _apply(chain[1:], tasks, completed, leaves - 1, leaf_progress - (parent.progress or 0), revision)
+        _apply([parent], tasks, completed, leaves, leaf_progress, revision)
+        return
+    _apply(chain, tasks, completed, leaves, leaf_progress, revision)
+
+def detach(task, revision=None):
+    """Remove `task`'s subtree from the totals of its current ancestors."""
+    tasks, completed, leaves, leaf_progress = _contribution(task)
+    chain = _chain(task)
+    parent = chain[0] if isinstance(chain[0], Task) else None
+    if parent is not None and parent.descendant_count == tasks:
+        # The parent becomes a leaf again; its progress no longer comes from
+        # children, so it falls back to what its own status says
+        progress = _leaf_progress(parent)
+        _apply(chain[1:], -tasks, -completed, 1 - leaves, progress - leaf_progress, revision)
+        parent.descendant_count = parent.completed_count = parent.leaf_count = parent.leaf_progress = 0
+        if parent.progress != progress:
+            parent.progress = progress
+            if revision is not None:
+                parent.revision = revision
+        return
+    _apply(chain, -tasks, -completed, -leaves, -leaf_progress, revision)
+
+def changed(task, old_progress, old_status, revision=None):
+    """Propagate a progress/status edit of `task` to its ancestors."""
+    if task.leaf_count:
+        # Progress of a parent is always derived from its leaves
+        task.progress = _progress(task.leaf_progress, task.leaf_count)
+        progress_delta = 0
+    else:
+        progress_delta = (task.progress or 0) - (old_progress or 0)
+    completed_delta = (task.status == 'completed') - (old_status == 'completed')
+    if progress_delta or completed_delta:
+        _apply(_chain(task), completed=completed_delta, leaf_progress=progress_delta, revision=revision)
+
+def rebuild_rollups(project_id=None, revision=None):
+    """Recompute every roll-up total from scratch in one pass per project.
+
+    With `revision`, tasks whose totals change are stamped with it so
+    gantt delta sync sends them.
+    """
+    query = db.session.query(Task.id, Task.parent_id, Task.project_id, Task.progress, Task.status,
+                             Task.descendant_count, Task.completed_count, Task.leaf_count, Task.leaf_progress)
+    projects = Project.query
+    if project_id is not None:
+        query = query.filter(Task.project_id == project_id)
+        projects = projects.filter(Project.id == project_id)
+    rows = query.all()
+
+    children = {}
+    for row in rows:
+        children.setdefault(row.parent_id, []).append(row)
+
+    totals = {}
+    def visit(row):
+        # Iterative post-order so deep trees do not hit the recursion limit
+        stack = [(row, False)]
+        while stack:
+            node, expanded = stack.pop()
+            if not expanded:
+                stack.append((node, True))
+                stack.extend((child, False) for child in children.get(node.id, []))
+                continue
+            desc = done = leaves = leaf_sum = 0
+            for child in children.get(node.id, []):
+                c_desc, c_done, c_leaves, c_sum, c_progress, c_status = totals[child.id]
+                desc += 1 + c_desc
+                done += c_done + (c_status == 'completed')
+                leaves += c_leaves or 1
+                leaf_sum += c_sum if c_leaves else c_progress
+            progress = _progress(leaf_sum, leaves) if leaves else (node.progress or 0)
+            totals[node.id] = (desc, done, leaves, leaf_sum, progress, node.status)
+
+    ids = {row.id for row in rows}
+    roots = [row for row in rows if row.parent_id is None or row.parent_id not in ids]
+    for root in roots:
+        visit(root)
+
+    task_mappings = []
+    project_totals = {}
+    for row in rows:
+        if row.id not in totals:
+            continue # part of a parent_id cycle, left untouched
+        desc, done, leaves, leaf_sum, progress, status = totals[row.id]
+        mapping = {'id': row.id, 'descendant_count': desc, 'completed_count': done,
+                   'leaf_count': leaves, 'leaf_progress': leaf_sum, 'progress': progress}
+        if revision is not None and (row.descendant_count, row.completed_count, row.leaf_count,
+                                     row.leaf_progress, row.progress) != (desc, done, leaves, leaf_sum, progress):
+            mapping['revision'] = revision
+        task_mappings.append(mapping)
+        t = project_totals.setdefault(row.project_id, [0, 0, 0, 0])
+        t[0] += 1
+        t[1] += status == 'completed'
+        if not leaves:
+            t[2] += 1
+            t[3] += progress
+
+    project_mappings = []
+    for (pid,) in projects.with_entities(Project.id).all():
+        t = project_totals.get(pid, [0, 0, 0, 0])
+        project_mappings.append({'id': pid, 'task_count': t[0], 'completed_count': t[1],
+                                 'leaf_count': t[2], 'leaf_progress': t[3]})
+
+    db.session.bulk_update_mappings(Task, task_mappings)
+    db.session.bulk_update_mappings(Project, project_mappings)
+    return len(task_mappings)
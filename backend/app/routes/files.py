@@ -1,13 +1,44 @@
-from flask import Blueprint, request, jsonify, send_from_directory, current_app
+from flask import Blueprint, request, jsonify, redirect, current_app
 from flask_jwt_extended import get_jwt_identity, jwt_required
-from app.models import File, TeamMember, Task, Team, User
+from app.models import File, Team, User, UploadSession
+from app.chat import pipeline
 from app import db
+from app.authz import is_member, task_team_id
+from app import uploads, blobs, thumbnails
+from app.downloads import send_stored, signed_url, check_signature
 import os
-import uuid
+from datetime import datetime
 from werkzeug.utils import secure_filename
 
 bp = Blueprint('files', __name__)
 
+def _resolve_team(fields):
+    team_id = fields.get('team_id')
+    if team_id:
+        return team_id
+    # If task_id provided, infer team_id
+    if fields.get('task_id'):
+        return task_team_id(fields.get('task_id'))
+    if fields.get('resource_id'):
+        from app.models import TeamResource
+        resource = TeamResource.query.get(fields.get('resource_id'))
+        return resource.team_id if resource else None
+    if fields.get('timeline_event_id'):
+        from app.models import TimelineEvent
+        event = TimelineEvent.query.get(fields.get('timeline_event_id'))
+        return event.team_id if event else None
+    return None
+
+def _file_payload(new_file, message):
+    return {
+        'id': new_file.id,
+        'uid': new_file.uid,
+        'filename': new_file.filename,
+        'url': f'/api/files/{new_file.uid}',
+        'thumb_url': thumbnails.thumb_url(new_file),
+        'message': message
+    }
+
 @bp.route('/upload', methods=['POST'])
 @jwt_required()
 def upload_file():
@@ -20,74 +51,169 @@ def upload_file():
     if file.filename == '':
         return jsonify({'message': 'No selected file'}), 400
         
-    team_id = request.form.get('team_id')
-    task_id = request.form.get('task_id')
-    resource_id = request.form.get('resource_id')
-    timeline_event_id = request.form.get('timeline_event_id')
-    
+    team_id = _resolve_team(request.form)
     if not team_id:
-        # If task_id provided, infer team_id
-        if task_id:
-            task = Task.query.get(task_id)
-            if task:
-                from app.models import Project
-                project = Project.query.get(task.project_id)
-                if project:
-                    team_id = project.team_id
-        elif resource_id:
-             from app.models import TeamResource
-             resource = TeamResource.query.get(resource_id)
-             if resource:
-                 team_id = resource.team_id
-        elif timeline_event_id:
-             from app.models import TimelineEvent
-             event = TimelineEvent.query.get(timeline_event_id)
-             if event:
-                 team_id = event.team_id
-        
-        if not team_id:
-            return jsonify({'message': 'Team ID required'}), 400
+        return jsonify({'message': 'Team ID required'}), 400
         
     # Check access
-    if not TeamMember.query.filter_by(team_id=team_id, user_id=current_user_id).first():
+    if not is_member(team_id, current_user_id):
         return jsonify({'message': 'Access denied'}), 403
         
     if file:
         original_filename = secure_filename(file.filename)
-        ext = os.path.splitext(original_filename)[1]
-        unique_filename = f"{uuid.uuid4().hex}{ext}"
-        
-        if not os.path.exists(current_app.config['UPLOAD_FOLDER']):
-             os.makedirs(current_app.config['UPLOAD_FOLDER'])
-
-        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-        file.save(filepath)
-        
-        filesize = os.path.getsize(filepath)
+        temp_path = uploads.temp_path()
+        filesize, checksum = uploads.save_stream(file.stream, temp_path)
+        blob = blobs.store(temp_path, checksum, filesize)
         mimetype = file.mimetype
         
+        if request.form.get('message_id') and pipeline.enabled:
+            # The message may still be queued; write it before referencing it
+            pipeline.flush()
+
         new_file = File(
             team_id=team_id,
-            task_id=task_id,
-            resource_id=resource_id,
+            task_id=request.form.get('task_id'),
+            resource_id=request.form.get('resource_id'),
             message_id=request.form.get('message_id'),
-            timeline_event_id=timeline_event_id,
+            timeline_event_id=request.form.get('timeline_event_id'),
             filename=original_filename,
-            filepath=unique_filename,
+            filepath=blob.path,
             filesize=filesize,
             mimetype=mimetype,
+            checksum=checksum,
+            blob_id=blob.id,
+            uploader_id=current_user_id
+        )
+        db.session.add(new_file)
+        db.session.commit()
+        
+        return jsonify(_file_payload(new_file, 'File uploaded successfully')), 201
+
+@bp.route('/uploads', methods=['POST'])
+@jwt_required()
+def start_upload():
+    current_user_id = int(get_jwt_identity())
+    data = request.get_json() or {}
+    filename = secure_filename(data.get('filename') or '')
+    size = data.get('size')
+    
+    if not filename or not isinstance(size, int) or size < 0:
+        return jsonify({'message': 'Filename and size required'}), 400
+    if size > current_app.config['UPLOAD_MAX_SIZE']:
+        return jsonify({'message': 'File too large'}), 413
+        
+    team_id = _resolve_team(data)
+    if not team_id:
+        return jsonify({'message': 'Team ID required'}), 400
+        
+    if not is_member(team_id, current_user_id):
+        return jsonify({'message': 'Access denied'}), 403
+        
+    # Content the team already holds is linked instead of uploaded again
+    blob = blobs.reuse(data['sha256'], size, team_id) if isinstance(data.get('sha256'), str) else None
+    if blob:
+        if data.get('message_id') and pipeline.enabled:
+            pipeline.flush()
+        new_file = File(
+            team_id=team_id,
+            task_id=data.get('task_id'),
+            resource_id=data.get('resource_id'),
+            message_id=data.get('message_id'),
+            timeline_event_id=data.get('timeline_event_id'),
+            filename=filename,
+            filepath=blob.path,
+            filesize=size,
+            mimetype=data.get('mimetype'),
+            checksum=blob.sha256,
+            blob_id=blob.id,
             uploader_id=current_user_id
         )
         db.session.add(new_file)
         db.session.commit()
+        return jsonify({**_file_payload(new_file, 'File uploaded successfully'), 'deduplicated': True}), 201
         
-        return jsonify({
-            'id': new_file.id,
-            'uid': new_file.uid,
-            'filename': new_file.filename,
-            'url': f'/api/files/{new_file.uid}',
-            'message': 'File uploaded successfully'
-        }), 201
+    upload = uploads.start(
+        current_user_id, team_id, filename, size,
+        mimetype=data.get('mimetype'),
+        checksum=data.get('sha256'),
+        task_id=data.get('task_id'),
+        resource_id=data.get('resource_id'),
+        message_id=data.get('message_id'),
+        timeline_event_id=data.get('timeline_event_id')
+    )
+    db.session.commit()
+    
+    return jsonify({
+        'upload_id': upload.id,
+        'offset': 0,
+        'size': upload.size,
+        'chunk_size': current_app.config['UPLOAD_CHUNK_SIZE']
+    }), 201
+
+def _own_upload(upload_id, user_id):
+    upload = UploadSession.query.get_or_404(upload_id)
+    return upload if upload.uploader_id == user_id else None
+
+@bp.route('/uploads/<string:upload_id>', methods=['GET'])
+@jwt_required()
+def get_upload(upload_id):
+    upload = _own_upload(upload_id, int(get_jwt_identity()))
+    if not upload:
+        return jsonify({'message': 'Access denied'}), 403
+        
+    return jsonify({'upload_id': upload.id, 'filename': upload.filename, 'size': upload.size, 'offset': upload.received}), 200
+
+@bp.route('/uploads/<string:upload_id>', methods=['PUT'])
+@jwt_required()
+def upload_chunk(upload_id):
+    upload = _own_upload(upload_id, int(get_jwt_identity()))
+    if not upload:
+        return jsonify({'message': 'Access denied'}), 403
+        
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'message': 'Offset required'}), 400
+        
+    try:
+        offset = uploads.write_chunk(upload, offset, request.stream)
+    except uploads.UploadError as e:
+        db.session.rollback()
+        return jsonify(e.payload()), e.status
+        
+    return jsonify({'upload_id': upload.id, 'offset': offset, 'size': upload.size}), 200
+
+@bp.route('/uploads/<string:upload_id>/complete', methods=['POST'])
+@jwt_required()
+def complete_upload(upload_id):
+    current_user_id = int(get_jwt_identity())
+    upload = _own_upload(upload_id, current_user_id)
+    if not upload or not is_member(upload.team_id, current_user_id):
+        return jsonify({'message': 'Access denied'}), 403
+        
+    if upload.message_id and pipeline.enabled:
+        # The message may still be queued; write it before referencing it
+        pipeline.flush()
+        
+    try:
+        new_file = uploads.finish(upload)
+    except uploads.UploadError as e:
+        db.session.rollback()
+        return jsonify(e.payload()), e.status
+    db.session.commit()
+    
+    return jsonify(_file_payload(new_file, 'File uploaded successfully')), 201
+
+@bp.route('/uploads/<string:upload_id>', methods=['DELETE'])
+@jwt_required()
+def cancel_upload(upload_id):
+    upload = _own_upload(upload_id, int(get_jwt_identity()))
+    if not upload:
+        return jsonify({'message': 'Access denied'}), 403
+        
+    uploads.discard(upload)
+    db.session.commit()
+    
+    return jsonify({'message': 'Upload cancelled'}), 200
 
 @bp.route('', methods=['GET'])
 @jwt_required()
@@ -98,10 +224,11 @@ def get_files():
     if not task_id:
         return jsonify({'message': 'Task ID required'}), 400
         
+    if not is_member(task_team_id(task_id), current_user_id):
+        return jsonify({'message': 'Access denied'}), 403
+        
     files = File.query.filter_by(task_id=task_id).order_by(File.created_at.desc()).all()
     
-    # Check access (skipped for brevity, assume team member check)
-    
     result = []
     for f in files:
         result.append({
@@ -110,7 +237,8 @@ def get_files():
             'filename': f.filename,
             'filesize': f.filesize,
             'created_at': f.created_at.isoformat(),
-            'url': f'/api/files/{f.uid}'
+            'url': f'/api/files/{f.uid}',
+            'thumb_url': thumbnails.thumb_url(f)
         })
     return jsonify(result), 200
 
@@ -121,12 +249,67 @@ def download_file(uid):
     current_user_id = int(get_jwt_identity())
     file = File.query.filter_by(uid=uid).first_or_404()
     
-    if not TeamMember.query.filter_by(team_id=file.team_id, user_id=current_user_id).first():
+    if not is_member(file.team_id, current_user_id):
         return jsonify({'message': 'Access denied'}), 403
         
     inline = request.args.get('inline') == 'true'
     
-    return send_from_directory(current_app.config['UPLOAD_FOLDER'], file.filepath, as_attachment=not inline, download_name=file.filename)
+    # The bytes come from the signed URL, which needs no token or database
+    url, _ = signed_url(file, inline)
+    response = redirect(url)
+    # The link stays valid at least this long, so the redirect can be reused too
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config['DOWNLOAD_URL_TTL']
+    return response
+
+@bp.route('/<string:uid>/url', methods=['GET'])
+@jwt_required()
+def get_download_url(uid):
+    current_user_id = int(get_jwt_identity())
+    file = File.query.filter_by(uid=uid).first_or_404()
+    
+    if not is_member(file.team_id, current_user_id):
+        return jsonify({'message': 'Access denied'}), 403
+        
+    url, expires = signed_url(file, request.args.get('inline') == 'true')
+    return jsonify({'url': url, 'expires_at': datetime.utcfromtimestamp(expires).isoformat()}), 200
+
+@bp.route('/<string:uid>/thumb', methods=['GET'])
+@jwt_required()
+def get_thumbnail(uid):
+    current_user_id = int(get_jwt_identity())
+    file = File.query.filter_by(uid=uid).first_or_404()
+    
+    if not is_member(file.team_id, current_user_id):
+        return jsonify({'message': 'Access denied'}), 403
+        
+    sizes = current_app.config['THUMB_SIZES']
+    size = request.args.get('size', sizes[0], type=int)
+    if size not in sizes:
+        return jsonify({'message': 'Unsupported size', 'sizes': sizes}), 400
+        
+    path = thumbnails.ready(file, size)
+    if path:
+        return send_stored(path, etag=f'{file.uid}-{size}')
+        
+    # Not rendered yet (or not previewable): a neutral 1x1 image the client scales
+    response = current_app.response_class(thumbnails.PLACEHOLDER, mimetype='image/png')
+    response.headers['Retry-After'] = '2'
+    response.cache_control.no_store = True
+    return response
+
+@bp.route('/signed/<string:uid>', methods=['GET'])
+def download_signed(uid):
+    if not check_signature(uid, request.args):
+        return jsonify({'message': 'Link invalid or expired'}), 403
+        
+    filepath = db.session.query(File.filepath).filter_by(uid=uid).scalar()
+    if filepath is None:
+        return jsonify({'message': 'File not found'}), 404
+        
+    # A uid always serves the same bytes, so its hash (or the uid) is a strong validator
+    return send_stored(filepath, etag=request.args.get('v'), as_attachment=request.args.get('inline') != '1',
+                       download_name=request.args.get('name'))
 
 @bp.route('/<string:uid>', methods=['DELETE'])
 @jwt_required()
@@ -138,14 +321,15 @@ def delete_file(uid):
          # Check if user is creator of team? For now just uploader.
          return jsonify({'message': 'Only uploader can delete file'}), 403
          
-    if not TeamMember.query.filter_by(team_id=file.team_id, user_id=current_user_id).first():
+    if not is_member(file.team_id, current_user_id):
         return jsonify({'message': 'Access denied'}), 403
         
-    # Remove from disk
-    try:
-        os.remove(os.path.join(current_app.config['UPLOAD_FOLDER'], file.filepath))
-    except OSError:
-        pass # File might be already gone
+    # Blob-backed content is released when the row goes, see app.blobs
+    if file.blob_id is None:
+        try:
+            os.remove(os.path.join(current_app.config['UPLOAD_FOLDER'], file.filepath))
+        except OSError:
+            pass # File might be already gone
         
     db.session.delete(file)
     db.session.commit()
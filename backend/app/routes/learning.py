@@ -1,7 +1,8 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import get_jwt_identity, jwt_required
-from app.models import LearningProgress, TeamMember, User
+from app.models import LearningProgress, User
 from app import db
+from app.authz import is_member
 from datetime import datetime
 
 bp = Blueprint('learning', __name__)
@@ -11,7 +12,7 @@ bp = Blueprint('learning', __name__)
 def get_team_learning_progress(team_id):
     current_user_id = int(get_jwt_identity())
     
-    if not TeamMember.query.filter_by(team_id=team_id, user_id=current_user_id).first():
+    if not is_member(team_id, current_user_id):
         return jsonify({'message': 'Access denied'}), 403
         
     # Get all progress entries for this team
@@ -49,7 +50,7 @@ def update_learning_progress():
     if not team_id or not content:
         return jsonify({'message': 'Team ID and Content are required'}), 400
         
-    if not TeamMember.query.filter_by(team_id=team_id, user_id=current_user_id).first():
+    if not is_member(team_id, current_user_id):
         return jsonify({'message': 'Access denied'}), 403
         
     # Create new entry (log style)
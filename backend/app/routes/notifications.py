@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import get_jwt_identity, jwt_required
-from app.models import Notification
+from app.models import Notification, User
+from app.pagination import wants_page, page_args, keyset_page, CursorError
+from app.services import adjust_unread
 from app import db
 
 bp = Blueprint('notifications', __name__)
@@ -9,7 +11,19 @@ bp = Blueprint('notifications', __name__)
 @jwt_required()
 def get_notifications():
     current_user_id = get_jwt_identity()
-    notifications = Notification.query.filter_by(user_id=current_user_id).order_by(Notification.created_at.desc()).all()
+    query = Notification.query.filter_by(user_id=current_user_id)
+    if request.args.get('unread', '').lower() in ('1', 'true'):
+        query = query.filter_by(is_read=False)
+
+    next_cursor = None
+    if wants_page():
+        try:
+            limit, before = page_args()
+        except CursorError:
+            return jsonify({'message': 'Invalid cursor'}), 400
+        notifications, next_cursor = keyset_page(query, Notification.created_at, Notification.id, limit, before)
+    else:
+        notifications = query.order_by(Notification.created_at.desc()).all()
     
     result = []
     for notif in notifications:
@@ -19,10 +33,20 @@ def get_notifications():
             'content': notif.content,
             'related_id': notif.related_id,
             'is_read': notif.is_read,
+            'count': notif.count,
             'created_at': notif.created_at.isoformat()
         })
+    if wants_page():
+        return jsonify({'items': result, 'next_cursor': next_cursor}), 200
     return jsonify(result), 200
 
+@bp.route('/unread-count', methods=['GET'])
+@jwt_required()
+def get_unread_count():
+    current_user_id = get_jwt_identity()
+    count = db.session.query(User.unread_notifications).filter(User.id == current_user_id).scalar()
+    return jsonify({'unread_count': max(count or 0, 0)}), 200
+
 @bp.route('/<int:id>/read', methods=['PUT'])
 @jwt_required()
 def mark_read(id):
@@ -40,7 +64,10 @@ def mark_read(id):
     if notif.user_id != current_user_id:
         return jsonify({'message': 'Access denied'}), 403
         
-    notif.is_read = True
+    # Conditional update so two concurrent requests only decrement once
+    changed = Notification.query.filter_by(id=id, is_read=False).update({'is_read': True})
+    if changed:
+        db.session.execute(adjust_unread([current_user_id], -changed))
     db.session.commit()
     
     return jsonify({'message': 'Marked as read'}), 200
@@ -49,7 +76,9 @@ def mark_read(id):
 @jwt_required()
 def mark_all_read():
     current_user_id = get_jwt_identity()
-    Notification.query.filter_by(user_id=current_user_id, is_read=False).update({'is_read': True})
+    changed = Notification.query.filter_by(user_id=current_user_id, is_read=False).update({'is_read': True})
+    if changed:
+        db.session.execute(adjust_unread([current_user_id], -changed))
     db.session.commit()
     
     return jsonify({'message': 'All marked as read'}), 200
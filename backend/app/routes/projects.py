@@ -1,7 +1,9 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import get_jwt_identity, jwt_required
-from app.models import Project, TeamMember
+from app.models import Project, GanttTombstone
 from app import db
+from app.authz import is_member, load_project
+from app.rollup import project_progress
 from datetime import datetime
 
 bp = Blueprint('projects', __name__)
@@ -16,7 +18,7 @@ def get_projects():
         return jsonify({'message': 'Team ID required'}), 400
         
     # Check if user is member of team
-    if not TeamMember.query.filter_by(team_id=team_id, user_id=current_user_id).first():
+    if not is_member(team_id, current_user_id):
         return jsonify({'message': 'Access denied'}), 403
         
     projects = Project.query.filter_by(team_id=team_id).all()
@@ -31,7 +33,10 @@ def get_projects():
             'start_date': project.start_date.isoformat() if project.start_date else None,
             'end_date': project.end_date.isoformat() if project.end_date else None,
             'created_by': project.created_by,
-            'created_at': project.created_at
+            'created_at': project.created_at,
+            'progress': project_progress(project),
+            'task_count': project.task_count,
+            'completed_count': project.completed_count
         })
     return jsonify(result), 200
 
@@ -49,7 +54,7 @@ def create_project():
     if not team_id or not name:
         return jsonify({'message': 'Team ID and Name required'}), 400
         
-    if not TeamMember.query.filter_by(team_id=team_id, user_id=current_user_id).first():
+    if not is_member(team_id, current_user_id):
         return jsonify({'message': 'Access denied'}), 403
         
     project = Project(
@@ -73,9 +78,9 @@ def create_project():
 @jwt_required()
 def get_project(id):
     current_user_id = get_jwt_identity()
-    project = Project.query.get_or_404(id)
+    project, allowed = load_project(id, current_user_id)
     
-    if not TeamMember.query.filter_by(team_id=project.team_id, user_id=current_user_id).first():
+    if not allowed:
         return jsonify({'message': 'Access denied'}), 403
         
     return jsonify({
@@ -87,16 +92,19 @@ def get_project(id):
         'start_date': project.start_date.isoformat() if project.start_date else None,
         'end_date': project.end_date.isoformat() if project.end_date else None,
         'created_by': project.created_by,
-        'created_at': project.created_at
+        'created_at': project.created_at,
+        'progress': project_progress(project),
+        'task_count': project.task_count,
+        'completed_count': project.completed_count
     }), 200
 
 @bp.route('/<int:id>', methods=['PUT'])
 @jwt_required()
 def update_project(id):
     current_user_id = get_jwt_identity()
-    project = Project.query.get_or_404(id)
+    project, allowed = load_project(id, current_user_id)
     
-    if not TeamMember.query.filter_by(team_id=project.team_id, user_id=current_user_id).first():
+    if not allowed:
         return jsonify({'message': 'Access denied'}), 403
         
     data = request.get_json()
@@ -116,9 +124,9 @@ def update_project(id):
 @jwt_required()
 def delete_project(id):
     current_user_id = get_jwt_identity()
-    project = Project.query.get_or_404(id)
+    project, allowed = load_project(id, current_user_id)
     
-    if not TeamMember.query.filter_by(team_id=project.team_id, user_id=current_user_id).first():
+    if not allowed:
         return jsonify({'message': 'Access denied'}), 403
         
     # Check if user is creator or team admin (if we had admins)
@@ -126,6 +134,7 @@ def delete_project(id):
     # Design doc: "删除项目" is listed in "项目管理模块" -> "项目归档/删除".
     # Assume any member can delete for now or just creator. Let's stick to any member for flat structure unless specified.
     
+    GanttTombstone.query.filter_by(project_id=project.id).delete(synchronize_session=False)
     db.session.delete(project)
     db.session.commit()
     
@@ -1,7 +1,8 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import get_jwt_identity, jwt_required
-from app.models import TeamResource, TeamMember, Team
+from app.models import TeamResource, Team
 from app import db
+from app.authz import is_member
 
 bp = Blueprint('resources', __name__)
 
@@ -14,7 +15,7 @@ def get_resources():
     if not team_id:
         return jsonify({'message': 'Team ID required'}), 400
         
-    if not TeamMember.query.filter_by(team_id=team_id, user_id=current_user_id).first():
+    if not is_member(team_id, current_user_id):
         return jsonify({'message': 'Access denied'}), 403
         
     resources = TeamResource.query.filter_by(team_id=team_id).order_by(TeamResource.created_at.desc()).all()
@@ -42,7 +43,7 @@ def create_resource():
     if not team_id or not title:
         return jsonify({'message': 'Team ID and Title required'}), 400
         
-    if not TeamMember.query.filter_by(team_id=team_id, user_id=current_user_id).first():
+    if not is_member(team_id, current_user_id):
         return jsonify({'message': 'Access denied'}), 403
         
     resource = TeamResource(
@@ -62,7 +63,7 @@ def get_resource(id):
     current_user_id = get_jwt_identity()
     resource = TeamResource.query.get_or_404(id)
     
-    if not TeamMember.query.filter_by(team_id=resource.team_id, user_id=current_user_id).first():
+    if not is_member(resource.team_id, current_user_id):
         return jsonify({'message': 'Access denied'}), 403
         
     return jsonify({
@@ -80,7 +81,7 @@ def update_resource(id):
     current_user_id = get_jwt_identity()
     resource = TeamResource.query.get_or_404(id)
     
-    if not TeamMember.query.filter_by(team_id=resource.team_id, user_id=current_user_id).first():
+    if not is_member(resource.team_id, current_user_id):
         return jsonify({'message': 'Access denied'}), 403
         
     # Optional: Check if user is creator? Or allow any member to edit?
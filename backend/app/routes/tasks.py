@@ -1,9 +1,18 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, make_response
 from flask_jwt_extended import get_jwt_identity, jwt_required
-from app.models import Task, TaskParticipant, Project, TeamMember, User, TaskComment, TaskMessage, TaskActivity, TaskLink
+from app.models import Task, TaskParticipant, User, TaskComment, TaskMessage, TaskActivity, TaskLink
 from app import db
 from datetime import datetime
-from app.services import log_activity, notify_task_participants
+from sqlalchemy.exc import IntegrityError
+from app.services import log_activity, notify_task_participants, load_task_tree, load_gantt_data, load_participants, load_tasks
+from app.hierarchy import assign_path, get_ancestors, subtree_criteria, is_descendant, move_subtree, fits_under, PathTooLongError
+from app.revisions import touch, bump_revision, record_deletions, load_changes, can_sync_from
+from app.link_graph import get_link_graph, forget_edge
+from app import rollup
+from app.bulk import apply_bulk, BulkError
+from app.authz import is_member, task_team_id, load_task, load_project
+from app.pagination import wants_page, page_args, keyset_page, CursorError
+from app.scheduling import schedule_project, serialize_schedule, apply_schedule, ScheduleCycleError
 
 bp = Blueprint('tasks', __name__)
 
@@ -16,16 +25,33 @@ def get_gantt_data():
     if not project_id:
         return jsonify({'message': 'Project ID required'}), 400
         
-    project = Project.query.get_or_404(project_id)
-    if not TeamMember.query.filter_by(team_id=project.team_id, user_id=current_user_id).first():
+    project, allowed = load_project(project_id, current_user_id)
+    if not allowed:
         return jsonify({'message': 'Access denied'}), 403
         
-    tasks = Task.query.filter_by(project_id=project_id).order_by(Task.sort_order).all()
-    
-    # Get all task IDs for this project to filter links
-    task_ids = [t.id for t in tasks]
-    
-    links = TaskLink.query.filter(TaskLink.source.in_(task_ids)).all()
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            since = -1
+        if since < 0:
+            return jsonify({'message': 'since must be a non-negative integer'}), 400
+        if not can_sync_from(project, since):
+            # Deletions that old are no longer tracked; start over
+            since = None
+        
+    etag = f'{project.id}-{project.revision}'
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+        
+    if since is not None:
+        tasks, links, deleted = load_changes(project.id, since)
+    else:
+        tasks, links = load_gantt_data(project_id)
+        deleted = None
     
     task_data = []
     for task in tasks:
@@ -44,11 +70,74 @@ def get_gantt_data():
         
     link_data = [{'id': l.id, 'source': l.source, 'target': l.target, 'type': l.type} for l in links]
     
-    return jsonify({
+    payload = {
         'data': task_data,
-        'links': link_data
+        'links': link_data,
+        'revision': project.revision
+    }
+    if deleted is not None:
+        payload['deleted'] = deleted
+        
+    response = make_response(jsonify(payload), 200)
+    response.set_etag(etag)
+    return response
+
+@bp.route('/schedule', methods=['GET', 'POST'])
+@jwt_required()
+def get_schedule():
+    current_user_id = get_jwt_identity()
+    project_id = request.args.get('project_id')
+    
+    if not project_id:
+        return jsonify({'message': 'Project ID required'}), 400
+        
+    project, allowed = load_project(project_id, current_user_id)
+    if not allowed:
+        return jsonify({'message': 'Access denied'}), 403
+        
+    try:
+        schedule, order, current = schedule_project(project)
+    except ScheduleCycleError as e:
+        return jsonify({'message': 'Dependency cycle detected', 'task_ids': e.task_ids}), 409
+        
+    # POST applies the earliest dates to every task that has to move
+    updated = []
+    if request.method == 'POST':
+        updated = apply_schedule(project.id, schedule, current)
+        db.session.commit()
+        
+    tasks = serialize_schedule(schedule, order)
+    return jsonify({
+        'tasks': tasks,
+        'critical_path': [t['id'] for t in tasks if t['critical']],
+        'project_finish': max((t['earliest_finish'] for t in tasks if t['earliest_finish']), default=None),
+        'updated': updated
     }), 200
 
+@bp.route('/bulk', methods=['POST'])
+@jwt_required()
+def bulk_tasks():
+    current_user_id = get_jwt_identity()
+    data = request.get_json()
+    project_id = data.get('project_id')
+    
+    if not project_id:
+        return jsonify({'message': 'Project ID required'}), 400
+        
+    project, allowed = load_project(project_id, current_user_id)
+    if not allowed:
+        return jsonify({'message': 'Access denied'}), 403
+        
+    try:
+        result = apply_bulk(project, current_user_id, data.get('operations'))
+    except BulkError as e:
+        db.session.rollback()
+        return jsonify({'message': e.message, 'index': e.index}), 400
+    db.session.commit()
+    
+    result['message'] = 'Bulk operations applied'
+    return jsonify(result), 200
+
 @bp.route('/links', methods=['POST'])
 @jwt_required()
 def create_link():
@@ -62,9 +151,29 @@ def create_link():
     if not source or not target:
         return jsonify({'message': 'Source and Target required'}), 400
         
-    # Verify access (omitted for brevity, but should check if user can edit these tasks)
-    
-    link = TaskLink(source=source, target=target, type=link_type)
+    source_task = Task.query.get(source)
+    target_task = Task.query.get(target)
+    if not source_task or not target_task:
+        return jsonify({'message': 'Invalid source or target task'}), 400
+    if source_task.project_id != target_task.project_id:
+        return jsonify({'message': 'Linked tasks must belong to the same project'}), 400
+        
+    if not is_member(task_team_id(source_task.id), current_user_id):
+        return jsonify({'message': 'Access denied'}), 403
+        
+    # Bumping the revision first locks the project row, so the cached graph
+    # checked below cannot race with another link insert.
+    revision = bump_revision(source_task.project_id)
+    graph = get_link_graph(source_task.project_id, revision - 1)
+    if graph.has_edge(source_task.id, target_task.id):
+        db.session.rollback()
+        return jsonify({'message': 'Link already exists'}), 409
+    if not graph.add_edge(source_task.id, target_task.id):
+        db.session.rollback()
+        return jsonify({'message': 'Link would create a dependency cycle'}), 409
+    graph.revision = revision
+    
+    link = TaskLink(source=source_task.id, target=target_task.id, type=link_type, revision=revision)
     db.session.add(link)
     db.session.commit()
     
@@ -73,8 +182,15 @@ def create_link():
 @bp.route('/links/<int:id>', methods=['DELETE'])
 @jwt_required()
 def delete_link(id):
+    current_user_id = get_jwt_identity()
     link = TaskLink.query.get_or_404(id)
+    source_task, allowed = load_task(link.source, current_user_id)
+    if not allowed:
+        return jsonify({'message': 'Access denied'}), 403
+        
     db.session.delete(link)
+    revision = record_deletions(source_task.project_id, link_ids=[link.id])
+    forget_edge(source_task.project_id, link.source, link.target, revision)
     db.session.commit()
     return jsonify({'message': 'Link deleted'}), 200
 
@@ -88,44 +204,12 @@ def get_tasks():
     if not project_id:
         return jsonify({'message': 'Project ID required'}), 400
         
-    project = Project.query.get_or_404(project_id)
-    if not TeamMember.query.filter_by(team_id=project.team_id, user_id=current_user_id).first():
+    project, allowed = load_project(project_id, current_user_id)
+    if not allowed:
         return jsonify({'message': 'Access denied'}), 403
         
-    query = Task.query.filter_by(project_id=project_id)
-    
-    # If fetch_all is not true, filter by parent_id (default to root tasks)
-    if request.args.get('fetch_all') != 'true':
-        if parent_id:
-            query = query.filter_by(parent_id=parent_id)
-        else:
-            query = query.filter_by(parent_id=None)
-        
-    tasks = query.order_by(Task.sort_order).all()
-    
-    result = []
-    for task in tasks:
-        # Get participants
-        participants = db.session.query(User).join(TaskParticipant).filter(TaskParticipant.task_id == task.id).all()
-        participant_data = [{'id': u.id, 'username': u.username, 'nickname': u.nickname, 'avatar': u.avatar} for u in participants]
-        
-        # Check if has subtasks
-        has_subtasks = Task.query.filter_by(parent_id=task.id).count() > 0
-        
-        result.append({
-            'id': task.id,
-            'parent_id': task.parent_id,
-            'title': task.title,
-            'description': task.description,
-            'status': task.status,
-            'priority': task.priority,
-            'progress': task.progress,
-            'start_date': task.start_date.isoformat() if task.start_date else None,
-            'end_date': task.end_date.isoformat() if task.end_date else None,
-            'participants': participant_data,
-            'has_subtasks': has_subtasks,
-            'level': task.level
-        })
+    fetch_all = request.args.get('fetch_all') == 'true'
+    result = load_task_tree(project_id, parent_id=parent_id, fetch_all=fetch_all)
     return jsonify(result), 200
 
 @bp.route('', methods=['POST'])
@@ -140,52 +224,56 @@ def create_task():
     if not project_id or not title:
         return jsonify({'message': 'Project ID and Title required'}), 400
         
-    project = Project.query.get_or_404(project_id)
-    if not TeamMember.query.filter_by(team_id=project.team_id, user_id=current_user_id).first():
+    project, allowed = load_project(project_id, current_user_id)
+    if not allowed:
         return jsonify({'message': 'Access denied'}), 403
         
-    level = 0
+    parent = None
     if parent_id:
         parent = Task.query.get(parent_id)
-        if parent:
-            level = parent.level + 1
+        if not parent or parent.project_id != project.id:
+            return jsonify({'message': 'Invalid parent task'}), 400
             
     task = Task(
         project_id=project_id,
+        team_id=project.team_id,
         parent_id=parent_id,
         title=title,
         description=data.get('description'),
         priority=data.get('priority', 'medium'),
         start_date=datetime.strptime(data['start_date'], '%Y-%m-%d').date() if data.get('start_date') else None,
         end_date=datetime.strptime(data['end_date'], '%Y-%m-%d').date() if data.get('end_date') else None,
-        created_by=current_user_id,
-        level=level
+        created_by=current_user_id
     )
     
     db.session.add(task)
     db.session.flush()  # Get task.id before commit
+    try:
+        assign_path(task, parent)
+    except PathTooLongError as e:
+        db.session.rollback()
+        return jsonify({'message': str(e)}), 400
+    rollup.attach(task, touch(project.id, task))
     
     # Add creator as task participant
     participant = TaskParticipant(task_id=task.id, user_id=current_user_id)
     db.session.add(participant)
+    log_activity(task.id, current_user_id, 'created_task', {'title': title})
     
     db.session.commit()
     
-    log_activity(task.id, current_user_id, 'created_task', {'title': title})
-    
     return jsonify({'message': 'Task created successfully', 'id': task.id}), 201
 
 @bp.route('/<int:id>', methods=['GET'])
 @jwt_required()
 def get_task(id):
     current_user_id = get_jwt_identity()
-    task = Task.query.get_or_404(id)
-    project = Project.query.get(task.project_id)
+    task, allowed = load_task(id, current_user_id)
     
-    if not TeamMember.query.filter_by(team_id=project.team_id, user_id=current_user_id).first():
+    if not allowed:
         return jsonify({'message': 'Access denied'}), 403
         
-    participants = db.session.query(User).join(TaskParticipant).filter(TaskParticipant.task_id == task.id).all()
+    participants = load_participants([Task.id == task.id])
     
     return jsonify({
         'id': task.id,
@@ -198,7 +286,7 @@ def get_task(id):
         'progress': task.progress,
         'start_date': task.start_date.isoformat() if task.start_date else None,
         'end_date': task.end_date.isoformat() if task.end_date else None,
-        'participants': [{'id': u.id, 'username': u.username, 'nickname': u.nickname, 'avatar': u.avatar} for u in participants],
+        'participants': participants.get(task.id, []),
         'created_by': task.created_by,
         'created_at': task.created_at
     }), 200
@@ -207,30 +295,48 @@ def get_task(id):
 @jwt_required()
 def delete_task(id):
     current_user_id = get_jwt_identity()
-    task = Task.query.get_or_404(id)
-    project = Project.query.get(task.project_id)
+    task, allowed = load_task(id, current_user_id)
     
-    if not TeamMember.query.filter_by(team_id=project.team_id, user_id=current_user_id).first():
+    if not allowed:
         return jsonify({'message': 'Access denied'}), 403
         
+    # Drop the whole subtree's links too and leave tombstones for gantt sync
+    task_ids = [row[0] for row in db.session.query(Task.id).filter(*subtree_criteria(task)).all()] or [task.id]
+    links = TaskLink.query.filter(TaskLink.source.in_(task_ids) | TaskLink.target.in_(task_ids)).all()
+    link_ids = [l.id for l in links]
+    for link in links:
+        db.session.delete(link)
+    revision = record_deletions(task.project_id, task_ids=task_ids, link_ids=link_ids)
+    rollup.detach(task, revision)
+    
+    # The task's own history goes with it, so record the deletion on the parent
+    if task.parent_id:
+        log_activity(task.parent_id, current_user_id, 'deleted_task', {'title': task.title})
+    
     db.session.delete(task)
     db.session.commit()
     
-    log_activity(task.project_id, current_user_id, 'deleted_task', {'title': task.title})
-    
     return jsonify({'message': 'Task deleted successfully'}), 200
 
 @bp.route('/<int:id>', methods=['PUT'])
 @jwt_required()
 def update_task(id):
     current_user_id = get_jwt_identity()
-    task = Task.query.get_or_404(id)
-    project = Project.query.get(task.project_id)
+    task, allowed = load_task(id, current_user_id)
     
-    if not TeamMember.query.filter_by(team_id=project.team_id, user_id=current_user_id).first():
+    if not allowed:
         return jsonify({'message': 'Access denied'}), 403
         
     data = request.get_json()
+    new_parent = None
+    moving = 'parent_id' in data and data['parent_id'] != task.parent_id
+    if moving:
+        new_parent, error = _resolve_new_parent(task, data['parent_id'])
+        if error:
+            return error
+            
+    old_progress, old_status = task.progress, task.status
+    revision = touch(task.project_id, task)
     task.title = data.get('title', task.title)
     task.description = data.get('description', task.description)
     task.status = data.get('status', task.status)
@@ -242,21 +348,94 @@ def update_task(id):
     if 'end_date' in data:
         task.end_date = datetime.strptime(data['end_date'], '%Y-%m-%d').date() if data['end_date'] else None
         
-    db.session.commit()
-    
+    rollup.changed(task, old_progress, old_status, revision)
+    if moving:
+        _move_task(task, new_parent, revision)
+        
     log_activity(task.id, current_user_id, 'updated_task', data)
     notify_task_participants(task.id, 'task_update', f'任务 "{task.title}" 已更新', exclude_user_id=current_user_id)
+    db.session.commit()
     
     return jsonify({'message': 'Task updated successfully'}), 200
 
+def _resolve_new_parent(task, parent_id):
+    if not parent_id:
+        return None, None
+    new_parent = Task.query.get(parent_id)
+    if not new_parent or new_parent.project_id != task.project_id:
+        return None, (jsonify({'message': 'Invalid parent task'}), 400)
+    if is_descendant(task, new_parent):
+        return None, (jsonify({'message': 'Cannot move a task under itself'}), 400)
+    if not fits_under(task, new_parent):
+        return None, (jsonify({'message': str(PathTooLongError())}), 400)
+    return new_parent, None
+
+def _move_task(task, new_parent, revision):
+    rollup.detach(task, revision)
+    move_subtree(task, new_parent)
+    rollup.attach(task, revision)
+
+@bp.route('/<int:id>/subtree', methods=['GET'])
+@jwt_required()
+def get_subtree(id):
+    current_user_id = get_jwt_identity()
+    task, allowed = load_task(id, current_user_id)
+    
+    if not allowed:
+        return jsonify({'message': 'Access denied'}), 403
+        
+    result = load_tasks(task.project_id, subtree_criteria(task), order_by=(Task.level, Task.sort_order))
+    return jsonify(result), 200
+
+@bp.route('/<int:id>/ancestors', methods=['GET'])
+@jwt_required()
+def get_task_ancestors(id):
+    current_user_id = get_jwt_identity()
+    task, allowed = load_task(id, current_user_id)
+    
+    if not allowed:
+        return jsonify({'message': 'Access denied'}), 403
+        
+    result = []
+    for ancestor in get_ancestors(task):
+        result.append({
+            'id': ancestor.id,
+            'parent_id': ancestor.parent_id,
+            'title': ancestor.title,
+            'status': ancestor.status,
+            'level': ancestor.level
+        })
+    return jsonify(result), 200
+
+@bp.route('/<int:id>/move', methods=['POST'])
+@jwt_required()
+def move_task(id):
+    current_user_id = get_jwt_identity()
+    task, allowed = load_task(id, current_user_id)
+    
+    if not allowed:
+        return jsonify({'message': 'Access denied'}), 403
+        
+    data = request.get_json()
+    new_parent, error = _resolve_new_parent(task, data.get('parent_id'))
+    if error:
+        return error
+        
+    _move_task(task, new_parent, touch(task.project_id, task))
+    if 'sort_order' in data:
+        task.sort_order = data['sort_order']
+    log_activity(task.id, current_user_id, 'moved_task', {'parent_id': task.parent_id})
+    db.session.commit()
+    
+    return jsonify({'message': 'Task moved successfully', 'level': task.level}), 200
+
 @bp.route('/<int:id>/join', methods=['POST'])
 @jwt_required()
 def join_task(id):
     current_user_id = get_jwt_identity()
-    task = Task.query.get_or_404(id)
-    project = Project.query.get(task.project_id)
+    task, allowed = load_task(id, current_user_id)
     
-    if not TeamMember.query.filter_by(team_id=project.team_id, user_id=current_user_id).first():
+    if not allowed:
         return jsonify({'message': 'Access denied'}), 403
         
     if TaskParticipant.query.filter_by(task_id=id, user_id=current_user_id).first():
@@ -264,10 +443,14 @@ def join_task(id):
         
     participant = TaskParticipant(task_id=id, user_id=current_user_id)
     db.session.add(participant)
-    db.session.commit()
-    
     log_activity(id, current_user_id, 'joined_task')
     notify_task_participants(id, 'member_join', f'有人加入了任务 "{task.title}"', exclude_user_id=current_user_id)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Lost a race with a concurrent join of the same user
+        db.session.rollback()
+        return jsonify({'message': 'Already joined'}), 400
     
     return jsonify({'message': 'Joined task successfully'}), 200
 
@@ -289,13 +472,22 @@ def leave_task(id):
 @jwt_required()
 def get_comments(id):
     current_user_id = get_jwt_identity()
-    task = Task.query.get_or_404(id)
-    project = Project.query.get(task.project_id)
+    task, allowed = load_task(id, current_user_id)
     
-    if not TeamMember.query.filter_by(team_id=project.team_id, user_id=current_user_id).first():
+    if not allowed:
         return jsonify({'message': 'Access denied'}), 403
         
-    comments = db.session.query(TaskComment, User).join(User, TaskComment.user_id == User.id).filter(TaskComment.task_id == id).order_by(TaskComment.created_at).all()
+    query = db.session.query(TaskComment, User).join(User, TaskComment.user_id == User.id).filter(TaskComment.task_id == id)
+    next_cursor = None
+    if wants_page():
+        try:
+            limit, before = page_args()
+        except CursorError:
+            return jsonify({'message': 'Invalid cursor'}), 400
+        comments, next_cursor = keyset_page(query, TaskComment.created_at, TaskComment.id, limit, before)
+        comments.reverse() # oldest first within a page, like the full list
+    else:
+        comments = query.order_by(TaskComment.created_at, TaskComment.id).all()
     
     result = []
     for comment, user in comments:
@@ -309,16 +501,17 @@ def get_comments(id):
             'reply_to': comment.reply_to,
             'created_at': comment.created_at.isoformat()
         })
+    if wants_page():
+        return jsonify({'items': result, 'next_cursor': next_cursor}), 200
     return jsonify(result), 200
 
 @bp.route('/<int:id>/comments', methods=['POST'])
 @jwt_required()
 def add_comment(id):
     current_user_id = get_jwt_identity()
-    task = Task.query.get_or_404(id)
-    project = Project.query.get(task.project_id)
+    task, allowed = load_task(id, current_user_id)
     
-    if not TeamMember.query.filter_by(team_id=project.team_id, user_id=current_user_id).first():
+    if not allowed:
         return jsonify({'message': 'Access denied'}), 403
         
     data = request.get_json()
@@ -335,10 +528,9 @@ def add_comment(id):
         reply_to=reply_to
     )
     db.session.add(comment)
-    db.session.commit()
-    
     log_activity(id, current_user_id, 'added_comment')
     notify_task_participants(id, 'new_comment', f'任务 "{task.title}" 有新评论', exclude_user_id=current_user_id)
+    db.session.commit()
     
     return jsonify({
         'id': comment.id,
@@ -350,13 +542,22 @@ def add_comment(id):
 @jwt_required()
 def get_messages(id):
     current_user_id = get_jwt_identity()
-    task = Task.query.get_or_404(id)
-    project = Project.query.get(task.project_id)
+    task, allowed = load_task(id, current_user_id)
     
-    if not TeamMember.query.filter_by(team_id=project.team_id, user_id=current_user_id).first():
+    if not allowed:
         return jsonify({'message': 'Access denied'}), 403
         
-    messages = db.session.query(TaskMessage, User).join(User, TaskMessage.user_id == User.id).filter(TaskMessage.task_id == id).order_by(TaskMessage.created_at).all()
+    query = db.session.query(TaskMessage, User).join(User, TaskMessage.user_id == User.id).filter(TaskMessage.task_id == id)
+    next_cursor = None
+    if wants_page():
+        try:
+            limit, before = page_args()
+        except CursorError:
+            return jsonify({'message': 'Invalid cursor'}), 400
+        messages, next_cursor = keyset_page(query, TaskMessage.created_at, TaskMessage.id, limit, before)
+        messages.reverse()
+    else:
+        messages = query.order_by(TaskMessage.created_at, TaskMessage.id).all()
     
     result = []
     for message, user in messages:
@@ -369,19 +570,29 @@ def get_messages(id):
             'content': message.content,
             'created_at': message.created_at.isoformat()
         })
+    if wants_page():
+        return jsonify({'items': result, 'next_cursor': next_cursor}), 200
     return jsonify(result), 200
 
 @bp.route('/<int:id>/activities', methods=['GET'])
 @jwt_required()
 def get_activities(id):
     current_user_id = get_jwt_identity()
-    task = Task.query.get_or_404(id)
-    project = Project.query.get(task.project_id)
+    task, allowed = load_task(id, current_user_id)
     
-    if not TeamMember.query.filter_by(team_id=project.team_id, user_id=current_user_id).first():
+    if not allowed:
         return jsonify({'message': 'Access denied'}), 403
         
-    activities = db.session.query(TaskActivity, User).join(User, TaskActivity.user_id == User.id).filter(TaskActivity.task_id == id).order_by(TaskActivity.created_at.desc()).all()
+    query = db.session.query(TaskActivity, User).join(User, TaskActivity.user_id == User.id).filter(TaskActivity.task_id == id)
+    next_cursor = None
+    if wants_page():
+        try:
+            limit, before = page_args()
+        except CursorError:
+            return jsonify({'message': 'Invalid cursor'}), 400
+        activities, next_cursor = keyset_page(query, TaskActivity.created_at, TaskActivity.id, limit, before)
+    else:
+        activities = query.order_by(TaskActivity.created_at.desc(), TaskActivity.id.desc()).all()
     
     result = []
     for activity, user in activities:
@@ -395,4 +606,6 @@ def get_activities(id):
             'detail': activity.detail,
             'created_at': activity.created_at.isoformat()
         })
+    if wants_page():
+        return jsonify({'items': result, 'next_cursor': next_cursor}), 200
     return jsonify(result), 200
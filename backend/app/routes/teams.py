@@ -1,7 +1,14 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import get_jwt_identity, jwt_required
-from app.models import Team, TeamMember, User, Project, Task, TeamMessage
-from app import db
+from app.models import Team, TeamMember, User, Task, TeamMessage
+from app.socket_sessions import revoke_membership
+from app.pagination import wants_page, page_args, keyset_page, CursorError
+from app.services import load_message_files
+from app.chat import mark_read, unread_counts, latest_message
+from app import db, thumbnails
+from app.authz import is_member, forget
+from sqlalchemy.orm import joinedload
+from sqlalchemy.exc import IntegrityError
 import uuid
 
 bp = Blueprint('teams', __name__)
@@ -64,7 +71,7 @@ def get_team(id):
     team = Team.query.get_or_404(id)
     
     # Check if user is member
-    if not TeamMember.query.filter_by(team_id=id, user_id=current_user_id).first():
+    if not is_member(id, current_user_id):
         return jsonify({'message': 'Access denied'}), 403
         
     return jsonify({
@@ -91,7 +98,7 @@ def update_team(id):
     # Design Doc 3.2: "编辑团队信息" isn't assigned. But "解散团队" is "创建者".
     # Let's assume any member can edit info for now to follow "Flat".
     
-    if not TeamMember.query.filter_by(team_id=id, user_id=current_user_id).first():
+    if not is_member(id, current_user_id):
         return jsonify({'message': 'Access denied'}), 403
         
     data = request.get_json()
@@ -115,6 +122,7 @@ def delete_team(id):
     TeamMember.query.filter_by(team_id=id).delete()
     db.session.delete(team)
     db.session.commit()
+    revoke_membership(id)
     
     return jsonify({'message': 'Team dissolved successfully'}), 200
 
@@ -122,7 +130,7 @@ def delete_team(id):
 @jwt_required()
 def get_members(id):
     current_user_id = get_jwt_identity()
-    if not TeamMember.query.filter_by(team_id=id, user_id=current_user_id).first():
+    if not is_member(id, current_user_id):
         return jsonify({'message': 'Access denied'}), 403
         
     members = db.session.query(TeamMember, User).join(User, TeamMember.user_id == User.id).filter(TeamMember.team_id == id).all()
@@ -143,7 +151,7 @@ def get_members(id):
 @jwt_required()
 def generate_invite(id):
     current_user_id = get_jwt_identity()
-    if not TeamMember.query.filter_by(team_id=id, user_id=current_user_id).first():
+    if not is_member(id, current_user_id):
         return jsonify({'message': 'Access denied'}), 403
         
     team = Team.query.get(id)
@@ -171,8 +179,18 @@ def join_team():
         return jsonify({'message': 'Already a member'}), 400
         
     member = TeamMember(team_id=team.id, user_id=current_user_id, role='member')
+    # Earlier history doesn't count as unread for new members
+    latest = latest_message(team.id)
+    if latest:
+        member.last_read_message_id, member.last_read_at = latest.id, latest.created_at
     db.session.add(member)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Lost a race with a concurrent join of the same user
+        db.session.rollback()
+        return jsonify({'message': 'Already a member'}), 400
+    forget(team.id, int(current_user_id))
     
     return jsonify({'message': 'Joined team successfully', 'team_id': team.id}), 200
 
@@ -192,6 +210,7 @@ def leave_team(id):
         
     db.session.delete(member)
     db.session.commit()
+    revoke_membership(id, int(current_user_id))
     
     return jsonify({'message': 'Left team successfully'}), 200
 
@@ -199,10 +218,24 @@ def leave_team(id):
 @jwt_required()
 def get_team_messages(id):
     current_user_id = get_jwt_identity()
-    if not TeamMember.query.filter_by(team_id=id, user_id=current_user_id).first():
+    if not is_member(id, current_user_id):
         return jsonify({'message': 'Access denied'}), 403
         
-    messages = TeamMessage.query.filter_by(team_id=id).order_by(TeamMessage.created_at.asc()).all()
+    # Authors are joined in and attachments fetched with one extra query,
+    # however many messages are returned
+    query = TeamMessage.query.options(joinedload(TeamMessage.user)).filter(TeamMessage.team_id == id)
+    next_cursor = None
+    if wants_page():
+        try:
+            limit, before = page_args()
+        except CursorError:
+            return jsonify({'message': 'Invalid cursor'}), 400
+        messages, next_cursor = keyset_page(query, TeamMessage.created_at, TeamMessage.id, limit, before)
+        messages.reverse() # oldest first within a page, like the full list
+        files = load_message_files([msg.id for msg in messages])
+    else:
+        messages = query.order_by(TeamMessage.created_at.asc(), TeamMessage.id.asc()).all()
+        files = load_message_files(team_id=id)
     
     result = []
     for msg in messages:
@@ -214,40 +247,61 @@ def get_team_messages(id):
             'nickname': user.nickname,
             'avatar': user.avatar,
             'content': msg.content,
-            'created_at': msg.created_at.isoformat()
+            'created_at': msg.created_at.isoformat(),
+            'files': [{
+                'id': f.id,
+                'uid': f.uid,
+                'filename': f.filename,
+                'url': f'/api/files/{f.uid}',
+                'thumb_url': thumbnails.thumb_url(f)
+            } for f in files.get(msg.id, [])]
         })
+    if wants_page():
+        return jsonify({'items': result, 'next_cursor': next_cursor}), 200
     return jsonify(result), 200
 
-@bp.route('/<int:id>/tasks', methods=['GET'])
+@bp.route('/<int:id>/read', methods=['PUT'])
 @jwt_required()
-def get_team_tasks(id):
+def mark_messages_read(id):
     current_user_id = get_jwt_identity()
-    if not TeamMember.query.filter_by(team_id=id, user_id=current_user_id).first():
+    if not is_member(id, current_user_id):
         return jsonify({'message': 'Access denied'}), 403
         
-    # Get all projects for this team
-    projects = Project.query.filter_by(team_id=id).all()
-    project_ids = [p.id for p in projects]
+    data = request.get_json(silent=True) or {}
+    target = mark_read(id, int(current_user_id), data.get('message_id'))
+    if not target:
+        return jsonify({'message': 'Message not found'}), 404
+    db.session.commit()
     
-    if not project_ids:
-        return jsonify([]), 200
+    return jsonify({'message': 'Marked as read', 'last_read_message_id': target.id}), 200
+
+@bp.route('/unread-counts', methods=['GET'])
+@jwt_required()
+def get_unread_counts():
+    current_user_id = get_jwt_identity()
+    return jsonify(unread_counts(int(current_user_id))), 200
+
+@bp.route('/<int:id>/tasks', methods=['GET'])
+@jwt_required()
+def get_team_tasks(id):
+    current_user_id = get_jwt_identity()
+    if not is_member(id, current_user_id):
+        return jsonify({'message': 'Access denied'}), 403
         
-    # Get all tasks for these projects
-    tasks = Task.query.filter(Task.project_id.in_(project_ids)).all()
+    # Only tasks with start/end dates are shown on the calendar
+    tasks = Task.query.filter(Task.team_id == id, Task.start_date.isnot(None), Task.end_date.isnot(None)).all()
     
     result = []
     for task in tasks:
-        # Only include tasks with start/end dates for calendar
-        if task.start_date and task.end_date:
-            result.append({
-                'id': task.id,
-                'title': task.title,
-                'project_id': task.project_id,
-                'start_date': task.start_date.isoformat(),
-                'end_date': task.end_date.isoformat(),
-                'status': task.status,
-                'priority': task.priority
-            })
-            
+        result.append({
+            'id': task.id,
+            'title': task.title,
+            'project_id': task.project_id,
+            'start_date': task.start_date.isoformat(),
+            'end_date': task.end_date.isoformat(),
+            'status': task.status,
+            'priority': task.priority
+        })
+        
     return jsonify(result), 200
 
@@ -1,7 +1,8 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import get_jwt_identity, jwt_required
-from app.models import TimelineEvent, TeamMember, File
-from app import db
+from app.models import TimelineEvent, File
+from app import db, thumbnails
+from app.authz import is_member
 from datetime import datetime
 
 bp = Blueprint('timeline', __name__)
@@ -11,7 +12,7 @@ bp = Blueprint('timeline', __name__)
 def get_team_timeline(team_id):
     current_user_id = int(get_jwt_identity())
     
-    if not TeamMember.query.filter_by(team_id=team_id, user_id=current_user_id).first():
+    if not is_member(team_id, current_user_id):
         return jsonify({'message': 'Access denied'}), 403
         
     events = TimelineEvent.query.filter_by(team_id=team_id).order_by(TimelineEvent.event_date.desc()).all()
@@ -24,7 +25,8 @@ def get_team_timeline(team_id):
                 'id': f.id,
                 'uid': f.uid,
                 'filename': f.filename,
-                'url': f'/api/files/{f.uid}'
+                'url': f'/api/files/{f.uid}',
+                'thumb_url': thumbnails.thumb_url(f)
             })
             
         result.append({
@@ -55,7 +57,7 @@ def create_timeline_event():
     if not team_id or not title:
         return jsonify({'message': 'Team ID and Title are required'}), 400
         
-    if not TeamMember.query.filter_by(team_id=team_id, user_id=current_user_id).first():
+    if not is_member(team_id, current_user_id):
         return jsonify({'message': 'Access denied'}), 403
         
     event_date = datetime.utcnow()
@@ -91,7 +93,7 @@ def update_timeline_event(event_id):
     current_user_id = int(get_jwt_identity())
     event = TimelineEvent.query.get_or_404(event_id)
     
-    if not TeamMember.query.filter_by(team_id=event.team_id, user_id=current_user_id).first():
+    if not is_member(event.team_id, current_user_id):
         return jsonify({'message': 'Access denied'}), 403
         
     # Check permission
@@ -121,7 +123,7 @@ def delete_timeline_event(event_id):
     current_user_id = int(get_jwt_identity())
     event = TimelineEvent.query.get_or_404(event_id)
     
-    if not TeamMember.query.filter_by(team_id=event.team_id, user_id=current_user_id).first():
+    if not is_member(event.team_id, current_user_id):
         return jsonify({'message': 'Access denied'}), 403
         
     # Check permission (creator or team admin?)
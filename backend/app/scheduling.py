@@ -0,0 +1,185 @@
+from collections import deque
+from datetime import date
+from app.models import Task, TaskLink
+from app.revisions import bump_revision
+from app import db
+
+# Critical-path scheduling over TaskLink dependencies.
+#
+# Dates are handled as day ordinals with exclusive finish (finish = start +
+# duration), so the task's inclusive end_date is finish - 1. Link types
+# follow dhtmlx-gantt: '0' finish-to-start, '1' start-to-start,
+# '2' finish-to-finish, '3' start-to-finish.
+
+FINISH_TO_START = '0'
+START_TO_START = '1'
+FINISH_TO_FINISH = '2'
+START_TO_FINISH = '3'
+
+class ScheduleCycleError(Exception):
+    def __init__(self, task_ids):
+        super().__init__('Dependency cycle between tasks')
+        self.task_ids = task_ids
+
+def _duration(start, end):
+    if start and end:
+        return max((end - start).days + 1, 1)
+    return 1
+
+def compute_schedule(tasks, links):
+    """Forward/backward pass over the dependency DAG in O(V+E).
+
+    `tasks` is an iterable of (id, start_date, end_date) and `links` of
+    (source, target, type). A task starts at its own start or as soon as
+    its links allow, whichever is later, so a deliberately later start
+    is kept. Undated tasks are only placed through scheduled
+    predecessors; with none they stay unscheduled (es is None) and
+    constrain nothing. Returns a dict keyed by task id with es/ef/ls/lf
+    ordinals, duration and slack, plus the topological order.
+    """
+    nodes = {}
+    for task_id, start, end in tasks:
+        nodes[task_id] = {
+            'start': start.toordinal() if start else None,
+            'duration': _duration(start, end)
+        }
+
+    successors = {task_id: [] for task_id in nodes}
+    predecessors = {task_id: [] for task_id in nodes}
+    indegree = dict.fromkeys(nodes, 0)
+    for source, target, link_type in links:
+        if source not in nodes or target not in nodes:
+            continue
+        link_type = str(link_type or FINISH_TO_START)
+        successors[source].append((target, link_type))
+        predecessors[target].append((source, link_type))
+        indegree[target] += 1
+
+    # Kahn's algorithm gives the topological order and detects cycles
+    queue = deque(task_id for task_id, d in indegree.items() if d == 0)
+    order = []
+    while queue:
+        task_id = queue.popleft()
+        order.append(task_id)
+        for target, _ in successors[task_id]:
+            indegree[target] -= 1
+            if indegree[target] == 0:
+                queue.append(target)
+    if len(order) != len(nodes):
+        raise ScheduleCycleError([task_id for task_id, d in indegree.items() if d > 0])
+
+    es, ef = {}, {}
+    for task_id in order:
+        duration = nodes[task_id]['duration']
+        start = nodes[task_id]['start']
+        for source, link_type in predecessors[task_id]:
+            if es[source] is None:
+                continue
+            if link_type == START_TO_START:
+                bound = es[source]
+            elif link_type == FINISH_TO_FINISH:
+                bound = ef[source] - duration
+            elif link_type == START_TO_FINISH:
+                bound = es[source] - duration
+            else:
+                bound = ef[source]
+            if start is None or bound > start:
+                start = bound
+        es[task_id] = start
+        ef[task_id] = start + duration if start is not None else None
+
+    project_finish = max((f for f in ef.values() if f is not None), default=None)
+
+    # Successors of a scheduled task are scheduled too
+    ls, lf = {}, {}
+    for task_id in reversed(order):
+        if es[task_id] is None:
+            ls[task_id] = lf[task_id] = None
+            continue
+        duration = nodes[task_id]['duration']
+        finish = project_finish
+        for target, link_type in successors[task_id]:
+            if link_type == START_TO_START:
+                bound = ls[target] + duration
+            elif link_type == FINISH_TO_FINISH:
+                bound = lf[target]
+            elif link_type == START_TO_FINISH:
+                bound = lf[target] + duration
+            else:
+                bound = ls[target]
+            if bound < finish:
+                finish = bound
+        lf[task_id] = finish
+        ls[task_id] = finish - duration
+
+    schedule = {}
+    for task_id in order:
+        schedule[task_id] = {
+            'es': es[task_id],
+            'ef': ef[task_id],
+            'ls': ls[task_id],
+            'lf': lf[task_id],
+            'duration': nodes[task_id]['duration'],
+            'slack': ls[task_id] - es[task_id] if es[task_id] is not None else None
+        }
+    return schedule, order
+
+def load_project_graph(project_id):
+    tasks = db.session.query(Task.id, Task.start_date, Task.end_date)\
+        .filter(Task.project_id == project_id).all()
+    links = db.session.query(TaskLink.source, TaskLink.target, TaskLink.type)\
+        .join(Task, TaskLink.source == Task.id)\
+        .filter(Task.project_id == project_id).all()
+    return tasks, links
+
+def schedule_project(project):
+    tasks, links = load_project_graph(project.id)
+    schedule, order = compute_schedule(tasks, links)
+    current = {task_id: (start, end) for task_id, start, end in tasks}
+    return schedule, order, current
+
+def serialize_schedule(schedule, order):
+    def day(ordinal):
+        return date.fromordinal(ordinal).isoformat() if ordinal is not None else None
+
+    result = []
+    for task_id in order:
+        entry = schedule[task_id]
+        result.append({
+            'id': task_id,
+            'earliest_start': day(entry['es']),
+            'earliest_finish': day(entry['ef'] and entry['ef'] - 1),
+            'latest_start': day(entry['ls']),
+            'latest_finish': day(entry['lf'] and entry['lf'] - 1),
+            'duration': entry['duration'],
+            'slack': entry['slack'],
+            'critical': entry['slack'] == 0
+        })
+    return result
+
+def apply_schedule(project_id, schedule, current):
+    """Write earliest start/finish back for tasks whose dates moved.
+
+    Tasks only ever move later, and undated ones are left unscheduled. A
+    task without an end date keeps none; only its start can move. All
+    changes go out as one executemany UPDATE; the caller commits.
+    """
+    mappings = []
+    for task_id, entry in schedule.items():
+        own_start, own_end = current[task_id]
+        if own_start is None or entry['es'] is None:
+            continue
+        start = date.fromordinal(entry['es'])
+        if own_end is None:
+            if start != own_start:
+                mappings.append({'id': task_id, 'start_date': start})
+            continue
+        end = date.fromordinal(entry['ef'] - 1)
+        if (own_start, own_end) != (start, end):
+            mappings.append({'id': task_id, 'start_date': start, 'end_date': end})
+    if mappings:
+        revision = bump_revision(project_id)
+        for mapping in mappings:
+            mapping['revision'] = revision
+        db.session.bulk_update_mappings(Task, mappings)
+    return [m['id'] for m in mappings]
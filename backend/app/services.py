@@ -1,5 +1,10 @@
-from app.models import Notification, TaskActivity, TaskParticipant, User, Task
-from app import db
+from datetime import datetime
+from flask import current_app
+from app.models import Notification, TaskParticipant, User, Task, TaskLink, File, Project
+from app.activity import record
+from app import db, socketio
+from sqlalchemy import func, event, insert, select, update, literal
+from sqlalchemy.orm import Session
 
 def create_notification(user_id, type, content, related_id=None):
     notif = Notification(
@@ -9,24 +14,186 @@ def create_notification(user_id, type, content, related_id=None):
         related_id=related_id
     )
     db.session.add(notif)
+    db.session.execute(adjust_unread([user_id], 1))
     db.session.commit()
 
+def adjust_unread(user_ids, delta):
+    # users.unread_notifications is kept in step with every insert or
+    # read-flag change, in the same transaction, so the badge is one lookup.
+    # `user_ids` is a list: MySQL refuses an UPDATE of users filtered by a
+    # subquery that reads users (error 1093). A counter is not a profile
+    # edit, so updated_at keeps its value.
+    return update(User.__table__)\
+        .where(User.id.in_(list(user_ids)))\
+        .values(unread_notifications=User.unread_notifications + delta, updated_at=User.updated_at)
+
+def rebuild_unread_counts():
+    unread = select(func.count(Notification.id))\
+        .where(Notification.user_id == User.id, Notification.is_read.is_(False))\
+        .scalar_subquery()
+    return db.session.execute(
+        update(User.__table__).values(unread_notifications=unread, updated_at=User.updated_at)).rowcount
+
+def backfill_task_teams(batch_size=1000):
+    """Fill tasks.team_id where it is missing, committing every batch."""
+    team_id = select(Project.team_id).where(Project.id == Task.project_id).scalar_subquery()
+    total = 0
+    while True:
+        ids = db.session.execute(
+            select(Task.id).where(Task.team_id.is_(None)).order_by(Task.id).limit(batch_size)
+        ).scalars().all()
+        if not ids:
+            break
+        db.session.execute(update(Task.__table__).where(Task.id.in_(ids)).values(team_id=team_id))
+        db.session.commit()
+        total += len(ids)
+    return total
+
 def log_activity(task_id, user_id, action, detail=None):
-    activity = TaskActivity(
-        task_id=task_id,
-        user_id=user_id,
-        action=action,
-        detail=detail
-    )
-    db.session.add(activity)
-    db.session.commit()
+    # Joins the caller's transaction, so call it before committing
+    record(task_id, user_id, action, detail)
 
 def notify_task_participants(task_id, type, content, exclude_user_id=None):
-    participants = TaskParticipant.query.filter_by(task_id=task_id).all()
-    for p in participants:
-        if p.user_id != exclude_user_id:
-            create_notification(p.user_id, type, content, related_id=task_id)
+    # One query for the recipients, then a single INSERT ... SELECT and one
+    # counter UPDATE over them, so the cost no longer grows with one commit
+    # per recipient. Like log_activity it joins the caller's transaction;
+    # with NOTIFY_ASYNC it is sent from a background task once that
+    # transaction has committed.
+    criteria = [TaskParticipant.task_id == task_id]
+    if exclude_user_id is not None:
+        # JWT identities are strings
+        criteria.append(TaskParticipant.user_id != int(exclude_user_id))
+    recipient_ids = db.session.execute(
+        select(TaskParticipant.user_id).join(User, TaskParticipant.user_id == User.id).where(*criteria)
+    ).scalars().all()
+    if not recipient_ids:
+        return
+    recipients = select(
+        User.id,
+        literal(type, db.String),
+        literal(content, db.Text),
+        literal(task_id, db.Integer),
+        literal(False, db.Boolean),
+        literal(datetime.utcnow(), db.DateTime)
+    ).where(User.id.in_(recipient_ids))
+    statements = [
+        insert(Notification).from_select(
+            ['user_id', 'type', 'content', 'related_id', 'is_read', 'created_at'], recipients),
+        adjust_unread(recipient_ids, 1)
+    ]
+
+    if current_app.config.get('NOTIFY_ASYNC'):
+        pending = db.session.info.setdefault('pending_notifications', [])
+        pending.extend((current_app._get_current_object(), stmt) for stmt in statements)
+    else:
+        for stmt in statements:
+            db.session.execute(stmt)
+
+def _deliver_notifications(app, statements):
+    with app.app_context():
+        try:
+            with db.engine.begin() as conn:
+                for stmt in statements:
+                    conn.execute(stmt)
+        except Exception:
+            app.logger.exception('Notification delivery failed')
+
+@event.listens_for(Session, 'after_commit')
+def _release_notifications(session):
+    pending = session.info.pop('pending_notifications', None)
+    if pending:
+        socketio.start_background_task(_deliver_notifications, pending[0][0], [stmt for _, stmt in pending])
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_notifications(session):
+    session.info.pop('pending_notifications', None)
 
 def get_task_participants_ids(task_id):
     participants = TaskParticipant.query.filter_by(task_id=task_id).all()
     return [p.user_id for p in participants]
+
+def load_message_files(message_ids=None, team_id=None):
+    """Attachments of the given chat messages (or of a whole team's chat),
+    grouped by message id, in one query."""
+    query = File.query.filter(File.message_id.isnot(None))
+    if team_id is not None:
+        query = query.filter(File.team_id == team_id)
+    else:
+        if not message_ids:
+            return {}
+        query = query.filter(File.message_id.in_(message_ids))
+
+    files = {}
+    for f in query.order_by(File.id).all():
+        files.setdefault(f.message_id, []).append(f)
+    return files
+
+def serialize_user(user):
+    return {'id': user.id, 'username': user.username, 'nickname': user.nickname, 'avatar': user.avatar}
+
+def _task_criteria(project_id, parent_id=None, fetch_all=False):
+    criteria = [Task.project_id == project_id]
+    if not fetch_all:
+        criteria.append(Task.parent_id == parent_id if parent_id else Task.parent_id.is_(None))
+    return criteria
+
+def load_participants(criteria):
+    # One query for every participant of every task matching `criteria`,
+    # grouped by task id. Joining on Task avoids a huge IN (...) list.
+    rows = db.session.query(TaskParticipant.task_id, User)\
+        .join(User, TaskParticipant.user_id == User.id)\
+        .join(Task, TaskParticipant.task_id == Task.id)\
+        .filter(*criteria)\
+        .order_by(TaskParticipant.id).all()
+
+    participants = {}
+    for task_id, user in rows:
+        participants.setdefault(task_id, []).append(serialize_user(user))
+    return participants
+
+def load_child_counts(project_id):
+    rows = db.session.query(Task.parent_id, func.count(Task.id))\
+        .filter(Task.project_id == project_id, Task.parent_id.isnot(None))\
+        .group_by(Task.parent_id).all()
+    return dict(rows)
+
+def load_task_tree(project_id, parent_id=None, fetch_all=False):
+    """Load tasks of a project with participants and subtask flags.
+
+    Uses a fixed number of queries (tasks, participants, child counts)
+    regardless of how many tasks are returned.
+    """
+    return load_tasks(project_id, _task_criteria(project_id, parent_id, fetch_all))
+
+def load_tasks(project_id, criteria, order_by=(Task.sort_order,)):
+    tasks = Task.query.filter(*criteria).order_by(*order_by).all()
+    if not tasks:
+        return []
+
+    participants = load_participants(criteria)
+    child_counts = load_child_counts(project_id)
+
+    result = []
+    for task in tasks:
+        result.append({
+            'id': task.id,
+            'parent_id': task.parent_id,
+            'title': task.title,
+            'description': task.description,
+            'status': task.status,
+            'priority': task.priority,
+            'progress': task.progress,
+            'start_date': task.start_date.isoformat() if task.start_date else None,
+            'end_date': task.end_date.isoformat() if task.end_date else None,
+            'participants': participants.get(task.id, []),
+            'has_subtasks': child_counts.get(task.id, 0) > 0,
+            'level': task.level
+        })
+    return result
+
+def load_gantt_data(project_id):
+    """Load all tasks and links of a project in two queries."""
+    tasks = Task.query.filter_by(project_id=project_id).order_by(Task.sort_order).all()
+    links = TaskLink.query.join(Task, TaskLink.source == Task.id)\
+        .filter(Task.project_id == project_id).all()
+    return tasks, links
@@ -0,0 +1,103 @@
+import time
+from flask_jwt_extended import decode_token
+from app import socketio, authz
+from app.models import User
+
+# Authenticated Socket.IO sessions.
+#
+# A socket is authenticated once, when it connects (or on its first event
+# that carries a token), and the user is bound to its sid. Team membership
+# is checked once per (sid, team) on team:join and cached, so a chat
+# message needs no token decoding or lookups. HTTP routes that end a
+# membership call revoke_membership() to drop the cached entries and pull
+# the affected sockets out of the team room, on every worker; the HTTP
+# membership cache in app.authz is cleared along with them.
+
+_sessions = {}   # sid -> {'user': {...}, 'expires': ts, 'teams': set()}
+_members = {}    # (team_id, user_id) -> set of sids
+
+def authenticate(sid, token):
+    try:
+        decoded = decode_token(token)
+        user = User.query.get(decoded['sub'])
+    except Exception:
+        return None
+    if not user:
+        return None
+    _sessions[sid] = {
+        'user': {'id': user.id, 'username': user.username, 'nickname': user.nickname, 'avatar': user.avatar},
+        'expires': decoded.get('exp'),
+        'teams': set()
+    }
+    return _sessions[sid]['user']
+
+def current_user(sid, token=None):
+    """The user bound to `sid`, authenticating with `token` if needed."""
+    session = _sessions.get(sid)
+    if session and (session['expires'] is None or session['expires'] > time.time()):
+        return session['user']
+    if session:
+        end_session(sid)
+    return authenticate(sid, token) if token else None
+
+def is_member(sid, team_id):
+    session = _sessions.get(sid)
+    if not session:
+        return False
+    if team_id in session['teams']:
+        return True
+    user_id = session['user']['id']
+    if not authz.is_member(team_id, user_id):
+        return False
+    session['teams'].add(team_id)
+    _members.setdefault((team_id, user_id), set()).add(sid)
+    return True
+
+def forget_team(sid, team_id):
+    session = _sessions.get(sid)
+    if session and team_id in session['teams']:
+        session['teams'].discard(team_id)
+        _discard_member(team_id, session['user']['id'], sid)
+
+def end_session(sid):
+    session = _sessions.pop(sid, None)
+    if session:
+        for team_id in session['teams']:
+            _discard_member(team_id, session['user']['id'], sid)
+
+def revoke_membership(team_id, user_id=None):
+    """Drop cached membership of `user_id` (or everyone) in `team_id`.
+
+    Closing the room is relayed to every worker when a message queue is
+    configured (see app.cluster), so each one clears its own entries.
+    """
+    drop_membership(team_id, user_id)
+    socketio.close_room(f'team_{team_id}' if user_id is None else f'member_{team_id}_{user_id}')
+
+def room_closed(room):
+    kind, _, rest = room.partition('_')
+    try:
+        ids = [int(part) for part in rest.split('_')]
+    except ValueError:
+        return
+    if kind == 'team' and len(ids) == 1:
+        drop_membership(ids[0])
+    elif kind == 'member' and len(ids) == 2:
+        drop_membership(*ids)
+
+def drop_membership(team_id, user_id=None):
+    authz.forget(team_id, user_id)
+    keys = [key for key in _members if key[0] == team_id and (user_id is None or key[1] == user_id)]
+    for key in keys:
+        for sid in _members.pop(key):
+            session = _sessions.get(sid)
+            if session:
+                session['teams'].discard(team_id)
+            socketio.server.leave_room(sid, f'team_{team_id}', namespace='/')
+
+def _discard_member(team_id, user_id, sid):
+    sids = _members.get((team_id, user_id))
+    if sids:
+        sids.discard(sid)
+        if not sids:
+            del _members[(team_id, user_id)]
@@ -0,0 +1,194 @@
+import base64
+import json
+import mimetypes
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from app.models import File
+
+try:
+    from PIL import Image, ImageOps
+except ImportError: # no previews; the placeholder is served instead
+    Image = None
+
+try:
+    import pypdfium2 as pdfium
+except ImportError: # no PDF previews
+    pdfium = None
+
+# Thumbnails and previews.
+#
+# Once an image or PDF upload commits, it is rendered (the first page, for
+# a PDF) to a JPEG for every size in THUMB_SIZES, fitted into a size x size
+# box, under UPLOAD_FOLDER/thumbs/<uid>/<size>.jpg. Decoding and resampling
+# are CPU-bound, so they run in THUMB_WORKERS long-lived worker processes
+# (`python -m app.thumbnails`, at lower priority) rather than on the
+# eventlet hub. Jobs are written to a worker's stdin as JSON lines without
+# blocking the request; results are only ever looked up on disk, so a
+# worker that dies loses at most its queue. /api/files/<uid>/thumb serves
+# a ready thumbnail and otherwise a placeholder, queueing files uploaded
+# before this existed (or lost that way) on a miss. A file that can't be
+# rendered leaves a `failed` marker so it isn't retried on every view.
+
+IMAGE_TYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/bmp', 'image/tiff'}
+PLACEHOLDER = base64.b64decode('iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAAAAAA6fptVAAAACklEQVR42mN4BgAA6ADnilP9cwAAAABJRU5ErkJggg==')
+
+def preview_kind(file):
+    mimetype = file.mimetype or mimetypes.guess_type(file.filename)[0]
+    if mimetype in IMAGE_TYPES:
+        return 'image'
+    if mimetype == 'application/pdf':
+        return 'pdf'
+    return None
+
+def thumb_url(file):
+    return f'/api/files/{file.uid}/thumb' if preview_kind(file) else None
+
+def thumb_path(uid, size):
+    """Relative to UPLOAD_FOLDER."""
+    return f'thumbs/{uid}/{size}.jpg'
+
+def _thumb_dir(uid):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], 'thumbs', uid)
+
+def render(source, target_dir, kind, sizes):
+    """Runs in a worker process; writes <size>.jpg for each size to `target_dir`."""
+    os.makedirs(target_dir, exist_ok=True)
+    try:
+        largest = max(sizes)
+        if kind == 'pdf':
+            pdf = pdfium.PdfDocument(source)
+            try:
+                page = pdf[0]
+                image = page.render(scale=largest / max(page.get_size())).to_pil()
+            finally:
+                pdf.close()
+        else:
+            image = Image.open(source)
+            # JPEG decodes straight at a fraction of full size
+            image.draft('RGB', (largest, largest))
+            image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            rgba = image.convert('RGBA')
+            image = Image.new('RGB', rgba.size, 'white')
+            image.paste(rgba, mask=rgba.getchannel('A'))
+        for size in sorted(sizes, reverse=True):
+            image.thumbnail((size, size), Image.LANCZOS)
+            temp = os.path.join(target_dir, f'.{size}.{os.getpid()}.tmp')
+            image.save(temp, 'JPEG', quality=80, optimize=True)
+            os.replace(temp, os.path.join(target_dir, f'{size}.jpg'))
+    except Exception:
+        open(os.path.join(target_dir, 'failed'), 'w').close()
+        raise
+
+RETRY_AFTER = 60 # seconds before a queued job that produced nothing is sent again
+
+class ThumbnailPool:
+    def __init__(self):
+        self.procs = []
+        self.next = 0
+        self.queued = {} # uid -> when it was sent to a worker
+        self.lock = threading.Lock()
+
+    def init_app(self, app):
+        self.sizes = app.config.get('THUMB_SIZES', [128, 256, 512])
+        self.procs = [None] * app.config.get('THUMB_WORKERS', 2)
+        self.root = os.path.dirname(app.root_path)
+
+    def enabled(self, kind):
+        return bool(self.procs) and Image is not None and (kind != 'pdf' or pdfium is not None)
+
+    def submit(self, uid, source, target_dir, kind):
+        line = (json.dumps({'source': source, 'target_dir': target_dir, 'kind': kind, 'sizes': self.sizes}) + '\n').encode()
+        now = time.monotonic()
+        with self.lock:
+            if now - self.queued.get(uid, -RETRY_AFTER) < RETRY_AFTER:
+                return
+            for _ in self.procs:
+                slot, self.next = self.next, (self.next + 1) % len(self.procs)
+                if self._send(slot, line):
+                    self.queued[uid] = now
+                    break
+            if len(self.queued) > 10000:
+                self.queued = {k: t for k, t in self.queued.items() if now - t < RETRY_AFTER}
+
+    def _send(self, slot, line):
+        proc = self.procs[slot]
+        if proc is None or proc.poll() is not None:
+            # Started on first use; spawned, so nothing of this process (the
+            # eventlet hub, database sockets) is inherited
+            proc = self.procs[slot] = subprocess.Popen([sys.executable, '-m', 'app.thumbnails'],
+                                                       cwd=self.root, stdin=subprocess.PIPE)
+            try:
+                os.set_blocking(proc.stdin.fileno(), False)
+            except OSError: # Windows
+                pass
+        try:
+            # Lines are far below PIPE_BUF, so each write is all or nothing
+            os.write(proc.stdin.fileno(), line)
+            return True
+        except BlockingIOError:
+            return False # this worker's queue is full
+        except BrokenPipeError:
+            return False # died; restarted on the next job
+
+pool = ThumbnailPool()
+
+def ready(file, size):
+    """Relative path of a rendered thumbnail, or None; queues missing ones."""
+    path = thumb_path(file.uid, size)
+    folder = current_app.config['UPLOAD_FOLDER']
+    if os.path.exists(os.path.join(folder, path)):
+        return path
+    kind = preview_kind(file)
+    if kind and pool.enabled(kind) and not os.path.exists(os.path.join(_thumb_dir(file.uid), 'failed')):
+        pool.submit(file.uid, os.path.join(folder, file.filepath), _thumb_dir(file.uid), kind)
+    return None
+
+@event.listens_for(File, 'after_insert')
+def _queue_thumbnails(mapper, connection, target):
+    kind = preview_kind(target)
+    if kind and pool.enabled(kind):
+        source = os.path.join(current_app.config['UPLOAD_FOLDER'], target.filepath)
+        object_session(target).info.setdefault('pending_thumbs', []).append(
+            (target.uid, source, _thumb_dir(target.uid), kind))
+
+@event.listens_for(File, 'after_delete')
+def _drop_thumbnails(mapper, connection, target):
+    if preview_kind(target):
+        object_session(target).info.setdefault('released_thumbs', []).append(_thumb_dir(target.uid))
+
+@event.listens_for(Session, 'after_commit')
+def _release_thumbnails(session):
+    for job in session.info.pop('pending_thumbs', []):
+        pool.submit(*job)
+    for path in session.info.pop('released_thumbs', []):
+        shutil.rmtree(path, ignore_errors=True)
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_thumbnails(session):
+    session.info.pop('pending_thumbs', None)
+    session.info.pop('released_thumbs', None)
+
+def init_app(app):
+    pool.init_app(app)
+
+def serve():
+    """Worker process: renders one JSON job per stdin line until it closes."""
+    if hasattr(os, 'nice'):
+        os.nice(10)
+    for line in sys.stdin:
+        job = json.loads(line)
+        try:
+            render(**job)
+        except Exception as e:
+            print(f"Thumbnail for {job['source']} failed: {e!r}", file=sys.stderr, flush=True)
+
+if __name__ == '__main__':
+    serve()
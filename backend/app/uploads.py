@@ -0,0 +1,187 @@
+import hashlib
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from flask import current_app
+from app.models import UploadSession, File
+from app import db, blobs
+
+try:
+    import fcntl
+except ImportError: # Windows: concurrent chunks of one upload are not guarded
+    fcntl = None
+
+# Chunked, resumable uploads.
+#
+# A client opens an UploadSession, PUTs the file in chunks at increasing
+# offsets and then completes it. Each chunk is streamed from the request
+# into UPLOAD_FOLDER/.partial/<id>.part in small blocks, so memory stays
+# flat whatever the file size. The session row's `received` is the only
+# offset the server trusts: a chunk cut off half way leaves it unchanged
+# and the client resumes from there. The sha256 of the data so far is
+# carried between chunks in this process; if the next chunk lands on
+# another worker (or after a restart) it is rebuilt from the partial file.
+
+BLOCK = 64 * 1024
+MAX_HASHERS = 1000
+
+_hashers = OrderedDict() # upload id -> (offset, sha256 of the first offset bytes)
+_hashers_lock = threading.Lock()
+
+class UploadError(Exception):
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.offset = offset
+
+    def payload(self):
+        body = {'message': self.message}
+        if self.offset is not None:
+            body['offset'] = self.offset
+        return body
+
+def copy_stream(stream, out, hasher, limit=None):
+    """Copy `stream` into `out` block by block, hashing along the way."""
+    copied = 0
+    while True:
+        block = stream.read(BLOCK)
+        if not block:
+            return copied
+        copied += len(block)
+        if limit is not None and copied > limit:
+            raise UploadError('Chunk exceeds the declared file size', 413)
+        hasher.update(block)
+        out.write(block)
+
+def save_stream(stream, path):
+    """Write `stream` to `path`; returns (size, sha256 hex)."""
+    hasher = hashlib.sha256()
+    with open(path, 'wb') as out:
+        size = copy_stream(stream, out, hasher)
+    return size, hasher.hexdigest()
+
+def partial_path(upload_id):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], '.partial', f'{upload_id}.part')
+
+def temp_path():
+    path = partial_path(uuid.uuid4().hex)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+@contextmanager
+def _locked(upload):
+    path = partial_path(upload.id)
+    try:
+        f = open(path, 'r+b')
+    except FileNotFoundError:
+        raise UploadError('Upload not found', 404)
+    with f:
+        if fcntl:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadError('Another request is writing this upload', 409, upload.received)
+        # Another worker may have moved the offset before we got the lock
+        db.session.refresh(upload)
+        yield f
+
+def _take_hasher(upload_id, offset, f):
+    with _hashers_lock:
+        cached = _hashers.pop(upload_id, None)
+    if cached and cached[0] == offset:
+        return cached[1]
+    hasher = hashlib.sha256()
+    f.seek(0)
+    remaining = offset
+    while remaining:
+        block = f.read(min(BLOCK, remaining))
+        if not block:
+            break
+        hasher.update(block)
+        remaining -= len(block)
+    return hasher
+
+def _keep_hasher(upload_id, offset, hasher):
+    with _hashers_lock:
+        _hashers[upload_id] = (offset, hasher)
+        while len(_hashers) > MAX_HASHERS:
+            _hashers.popitem(last=False)
+
+def start(uploader_id, team_id, filename, size, mimetype=None, checksum=None, **links):
+    upload = UploadSession(uploader_id=uploader_id, team_id=team_id, filename=filename, size=size,
+                           mimetype=mimetype, checksum=checksum.lower() if checksum else None, **links)
+    db.session.add(upload)
+    db.session.flush()
+    os.makedirs(os.path.dirname(partial_path(upload.id)), exist_ok=True)
+    open(partial_path(upload.id), 'wb').close()
+    return upload
+
+def write_chunk(upload, offset, stream):
+    """Append the request body at `offset`; returns the new offset. Commits."""
+    with _locked(upload) as f:
+        if offset != upload.received:
+            raise UploadError('Offset mismatch', 409, upload.received)
+        hasher = _take_hasher(upload.id, offset, f)
+        limit = min(upload.size - offset, current_app.config['UPLOAD_CHUNK_SIZE'])
+        f.seek(offset)
+        copied = copy_stream(stream, f, hasher, limit)
+        # Drop bytes an interrupted attempt may have left past this chunk
+        f.truncate()
+        f.flush()
+        upload.received = offset + copied
+        db.session.commit()
+    _keep_hasher(upload.id, upload.received, hasher)
+    return upload.received
+
+def finish(upload):
+    """Turn a fully received upload into a File; the caller commits."""
+    with _locked(upload) as f:
+        if upload.received != upload.size:
+            raise UploadError('Upload incomplete', 409, upload.received)
+        checksum = _take_hasher(upload.id, upload.size, f).hexdigest()
+    if upload.checksum and checksum != upload.checksum:
+        discard(upload)
+        db.session.commit()
+        raise UploadError('Checksum mismatch')
+
+    # The upload stays resumable if this transaction rolls back
+    blob = blobs.store(partial_path(upload.id), checksum, upload.size, keep_on_rollback=True)
+    new_file = File(
+        team_id=upload.team_id,
+        task_id=upload.task_id,
+        resource_id=upload.resource_id,
+        message_id=upload.message_id,
+        timeline_event_id=upload.timeline_event_id,
+        filename=upload.filename,
+        filepath=blob.path,
+        filesize=upload.size,
+        mimetype=upload.mimetype,
+        checksum=checksum,
+        blob_id=blob.id,
+        uploader_id=upload.uploader_id
+    )
+    db.session.add(new_file)
+    db.session.delete(upload)
+    return new_file
+
+def discard(upload):
+    with _hashers_lock:
+        _hashers.pop(upload.id, None)
+    try:
+        os.remove(partial_path(upload.id))
+    except OSError:
+        pass
+    db.session.delete(upload)
+
+def purge_stale(hours):
+    """Drop uploads that have not received a chunk for `hours`."""
+    cutoff = datetime.utcnow() - timedelta(hours=hours)
+    stale = UploadSession.query.filter(UploadSession.updated_at < cutoff).all()
+    for upload in stale:
+        discard(upload)
+    db.session.commit()
+    return len(stale)
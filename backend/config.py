@@ -17,3 +17,60 @@ class Config:
     # File Upload Configuration
     UPLOAD_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024 # 16MB max limit
+
+    # Chunked uploads (/api/files/uploads): each PUT carries at most
+    # UPLOAD_CHUNK_SIZE bytes, so MAX_CONTENT_LENGTH only bounds one chunk
+    UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+    UPLOAD_MAX_SIZE = int(os.environ.get('UPLOAD_MAX_SIZE', 1024 * 1024 * 1024))
+    UPLOAD_SESSION_HOURS = int(os.environ.get('UPLOAD_SESSION_HOURS', 24))
+
+    # Downloads: /api/files/<uid> redirects to an HMAC-signed URL that stays
+    # valid for at least DOWNLOAD_URL_TTL seconds and is checked without the
+    # database. With a front proxy the bytes are handed off to it: set
+    # X_ACCEL_REDIRECT_PREFIX to an nginx internal location, or USE_X_SENDFILE=1
+    # for Apache/lighttpd
+    DOWNLOAD_URL_TTL = int(os.environ.get('DOWNLOAD_URL_TTL', 300))
+    DOWNLOAD_SIGNING_KEY = os.environ.get('DOWNLOAD_SIGNING_KEY') or SECRET_KEY
+    X_ACCEL_REDIRECT_PREFIX = os.environ.get('X_ACCEL_REDIRECT_PREFIX')
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', '0') == '1'
+
+    # Image/PDF thumbnails (/api/files/<uid>/thumb?size=): rendered after upload
+    # by this many worker processes (0 disables) for each of these box sizes
+    THUMB_SIZES = [int(size) for size in os.environ.get('THUMB_SIZES', '128,256,512').split(',')]
+    THUMB_WORKERS = int(os.environ.get('THUMB_WORKERS', 2))
+
+    # Gantt delta sync (gantt-data?since=): deletions are remembered this many
+    # days (flask prune-tombstones); older clients get the full payload
+    GANTT_TOMBSTONE_DAYS = int(os.environ.get('GANTT_TOMBSTONE_DAYS', 30))
+
+    # Activity log: when enabled, TaskActivity rows are written in batches by a
+    # background worker instead of inside each request's transaction
+    ACTIVITY_BUFFER_ENABLED = os.environ.get('ACTIVITY_BUFFER_ENABLED', 'false').lower() == 'true'
+    ACTIVITY_FLUSH_INTERVAL_MS = int(os.environ.get('ACTIVITY_FLUSH_INTERVAL_MS', 200))
+    ACTIVITY_FLUSH_ROWS = int(os.environ.get('ACTIVITY_FLUSH_ROWS', 500))
+
+    # Task notifications: when enabled, fan-out is written by a background
+    # task after the request commits instead of inside its transaction
+    NOTIFY_ASYNC = os.environ.get('NOTIFY_ASYNC', 'false').lower() == 'true'
+
+    # Notification retention (flask compact-notifications): read notifications
+    # older than this many days are removed, in batches of this many rows
+    NOTIFICATION_RETENTION_DAYS = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', 90))
+    NOTIFICATION_PURGE_BATCH = int(os.environ.get('NOTIFICATION_PURGE_BATCH', 1000))
+
+    # Team chat: when enabled, messages are broadcast immediately and written
+    # by a background worker that group-commits the queue every interval
+    CHAT_PIPELINE_ENABLED = os.environ.get('CHAT_PIPELINE_ENABLED', 'false').lower() == 'true'
+    CHAT_FLUSH_INTERVAL_MS = int(os.environ.get('CHAT_FLUSH_INTERVAL_MS', 5))
+    CHAT_QUEUE_SIZE = int(os.environ.get('CHAT_QUEUE_SIZE', 10000))
+    CHAT_ID_BLOCK = int(os.environ.get('CHAT_ID_BLOCK', 1000))
+
+    # Socket.IO message queue for running several workers, e.g.
+    # redis://localhost:6379/0 (or the `flask pubsub-server` stand-in)
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    SOCKETIO_CHANNEL = os.environ.get('SOCKETIO_CHANNEL', 'collabu')
+
+    # Team membership checks: confirmed memberships are cached per process for
+    # this many seconds (0 disables), up to this many (user, team) pairs
+    MEMBERSHIP_CACHE_TTL = int(os.environ.get('MEMBERSHIP_CACHE_TTL', 30))
+    MEMBERSHIP_CACHE_SIZE = int(os.environ.get('MEMBERSHIP_CACHE_SIZE', 10000))
@@ -0,0 +1,66 @@
+"""Add materialized path to tasks
+
+Revision ID: 3b9e1f4c2a7d
+Revises: 57cfef79a0df
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b9e1f4c2a7d'
+down_revision = '57cfef79a0df'
+branch_labels = None
+depends_on = None
+
+
+tasks = sa.table('tasks',
+    sa.column('id', sa.Integer),
+    sa.column('parent_id', sa.Integer),
+    sa.column('project_id', sa.Integer),
+    sa.column('level', sa.Integer),
+    sa.column('path', sa.String)
+)
+
+
+def _backfill(conn):
+    # One project at a time keeps memory bounded on large installs
+    project_ids = [r[0] for r in conn.execute(sa.select(tasks.c.project_id).distinct())]
+    for project_id in project_ids:
+        rows = conn.execute(sa.select(tasks.c.id, tasks.c.parent_id).where(tasks.c.project_id == project_id)).fetchall()
+        parents = {r[0]: r[1] for r in rows}
+
+        paths = {}
+        for task_id in parents:
+            chain = []
+            current = task_id
+            while current is not None and current not in paths and current in parents and current not in chain:
+                chain.append(current)
+                current = parents[current]
+            prefix, level = paths.get(current, ('/', -1))
+            for node in reversed(chain):
+                level += 1
+                prefix = f'{prefix}{node}/'
+                paths[node] = (prefix, level)
+
+        if paths:
+            conn.execute(
+                tasks.update().where(tasks.c.id == sa.bindparam('_id')).values(path=sa.bindparam('_path'), level=sa.bindparam('_level')),
+                [{'_id': k, '_path': v[0], '_level': v[1]} for k, v in paths.items()]
+            )
+
+
+def upgrade():
+    with op.batch_alter_table('tasks', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('path', sa.String(length=255), nullable=True))
+        batch_op.create_index(batch_op.f('ix_tasks_path'), ['path'], unique=False)
+
+    _backfill(op.get_bind())
+
+
+def downgrade():
+    with op.batch_alter_table('tasks', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_tasks_path'))
+        batch_op.drop_column('path')
@@ -0,0 +1,37 @@
+"""Add unread notification counters and inbox index
+
+Revision ID: 5f2b8c7d1e43
+Revises: e7a3d9c15b42
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f2b8c7d1e43'
+down_revision = 'e7a3d9c15b42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('unread_notifications', sa.Integer(), server_default='0', nullable=False))
+
+    op.create_index('ix_notifications_user_read_created', 'notifications', ['user_id', 'is_read', 'created_at'], unique=False)
+
+    users = sa.table('users', sa.column('id', sa.Integer), sa.column('unread_notifications', sa.Integer))
+    notifications = sa.table('notifications', sa.column('user_id', sa.Integer), sa.column('is_read', sa.Boolean))
+    unread = sa.select(sa.func.count()).select_from(notifications)\
+        .where(notifications.c.user_id == users.c.id, notifications.c.is_read == sa.false())\
+        .scalar_subquery()
+    op.execute(users.update().values(unread_notifications=unread))
+
+
+def downgrade():
+    op.drop_index('ix_notifications_user_read_created', table_name='notifications')
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('unread_notifications')
@@ -0,0 +1,58 @@
+"""Add project revisions and gantt tombstones
+
+Revision ID: 8d2c5a1e9f30
+Revises: 3b9e1f4c2a7d
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2c5a1e9f30'
+down_revision = '3b9e1f4c2a7d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('gantt_tombstones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('project_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=10), nullable=False),
+    sa.Column('object_id', sa.Integer(), nullable=False),
+    sa.Column('revision', sa.Integer(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['project_id'], ['projects.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('gantt_tombstones', schema=None) as batch_op:
+        batch_op.create_index('ix_gantt_tombstones_project_revision', ['project_id', 'revision'], unique=False)
+
+    with op.batch_alter_table('projects', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('revision', sa.Integer(), server_default='0', nullable=False))
+
+    with op.batch_alter_table('tasks', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('revision', sa.Integer(), server_default='0', nullable=False))
+        batch_op.create_index('ix_tasks_project_revision', ['project_id', 'revision'], unique=False)
+
+    with op.batch_alter_table('task_links', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('revision', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('task_links', schema=None) as batch_op:
+        batch_op.drop_column('revision')
+
+    with op.batch_alter_table('tasks', schema=None) as batch_op:
+        batch_op.drop_index('ix_tasks_project_revision')
+        batch_op.drop_column('revision')
+
+    with op.batch_alter_table('projects', schema=None) as batch_op:
+        batch_op.drop_column('revision')
+
+    with op.batch_alter_table('gantt_tombstones', schema=None) as batch_op:
+        batch_op.drop_index('ix_gantt_tombstones_project_revision')
+
+    op.drop_table('gantt_tombstones')
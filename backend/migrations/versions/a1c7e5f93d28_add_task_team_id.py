@@ -0,0 +1,51 @@
+"""Add denormalized team_id to tasks
+
+Revision ID: a1c7e5f93d28
+Revises: f4b9d2e7a618
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1c7e5f93d28'
+down_revision = 'f4b9d2e7a618'
+branch_labels = None
+depends_on = None
+
+
+BATCH = 5000
+
+
+def upgrade():
+    # A nullable column without a foreign key is an instant ADD COLUMN on
+    # MySQL 8 and the index is built online, so neither blocks writers.
+    with op.batch_alter_table('tasks', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('team_id', sa.Integer(), nullable=True))
+    op.create_index('ix_tasks_team_id', 'tasks', ['team_id'], unique=False)
+
+    # Backfill in primary key ranges, each its own short transaction, so
+    # row locks are held for one batch at a time. Tasks created by old
+    # workers while this runs are caught by the final pass, or afterwards
+    # by `flask backfill-task-teams`.
+    tasks = sa.table('tasks', sa.column('id', sa.Integer), sa.column('project_id', sa.Integer),
+                     sa.column('team_id', sa.Integer))
+    projects = sa.table('projects', sa.column('id', sa.Integer), sa.column('team_id', sa.Integer))
+    team_id = sa.select(projects.c.team_id).where(projects.c.id == tasks.c.project_id).scalar_subquery()
+    bind = op.get_bind()
+    with op.get_context().autocommit_block():
+        last_id = bind.execute(sa.select(sa.func.max(tasks.c.id))).scalar() or 0
+        for start in range(0, last_id + 1, BATCH):
+            bind.execute(tasks.update()
+                         .where(tasks.c.id >= start, tasks.c.id < start + BATCH, tasks.c.team_id.is_(None))
+                         .values(team_id=team_id))
+        bind.execute(tasks.update().where(tasks.c.team_id.is_(None)).values(team_id=team_id))
+
+
+def downgrade():
+    op.drop_index('ix_tasks_team_id', table_name='tasks')
+
+    with op.batch_alter_table('tasks', schema=None) as batch_op:
+        batch_op.drop_column('team_id')
@@ -0,0 +1,45 @@
+"""Add notification count and archive table
+
+Revision ID: a9d4e6f20b17
+Revises: 5f2b8c7d1e43
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9d4e6f20b17'
+down_revision = '5f2b8c7d1e43'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('count', sa.Integer(), server_default='1', nullable=False))
+
+    op.create_table('notifications_archive',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('type', sa.String(length=50), nullable=False),
+    sa.Column('content', sa.Text(), nullable=True),
+    sa.Column('related_id', sa.Integer(), nullable=True),
+    sa.Column('is_read', sa.Boolean(), nullable=True),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('notifications_archive', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_notifications_archive_user_id'), ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('notifications_archive', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_notifications_archive_user_id'))
+
+    op.drop_table('notifications_archive')
+    with op.batch_alter_table('notifications', schema=None) as batch_op:
+        batch_op.drop_column('count')
@@ -0,0 +1,32 @@
+"""Add id_sequences for pre-assigned chat message ids
+
+Revision ID: b3e8f1c4d592
+Revises: a9d4e6f20b17
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e8f1c4d592'
+down_revision = 'a9d4e6f20b17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('id_sequences',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('next_value', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+    # Start after the messages that already exist
+    op.execute("INSERT INTO id_sequences (name, next_value) "
+               "SELECT 'team_messages', COALESCE(MAX(id), 0) + 1 FROM team_messages")
+
+
+def downgrade():
+    op.drop_table('id_sequences')
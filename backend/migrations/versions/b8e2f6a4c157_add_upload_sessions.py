@@ -0,0 +1,54 @@
+"""Add chunked upload sessions and file checksums
+
+Revision ID: b8e2f6a4c157
+Revises: a1c7e5f93d28
+Create Date: 2026-10-17 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8e2f6a4c157'
+down_revision = 'a1c7e5f93d28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('upload_sessions',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('uploader_id', sa.Integer(), nullable=False),
+    sa.Column('team_id', sa.Integer(), nullable=False),
+    sa.Column('task_id', sa.Integer(), nullable=True),
+    sa.Column('resource_id', sa.Integer(), nullable=True),
+    sa.Column('message_id', sa.Integer(), nullable=True),
+    sa.Column('timeline_event_id', sa.Integer(), nullable=True),
+    sa.Column('filename', sa.String(length=255), nullable=False),
+    sa.Column('mimetype', sa.String(length=100), nullable=True),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('received', sa.BigInteger(), server_default='0', nullable=False),
+    sa.Column('checksum', sa.String(length=64), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['message_id'], ['team_messages.id'], ),
+    sa.ForeignKeyConstraint(['resource_id'], ['team_resources.id'], ),
+    sa.ForeignKeyConstraint(['task_id'], ['tasks.id'], ),
+    sa.ForeignKeyConstraint(['team_id'], ['teams.id'], ),
+    sa.ForeignKeyConstraint(['timeline_event_id'], ['timeline_events.id'], ),
+    sa.ForeignKeyConstraint(['uploader_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_upload_sessions_updated_at', 'upload_sessions', ['updated_at'], unique=False)
+
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('checksum', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.drop_column('checksum')
+
+    op.drop_index('ix_upload_sessions_updated_at', table_name='upload_sessions')
+    op.drop_table('upload_sessions')
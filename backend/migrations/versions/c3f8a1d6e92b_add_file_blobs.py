@@ -0,0 +1,121 @@
+"""Add content-addressed file blobs
+
+Revision ID: c3f8a1d6e92b
+Revises: b8e2f6a4c157
+Create Date: 2026-10-17 22:00:00.000000
+
+"""
+import hashlib
+import os
+import shutil
+import uuid
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f8a1d6e92b'
+down_revision = 'b8e2f6a4c157'
+branch_labels = None
+depends_on = None
+
+
+files = sa.table('files', sa.column('id', sa.Integer), sa.column('filename', sa.String),
+                 sa.column('filepath', sa.String), sa.column('checksum', sa.String),
+                 sa.column('blob_id', sa.Integer))
+blobs = sa.table('file_blobs', sa.column('id', sa.Integer), sa.column('sha256', sa.String),
+                 sa.column('size', sa.BigInteger), sa.column('path', sa.String),
+                 sa.column('ref_count', sa.Integer), sa.column('created_at', sa.DateTime))
+
+
+def _hash(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(64 * 1024), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def _link(src, dst):
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def upgrade():
+    op.create_table('file_blobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('path', sa.String(length=500), nullable=False),
+    sa.Column('ref_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('sha256')
+    )
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('blob_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_files_blob_id', 'file_blobs', ['blob_id'], ['id'])
+        batch_op.create_index('ix_files_blob_id', ['blob_id'], unique=False)
+
+    # Move what is already on disk into the blob store. Files are linked
+    # (or copied) into place and the originals removed only once every row
+    # points at its blob, so a failed run leaves the old layout intact.
+    # Rows whose file is missing keep their old filepath and no blob.
+    folder = current_app.config['UPLOAD_FOLDER']
+    bind = op.get_bind()
+    stored = {} # sha256 -> blob id
+    replaced = []
+    for file_id, filepath in bind.execute(sa.select(files.c.id, files.c.filepath).order_by(files.c.id)).fetchall():
+        src = os.path.join(folder, filepath)
+        if not os.path.isfile(src):
+            continue
+        sha256 = _hash(src)
+        path = f'blobs/{sha256[:2]}/{sha256}'
+        if sha256 in stored:
+            bind.execute(blobs.update().where(blobs.c.id == stored[sha256])
+                         .values(ref_count=blobs.c.ref_count + 1))
+        else:
+            if not os.path.exists(os.path.join(folder, path)):
+                _link(src, os.path.join(folder, path))
+            bind.execute(blobs.insert().values(sha256=sha256, size=os.path.getsize(src), path=path,
+                                               ref_count=1, created_at=sa.func.now()))
+            stored[sha256] = bind.execute(sa.select(blobs.c.id).where(blobs.c.sha256 == sha256)).scalar()
+        bind.execute(files.update().where(files.c.id == file_id)
+                     .values(blob_id=stored[sha256], filepath=path, checksum=sha256))
+        replaced.append(src)
+
+    def cleanup():
+        for src in replaced:
+            try:
+                os.remove(src)
+            except OSError:
+                pass
+    # Only after the transaction holding the new rows has committed
+    sa.event.listen(bind, 'commit', lambda conn: cleanup(), once=True)
+
+
+def downgrade():
+    # Give every row its own copy under a fresh name again
+    folder = current_app.config['UPLOAD_FOLDER']
+    bind = op.get_bind()
+    rows = bind.execute(sa.select(files.c.id, files.c.filename, files.c.filepath)
+                        .where(files.c.blob_id.isnot(None))).fetchall()
+    for file_id, filename, filepath in rows:
+        src = os.path.join(folder, filepath)
+        if not os.path.isfile(src):
+            continue
+        name = f'{uuid.uuid4().hex}{os.path.splitext(filename)[1]}'
+        shutil.copyfile(src, os.path.join(folder, name))
+        bind.execute(files.update().where(files.c.id == file_id).values(filepath=name))
+
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.drop_index('ix_files_blob_id')
+        batch_op.drop_constraint('fk_files_blob_id', type_='foreignkey')
+        batch_op.drop_column('blob_id')
+    op.drop_table('file_blobs')
+    sa.event.listen(bind, 'commit', lambda conn: shutil.rmtree(os.path.join(folder, 'blobs'), ignore_errors=True),
+                    once=True)
@@ -0,0 +1,45 @@
+"""Add progress roll-up totals to tasks and projects
+
+Revision ID: c41f7b2d8e65
+Revises: 8d2c5a1e9f30
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41f7b2d8e65'
+down_revision = '8d2c5a1e9f30'
+branch_labels = None
+depends_on = None
+
+
+COLUMNS = ['completed_count', 'leaf_count', 'leaf_progress']
+
+
+def upgrade():
+    with op.batch_alter_table('tasks', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('descendant_count', sa.Integer(), server_default='0', nullable=False))
+        for name in COLUMNS:
+            batch_op.add_column(sa.Column(name, sa.Integer(), server_default='0', nullable=False))
+
+    with op.batch_alter_table('projects', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('task_count', sa.Integer(), server_default='0', nullable=False))
+        for name in COLUMNS:
+            batch_op.add_column(sa.Column(name, sa.Integer(), server_default='0', nullable=False))
+
+    # Totals start at zero; fill them with `flask repair-rollups`.
+
+
+def downgrade():
+    with op.batch_alter_table('projects', schema=None) as batch_op:
+        for name in reversed(COLUMNS):
+            batch_op.drop_column(name)
+        batch_op.drop_column('task_count')
+
+    with op.batch_alter_table('tasks', schema=None) as batch_op:
+        for name in reversed(COLUMNS):
+            batch_op.drop_column(name)
+        batch_op.drop_column('descendant_count')
@@ -0,0 +1,29 @@
+"""Add keyset index for team chat history
+
+Revision ID: c6f1a8d3b245
+Revises: b3e8f1c4d592
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6f1a8d3b245'
+down_revision = 'b3e8f1c4d592'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_team_messages_team_created', 'team_messages', ['team_id', 'created_at', 'id'], unique=False)
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_files_message_id'), ['message_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('files', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_files_message_id'))
+
+    op.drop_index('ix_team_messages_team_created', table_name='team_messages')
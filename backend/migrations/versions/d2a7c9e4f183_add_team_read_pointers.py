@@ -0,0 +1,41 @@
+"""Add chat read pointers to team members
+
+Revision ID: d2a7c9e4f183
+Revises: c6f1a8d3b245
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a7c9e4f183'
+down_revision = 'c6f1a8d3b245'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('team_members', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_read_message_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('last_read_at', sa.DateTime(), nullable=True))
+
+    # Existing members start with everything read
+    members = sa.table('team_members', sa.column('team_id', sa.Integer),
+                       sa.column('last_read_message_id', sa.Integer), sa.column('last_read_at', sa.DateTime))
+    messages = sa.table('team_messages', sa.column('id', sa.Integer), sa.column('team_id', sa.Integer),
+                        sa.column('created_at', sa.DateTime))
+    latest = sa.select(messages.c.id, messages.c.created_at)\
+        .where(messages.c.team_id == members.c.team_id)\
+        .order_by(messages.c.created_at.desc(), messages.c.id.desc()).limit(1)
+    op.execute(members.update().values(
+        last_read_message_id=latest.with_only_columns(messages.c.id).scalar_subquery(),
+        last_read_at=latest.with_only_columns(messages.c.created_at).scalar_subquery()
+    ))
+
+
+def downgrade():
+    with op.batch_alter_table('team_members', schema=None) as batch_op:
+        batch_op.drop_column('last_read_at')
+        batch_op.drop_column('last_read_message_id')
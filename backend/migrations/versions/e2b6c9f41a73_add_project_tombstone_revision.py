@@ -0,0 +1,26 @@
+"""Add project tombstone revision
+
+Revision ID: e2b6c9f41a73
+Revises: c3f8a1d6e92b
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2b6c9f41a73'
+down_revision = 'c3f8a1d6e92b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('projects', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('tombstone_revision', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    with op.batch_alter_table('projects', schema=None) as batch_op:
+        batch_op.drop_column('tombstone_revision')
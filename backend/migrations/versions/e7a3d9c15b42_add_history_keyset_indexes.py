@@ -0,0 +1,29 @@
+"""Add keyset pagination indexes for task history
+
+Revision ID: e7a3d9c15b42
+Revises: c41f7b2d8e65
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a3d9c15b42'
+down_revision = 'c41f7b2d8e65'
+branch_labels = None
+depends_on = None
+
+
+TABLES = ['task_comments', 'task_messages', 'task_activities']
+
+
+def upgrade():
+    for table in TABLES:
+        op.create_index(f'ix_{table}_task_created', table, ['task_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    for table in TABLES:
+        op.drop_index(f'ix_{table}_task_created', table_name=table)
@@ -0,0 +1,60 @@
+"""Add indexes for hot filter columns and unique memberships
+
+Revision ID: f4b9d2e7a618
+Revises: d2a7c9e4f183
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4b9d2e7a618'
+down_revision = 'd2a7c9e4f183'
+branch_labels = None
+depends_on = None
+
+
+# (name, table, columns)
+INDEXES = [
+    ('ix_team_members_user_id', 'team_members', ['user_id']),
+    ('ix_projects_team_id', 'projects', ['team_id']),
+    ('ix_tasks_parent_id', 'tasks', ['parent_id']),
+    ('ix_tasks_project_parent_sort', 'tasks', ['project_id', 'parent_id', 'sort_order']),
+    ('ix_task_links_source', 'task_links', ['source']),
+    ('ix_task_links_target', 'task_links', ['target']),
+    ('ix_task_participants_user_id', 'task_participants', ['user_id']),
+    ('ix_notifications_user_created', 'notifications', ['user_id', 'created_at', 'id']),
+    ('ix_files_task_id', 'files', ['task_id']),
+    ('ix_files_resource_id', 'files', ['resource_id']),
+    ('ix_files_timeline_event_id', 'files', ['timeline_event_id']),
+    ('ix_team_resources_team_created', 'team_resources', ['team_id', 'created_at']),
+    ('ix_timeline_events_team_date', 'timeline_events', ['team_id', 'event_date']),
+    ('ix_learning_progress_team_created', 'learning_progress', ['team_id', 'created_at']),
+]
+
+UNIQUE = [
+    ('uq_team_members_team_user', 'team_members', ['team_id', 'user_id']),
+    ('uq_task_participants_task_user', 'task_participants', ['task_id', 'user_id']),
+]
+
+
+def upgrade():
+    # Joins raced by double clicks may have left duplicate rows; keep the
+    # oldest of each pair so the unique indexes can be built. The derived
+    # table lets MySQL delete from the table it selects from.
+    for _, table, columns in UNIQUE:
+        op.execute(
+            f'DELETE FROM {table} WHERE id NOT IN '
+            f'(SELECT keep FROM (SELECT MIN(id) AS keep FROM {table} GROUP BY {", ".join(columns)}) AS k)'
+        )
+    for name, table, columns in UNIQUE:
+        op.create_index(name, table, columns, unique=True)
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES + UNIQUE):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,136 @@
+"""Bulk task operation benchmark.
+
+Seeds a project in a throwaway SQLite database, then runs apply_bulk on
+mixed batches of creates (nested one level through parent_ref), updates,
+reorders and deletes, and commits each one. It counts the SQL statements
+each batch runs with a before_cursor_execute listener; an executemany is
+one statement. A batch must need the same number of statements whatever
+its size, with one insert per level of new tasks, one activity insert,
+one notification insert and one unread counter update. The 1,000
+operation batch must also finish within TIME_LIMIT.
+
+    python test_bulk_bench.py [sizes...]
+"""
+import os
+import re
+import sys
+import tempfile
+import time
+from collections import Counter
+from sqlalchemy import event
+from config import Config
+from app import create_app, db
+from app.models import Project, TaskParticipant, User
+from app.bulk import apply_bulk
+
+class BenchConfig(Config):
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bulk.db')
+    THUMB_WORKERS = 0
+
+TIME_LIMIT = 2.0 # seconds for 1,000 operations, commit included
+TABLE = re.compile(r'^\s*(INSERT INTO|UPDATE|DELETE FROM|SELECT .*? FROM)\s+(\w+)', re.S)
+EXPECTED = {
+    ('INSERT', 'tasks'): 2,          # one per level of new tasks
+    ('INSERT', 'task_activities'): 1,
+    ('INSERT', 'notifications'): 1,
+    ('UPDATE', 'users'): 1,          # unread counters
+}
+
+class StatementCounter:
+    def __init__(self):
+        self.kinds = Counter()
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        match = TABLE.match(statement)
+        if match:
+            self.kinds[(match.group(1).split()[0], match.group(2))] += 1
+        else:
+            self.kinds[(statement.split()[0].upper(), '')] += 1
+
+def login(client, name):
+    client.post('/api/auth/register', json={'username': name, 'email': f'{name}@example.com', 'password': 'password'})
+    token = client.post('/api/auth/login', json={'username': name, 'password': 'password'}).get_json()['access_token']
+    return {'Authorization': f'Bearer {token}'}
+
+def seed(client, headers, team_id, size, watcher_id):
+    """A project with `size` root tasks that `watcher_id` participates in."""
+    project_id = client.post('/api/projects', headers=headers,
+                             json={'team_id': team_id, 'name': f'{size} operations'}).get_json()['id']
+    operations = [{'op': 'create', 'ref': i, 'title': f'existing {i}'} for i in range(size)]
+    created = client.post('/api/tasks/bulk', headers=headers,
+                          json={'project_id': project_id, 'operations': operations}).get_json()['created']
+    ids = [created[str(i)] for i in range(size)]
+    db.session.execute(TaskParticipant.__table__.insert(), [{'task_id': i, 'user_id': watcher_id} for i in ids])
+    db.session.commit()
+    return project_id, ids
+
+def batch(size, ids):
+    """40% creates (half of them children), 30% updates, 10% reorders, 20% deletes."""
+    creates, updates, reorders = size * 4 // 10, size * 3 // 10, size // 10
+    deletes = size - creates - updates - reorders
+    roots = creates // 2
+    operations = [{'op': 'create', 'ref': f'r{i}', 'title': f'new {i}', 'start_date': '2025-03-01'} for i in range(roots)]
+    operations += [{'op': 'create', 'parent_ref': f'r{i % roots}', 'title': f'new child {i}', 'progress': 50}
+                   for i in range(creates - roots)]
+    operations += [{'op': 'update', 'id': i, 'status': 'in_progress', 'progress': 30}
+                   for i in ids[:updates]]
+    operations += [{'op': 'reorder', 'id': i, 'parent_id': None, 'sort_order': n}
+                   for n, i in enumerate(ids[updates:updates + reorders])]
+    operations += [{'op': 'delete', 'id': i} for i in ids[updates + reorders:updates + reorders + deletes]]
+    return operations
+
+def run(sizes=(100, 1000)):
+    app = create_app(BenchConfig)
+    counter = StatementCounter()
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+    headers = login(client, 'bench')
+    login(client, 'watcher')
+    team_id = client.post('/api/teams', headers=headers, json={'name': 'bench'}).get_json()['id']
+
+    results = {}
+    with app.app_context():
+        user_id = db.session.query(User.id).filter_by(username='bench').scalar()
+        watcher_id = db.session.query(User.id).filter_by(username='watcher').scalar()
+        for size in sizes:
+            project_id, ids = seed(client, headers, team_id, size, watcher_id)
+            operations = batch(size, ids)
+            project = db.session.get(Project, project_id)
+
+            counter.kinds.clear()
+            event.listen(db.engine, 'before_cursor_execute', counter)
+            start = time.perf_counter()
+            result = apply_bulk(project, user_id, operations)
+            db.session.commit()
+            elapsed = time.perf_counter() - start
+            event.remove(db.engine, 'before_cursor_execute', counter)
+            db.session.expire_all()
+
+            assert result['deleted'] == sum(op['op'] == 'delete' for op in operations), result
+            results[size] = (elapsed, dict(counter.kinds))
+
+    failed = 0
+    for size, (elapsed, kinds) in results.items():
+        total = sum(kinds.values())
+        print(f'{size} operations: {elapsed * 1000:.0f} ms ({size / elapsed:.0f} ops/s), {total} statements')
+        for key, expected in EXPECTED.items():
+            ok = kinds.get(key, 0) == expected
+            failed += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {' '.join(key):24s} {kinds.get(key, 0)} (expected {expected})")
+
+    totals = {size: sum(kinds.values()) for size, (_, kinds) in results.items()}
+    ok = len(set(totals.values())) == 1
+    failed += not ok
+    print(f"{'ok  ' if ok else 'FAIL'} statements per batch: {', '.join(str(totals[size]) for size in sizes)}")
+    if 1000 in results:
+        ok = results[1000][0] <= TIME_LIMIT
+        failed += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} 1000 operations within {TIME_LIMIT * 1000:.0f} ms")
+
+    print(f'{failed} checks failed' if failed else 'bulk operations are batched as expected')
+    return failed == 0
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or (100, 1000)
+    sys.exit(0 if run(sizes) else 1)
@@ -0,0 +1,140 @@
+"""Query count check for the task list endpoints and membership checks.
+
+Builds projects of growing size in a throwaway SQLite database, calls the
+task list, gantt and task detail routes through the test client and counts
+the SQL statements each request runs with a before_cursor_execute
+listener. The counts must not grow with the number of tasks.
+
+It then calls team routes guarded by app.authz and counts the queries
+that read team_members: at most one per request with a cold cache, none
+once the membership is cached, and a member who leaves is refused on
+their next request.
+
+    python test_query_counts.py [sizes...]
+"""
+import os
+import re
+import sys
+import tempfile
+from sqlalchemy import event
+from config import Config
+from app import create_app, db, authz
+
+class CountConfig(Config):
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'counts.db')
+    THUMB_WORKERS = 0
+
+MEMBERSHIP = re.compile(r'team_members\.user_id = (\?|%)')
+
+class QueryCounter:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.memberships = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        # A membership check filters team_members by the requesting user
+        self.memberships += MEMBERSHIP.search(statement) is not None
+
+def login(client, name):
+    client.post('/api/auth/register', json={'username': name, 'email': f'{name}@example.com', 'password': 'password'})
+    token = client.post('/api/auth/login', json={'username': name, 'password': 'password'}).get_json()['access_token']
+    return {'Authorization': f'Bearer {token}'}
+
+def build_project(client, headers, team_id, size):
+    project_id = client.post('/api/projects', headers=headers,
+                             json={'team_id': team_id, 'name': f'{size} tasks'}).get_json()['id']
+    # A third of the tasks at the root, each of the rest under one of them
+    roots = max(size // 3, 1)
+    operations = [{'op': 'create', 'ref': f'r{i}', 'title': f'root {i}'} for i in range(roots)]
+    operations += [{'op': 'create', 'parent_ref': f'r{i % roots}', 'title': f'child {i}'} for i in range(size - roots)]
+    created = client.post('/api/tasks/bulk', headers=headers,
+                          json={'project_id': project_id, 'operations': operations}).get_json()
+    return project_id, created['created']['r0']
+
+def requests_for(project_id, task_id):
+    return [
+        ('task tree', f'/api/tasks?project_id={project_id}&fetch_all=true'),
+        ('root level', f'/api/tasks?project_id={project_id}'),
+        ('subtasks', f'/api/tasks?project_id={project_id}&parent_id={task_id}'),
+        ('gantt data', f'/api/tasks/gantt-data?project_id={project_id}'),
+        ('task detail', f'/api/tasks/{task_id}'),
+    ]
+
+def team_requests(team_id):
+    return [
+        ('team detail', f'/api/teams/{team_id}'),
+        ('team members', f'/api/teams/{team_id}/members'),
+        ('resources', f'/api/resources?team_id={team_id}'),
+        ('timeline', f'/api/timeline/team/{team_id}'),
+        ('learning', f'/api/learning/team/{team_id}'),
+    ]
+
+def check_memberships(client, counter, team_id, invite_code):
+    """Returns the number of failed checks."""
+    failed = 0
+    headers = login(client, 'member')
+    client.post('/api/teams/join', headers=headers, json={'invite_code': invite_code})
+    requests = team_requests(team_id)
+    for label, cold in (('cold cache', True), ('warm cache', False)):
+        for name, url in requests:
+            if cold:
+                authz.cache.forget(team_id)
+            counter.reset()
+            resp = client.get(url, headers=headers)
+            limit = 1 if cold or authz.cache.ttl <= 0 else 0
+            ok = resp.status_code == 200 and counter.memberships <= limit
+            failed += not ok
+            print(f"{'ok  ' if ok else 'FAIL'} {name:12s} {label}: {counter.memberships} membership "
+                  f"of {counter.count} queries (at most {limit})")
+
+    client.post(f'/api/teams/{team_id}/leave', headers=headers)
+    status = client.get(requests[0][1], headers=headers).status_code
+    ok = status == 403
+    failed += not ok
+    print(f"{'ok  ' if ok else 'FAIL'} {'left team':12s} next request answered {status}")
+    return failed
+
+def run(sizes=(5, 50, 500)):
+    app = create_app(CountConfig)
+    counter = QueryCounter()
+    counts = {}
+    # Requests must not run inside an outer app context, or flask.g (and
+    # the per-request membership memo in it) would outlive each request
+    with app.app_context():
+        db.create_all()
+        engine = db.engine
+    client = app.test_client()
+    headers = login(client, 'counter')
+    team = client.post('/api/teams', headers=headers, json={'name': 'counts'}).get_json()
+    team_id = team['id']
+    projects = {size: build_project(client, headers, team_id, size) for size in sizes}
+
+    event.listen(engine, 'before_cursor_execute', counter)
+    for size, (project_id, task_id) in projects.items():
+        for name, url in requests_for(project_id, task_id):
+            counter.reset()
+            resp = client.get(url, headers=headers)
+            assert resp.status_code == 200, (url, resp.status_code)
+            counts.setdefault(name, {})[size] = counter.count
+
+    failed = 0
+    print('tasks per project:', ', '.join(str(size) for size in sizes))
+    for name, by_size in counts.items():
+        ok = len(set(by_size.values())) == 1
+        failed += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {name:12s} queries: {', '.join(str(by_size[size]) for size in sizes)}")
+
+    print('membership checks:')
+    failed += check_memberships(client, counter, team_id, team['invite_code'])
+    event.remove(engine, 'before_cursor_execute', counter)
+
+    print(f'{failed} checks failed' if failed else 'query counts are as expected')
+    return failed == 0
+
+if __name__ == '__main__':
+    sizes = [int(arg) for arg in sys.argv[1:]] or (5, 50, 500)
+    sys.exit(0 if run(sizes) else 1)
@@ -0,0 +1,129 @@
+"""Scheduling benchmark on a synthetic dependency graph.
+
+Builds a project of random tasks and finish-to-start (and other) links
+forming a DAG in a throwaway SQLite database, then times the critical-path
+pass (compute_schedule), the cold load of the cached link graph and
+link inserts through get_link_graph().add_edge, some of which have to
+reorder the graph and some of which close a cycle. Each timing must stay
+under its limit, which is set for the default 10k tasks / 30k links.
+
+    python test_schedule_bench.py [tasks] [links]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from config import Config
+from app import create_app, db
+from app.models import Task, TaskLink, Project
+from app.scheduling import load_project_graph, compute_schedule
+from app.link_graph import get_link_graph, invalidate
+
+class BenchConfig(Config):
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    THUMB_WORKERS = 0
+
+SPAN = 100          # links join tasks at most this far apart in the plan
+INSERTS = 1000      # links added through the cached graph
+LIMITS = {          # seconds
+    'compute_schedule': 2.0,
+    'link graph load': 2.0,
+    'add_edge (mean)': 0.005,
+}
+
+def login(client, name):
+    client.post('/api/auth/register', json={'username': name, 'email': f'{name}@example.com', 'password': 'password'})
+    token = client.post('/api/auth/login', json={'username': name, 'password': 'password'}).get_json()['access_token']
+    return {'Authorization': f'Bearer {token}'}
+
+def build_project(project, tasks, links, rng):
+    """Insert `tasks` tasks and `links` links between them; returns task ids in plan order."""
+    first = date(2025, 1, 1)
+    rows = []
+    for i in range(tasks):
+        row = {'project_id': project.id, 'team_id': project.team_id, 'title': f'task {i}', 'revision': 0}
+        # A tenth of the tasks are undated and only placed through their links
+        if rng.random() >= 0.1:
+            row['start_date'] = first + timedelta(days=rng.randrange(365))
+            row['end_date'] = row['start_date'] + timedelta(days=rng.randrange(10))
+        else:
+            row['start_date'] = row['end_date'] = None
+        rows.append(row)
+    db.session.execute(Task.__table__.insert(), rows)
+    ids = [row[0] for row in db.session.query(Task.id).filter(Task.project_id == project.id).all()]
+    rng.shuffle(ids)
+
+    # Every link points forward in the shuffled plan order, so the graph is acyclic
+    edges = set()
+    while len(edges) < links:
+        i = rng.randrange(len(ids) - 1)
+        j = min(i + 1 + rng.randrange(SPAN), len(ids) - 1)
+        edges.add((ids[i], ids[j]))
+    db.session.execute(TaskLink.__table__.insert(), [
+        {'source': source, 'target': target, 'type': rng.choice('0000123'), 'revision': 0}
+        for source, target in edges
+    ])
+    db.session.commit()
+    return ids
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def run(tasks=10000, links=30000):
+    app = create_app(BenchConfig)
+    rng = random.Random(4)
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+    headers = login(client, 'bench')
+    team_id = client.post('/api/teams', headers=headers, json={'name': 'bench'}).get_json()['id']
+    project_id = client.post('/api/projects', headers=headers,
+                             json={'team_id': team_id, 'name': 'bench'}).get_json()['id']
+
+    timings = {}
+    with app.app_context():
+        project = db.session.get(Project, project_id)
+        ids = build_project(project, tasks, links, rng)
+
+        task_rows, link_rows = load_project_graph(project_id)
+        (schedule, order), timings['compute_schedule'] = timed(compute_schedule, task_rows, link_rows)
+        assert len(order) == tasks
+        critical = sum(1 for entry in schedule.values() if entry['slack'] == 0)
+
+        invalidate(project_id)
+        graph, timings['link graph load'] = timed(get_link_graph, project_id, project.revision)
+
+        # Half the new links go backwards in the plan: those either force a
+        # reorder or are refused because they close a cycle
+        added = refused = 0
+        elapsed = 0
+        for _ in range(INSERTS):
+            i = rng.randrange(len(ids) - SPAN)
+            source, target = ids[i], ids[i + 1 + rng.randrange(SPAN - 1)]
+            if rng.random() < 0.5:
+                source, target = target, source
+            if graph.has_edge(source, target):
+                continue
+            ok, seconds = timed(graph.add_edge, source, target)
+            elapsed += seconds
+            added += ok
+            refused += not ok
+        timings['add_edge (mean)'] = elapsed / max(added + refused, 1)
+
+    print(f'{tasks} tasks, {links} links: {critical} critical tasks, {added} links added, {refused} refused as cycles')
+    failed = 0
+    for name, seconds in timings.items():
+        ok = seconds <= LIMITS[name]
+        failed += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {name:18s} {seconds * 1000:9.2f} ms (limit {LIMITS[name] * 1000:.0f} ms)")
+
+    print(f'{failed} timings over their limit' if failed else 'scheduling is within its limits')
+    return failed == 0
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:3]]
+    sys.exit(0 if run(*args) else 1)
@@ -0,0 +1,139 @@
+"""Multi-worker Socket.IO check.
+
+Boots the pub/sub stand-in and N Socket.IO workers sharing one SQLite
+database, connects chat clients round-robin across the workers and checks
+that every team message reaches every client, and that leaving a team
+over HTTP on one worker stops delivery to the member's socket on another.
+
+    python test_socket_cluster.py [workers] [messages]
+
+Needs `requests` and `websocket-client`.
+"""
+import os
+import sys
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import requests
+import socketio
+
+WORKER = '''
+import eventlet
+eventlet.monkey_patch()
+import sys
+from app import create_app, socketio
+app = create_app()
+socketio.run(app, host='127.0.0.1', port=int(sys.argv[1]), log_output=False)
+'''
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def wait_for(url, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    raise RuntimeError(f'{url} did not come up')
+
+def register(base, name):
+    requests.post(f'{base}/api/auth/register', json={'username': name, 'email': f'{name}@example.com', 'password': 'password'})
+    resp = requests.post(f'{base}/api/auth/login', json={'username': name, 'password': 'password'})
+    return resp.json()['access_token']
+
+def run(workers=3, messages=300):
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    from app.pubsub_server import PubSubServer
+
+    queue_port = free_port()
+    queue = PubSubServer(('127.0.0.1', queue_port))
+    threading.Thread(target=queue.serve_forever, daemon=True).start()
+
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, 'cluster.db')
+    env = dict(os.environ,
+               DATABASE_URL=f'sqlite:///{db_path}',
+               SOCKETIO_MESSAGE_QUEUE=f'redis://127.0.0.1:{queue_port}/0')
+    subprocess.run([sys.executable, '-c', 'from app import create_app, db\n'
+                    'app = create_app()\napp.app_context().push()\ndb.create_all()'],
+                   cwd=here, env=env, check=True)
+
+    ports = [free_port() for _ in range(workers)]
+    logs = [open(os.path.join(workdir, f'worker-{i}.log'), 'w') for i in range(workers)]
+    procs = [subprocess.Popen([sys.executable, '-c', WORKER, str(port)], cwd=here, env=env,
+                              stdout=log, stderr=subprocess.STDOUT) for port, log in zip(ports, logs)]
+    print('worker logs in', workdir)
+    clients = []
+    try:
+        bases = [f'http://127.0.0.1:{port}' for port in ports]
+        for base in bases:
+            wait_for(base + '/api/teams')
+
+        owner = register(bases[0], 'owner')
+        auth = {'Authorization': f'Bearer {owner}'}
+        team_id = requests.post(f'{bases[0]}/api/teams', json={'name': 'cluster'}, headers=auth).json()['id']
+        code = requests.post(f'{bases[0]}/api/teams/{team_id}/invite', headers=auth).json()['invite_code']
+
+        tokens = [owner]
+        for i in range(1, workers * 2):
+            token = register(bases[0], f'member{i}')
+            requests.post(f'{bases[0]}/api/teams/join', json={'invite_code': code},
+                          headers={'Authorization': f'Bearer {token}'})
+            tokens.append(token)
+
+        received = [[] for _ in tokens]
+        for i, token in enumerate(tokens):
+            client = socketio.Client()
+            client.on('team:message', lambda data, i=i: received[i].append(data['content']))
+            client.connect(bases[i % workers], auth={'token': token}, transports=['websocket'])
+            client.emit('team:join', {'team_id': team_id})
+            clients.append(client)
+        time.sleep(0.5)
+
+        # Every client sends in turn, so messages enter through every worker
+        start = time.perf_counter()
+        for n in range(messages):
+            clients[n % len(clients)].emit('team:message', {'team_id': team_id, 'content': f'm{n}'})
+        expected = [f'm{n}' for n in range(messages)]
+        deadline = time.time() + 30
+        while time.time() < deadline and any(len(r) < messages for r in received):
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - start
+
+        delivered = sum(len(r) for r in received)
+        complete = all(sorted(r) == sorted(expected) for r in received)
+        print(f'{workers} workers, {len(clients)} clients, {messages} messages: '
+              f'{delivered} deliveries in {elapsed:.2f}s '
+              f'({messages / elapsed:.0f} msg/s, {delivered / elapsed:.0f} deliveries/s)')
+        print('every client received every message:', complete, [len(r) for r in received])
+
+        # member1 is connected to worker 1; make them leave through worker 0
+        leaver = 1
+        requests.post(f'{bases[0]}/api/teams/{team_id}/leave',
+                      headers={'Authorization': f'Bearer {tokens[leaver]}'})
+        time.sleep(0.3)
+        before = [len(r) for r in received]
+        clients[0].emit('team:message', {'team_id': team_id, 'content': 'after leave'})
+        time.sleep(0.5)
+        got = [len(r) - b for r, b in zip(received, before)]
+        revoked = got[leaver] == 0 and all(g == 1 for i, g in enumerate(got) if i != leaver)
+        print('leaving on another worker stops delivery:', revoked)
+        return complete and revoked
+    finally:
+        for client in clients:
+            client.disconnect()
+        for proc in procs:
+            proc.terminate()
+        queue.shutdown()
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:3]]
+    sys.exit(0 if run(*args) else 1)